@@ -0,0 +1,182 @@
+"""
+أرشفة سجلات الاستقطاعات والمدفوعات القديمة في ملفات سنوية
+
+الأشهر المغلقة تُنقل من القاعدة الرئيسية إلى <القاعدة>.archive-<السنة>.db، فيبقى في القاعدة
+الرئيسية ما يُستخدم فعلاً (آخر ARCHIVE_KEEP_MONTHS شهراً افتراضياً) ويبقى ملف WAL صغيراً.
+ملف السنة المنتهية لا يتغير بعد أرشفة آخر أشهرها، فيكفي نسخه احتياطياً مرة واحدة.
+
+السجل المؤرشف يُقرأ بربط ملف السنة (ATTACH) باتصال القراءة عند طلبه فقط، بالاستعلامات
+نفسها مع بادئة اسم الملف المربوط. جداول ملخصات التقارير تبقى في القاعدة الرئيسية كما هي،
+وإعادة بنائها (PayrollReports.rebuild) تقرأ ملفات الأرشيف أيضاً.
+
+الاستخدام من سطر الأوامر:
+    python "deepseek_python_20250602_762869 (1).py" --user admin archive --before 2025-01
+"""
+import glob
+import os
+import re
+from datetime import date
+
+
+ARCHIVE_TABLES = {
+    'deductions': ('id', 'emp_id', 'amount', 'reason', 'created_by', 'created_at'),
+    'payments': ('id', 'emp_id', 'amount', 'created_by', 'created_at'),
+}
+
+# عدد السجلات المنقولة في كل معاملة، حتى لا يكبر ملف WAL ولا يطول حجز الكاتب
+ARCHIVE_CHUNK_SIZE = 5000
+
+ARCHIVE_KEEP_MONTHS = 12
+
+ARCHIVE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS {alias}.deductions (
+    id INTEGER PRIMARY KEY,
+    emp_id TEXT NOT NULL,
+    amount REAL NOT NULL,
+    reason TEXT NOT NULL,
+    created_by TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS {alias}.idx_deductions_emp_created ON deductions (emp_id, created_at);
+CREATE TABLE IF NOT EXISTS {alias}.payments (
+    id INTEGER PRIMARY KEY,
+    emp_id TEXT NOT NULL,
+    amount REAL NOT NULL,
+    created_by TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS {alias}.idx_payments_emp_created ON payments (emp_id, created_at);
+'''
+
+
+def archive_path(db_path, year):
+    return f"{os.path.splitext(db_path)[0]}.archive-{year}.db"
+
+
+def archive_years(db_path):
+    """سنوات ملفات الأرشيف الموجودة لقاعدة البيانات، تصاعدياً"""
+    pattern = re.compile(r'\.archive-(\d{4})\.db$')
+    years = []
+    for path in glob.glob(glob.escape(os.path.splitext(db_path)[0]) + '.archive-*.db'):
+        match = pattern.search(path)
+        if match:
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+
+def iter_archives(db, start=None, end=None, newest_first=True):
+    """
+    ربط ملفات الأرشيف واحداً تلو الآخر باتصال القراءة
+
+    :param start: أول تاريخ مطلوب (YYYY-MM-DD)؛ السنوات السابقة له لا تُفتح
+    :param end: آخر تاريخ مطلوب (غير شامل)
+    :return: مولد بادئات الجداول ("archive_2024.")، والملف مربوط حتى طلب التالي
+    """
+    years = [
+        year for year in archive_years(db.db_path)
+        if (not start or str(year) >= start[:4]) and (not end or str(year) <= end[:4])
+    ]
+    for year in (reversed(years) if newest_first else years):
+        with db.attached(archive_path(db.db_path, year), f"archive_{year}"):
+            yield f"archive_{year}."
+
+
+def month_start(months_ago, today=None):
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - months_ago
+    return f"{index // 12:04d}-{index % 12 + 1:02d}-01"
+
+
+class PayrollArchiver:
+    """
+    :param emp_manager: EmployeeManager (يوفر قاعدة البيانات والصلاحيات وسجل التدقيق)
+    :param chunk_size: عدد السجلات في كل معاملة نقل
+    """
+
+    def __init__(self, emp_manager, chunk_size=ARCHIVE_CHUNK_SIZE):
+        self.emp_manager = emp_manager
+        self.db = emp_manager.db
+        self.chunk_size = chunk_size
+
+    def archive(self, before=None, session=None):
+        """
+        نقل السجلات الأقدم من شهر معين إلى ملفات الأرشيف السنوية
+
+        :param before: أول شهر يبقى في القاعدة الرئيسية (YYYY-MM)؛ افتراضياً قبل
+                       ARCHIVE_KEEP_MONTHS شهراً. لا يُقبل الشهر الحالي أو ما بعده
+        :param session: جلسة المستخدم المنفذ (افتراضياً الجلسة الحالية)
+        :return: قاموس بعدد السجلات المنقولة لكل جدول، أو None عند الرفض
+        """
+        session = self.emp_manager._session(session)
+        if not self.emp_manager.auth.has_permission('can_manage_users', session):
+            print("ليس لديك صلاحية لأرشفة السجلات!")
+            return None
+
+        if before:
+            if not re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', before):
+                print(f"شهر غير صحيح: {before}")
+                return None
+            cutoff = f"{before}-01"
+        else:
+            cutoff = month_start(int(os.getenv('ARCHIVE_KEEP_MONTHS', ARCHIVE_KEEP_MONTHS)))
+        if cutoff > month_start(0):
+            print("لا يمكن أرشفة الشهر الحالي لأنه لم يُغلق بعد!")
+            return None
+
+        summary = {'before': cutoff}
+        for table in ARCHIVE_TABLES:
+            years = self.db.execute_query(
+                f"SELECT DISTINCT substr(created_at, 1, 4) FROM {table} WHERE created_at < ?",
+                (cutoff,), fetchall=True
+            )
+            summary[table] = sum(self._archive_year(table, year, cutoff) for year, in years)
+
+        # إعادة ملف WAL إلى حجمه بعد حذف الصفوف المنقولة
+        with self.db.pool.write_lock:
+            self.db.pool.writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        self.emp_manager.audit.record(session.username, 'history_archived', cutoff,
+                                      deductions=summary['deductions'], payments=summary['payments'])
+        return summary
+
+    def _archive_year(self, table, year, cutoff):
+        columns = ', '.join(ARCHIVE_TABLES[table])
+        start = f"{year}-01-01"
+        end = min(f"{int(year) + 1}-01-01", cutoff)
+        moved = 0
+
+        with self.db.attached(archive_path(self.db.db_path, year), f"archive_{year}", write=True) as alias:
+            with self.db.pool.write_lock:
+                self.db.pool.writer.executescript(ARCHIVE_SCHEMA.format(alias=alias))
+
+            last_id = 0
+            while True:
+                # النسخ ثم الحذف في معاملتين: في وضع WAL لا تُضمن ذرية المعاملة بين ملفين، فإن
+                # توقفت العملية بينهما بقيت السجلات في الملفين وتُكمل الإعادة ما بدأته (INSERT OR IGNORE)
+                with self.db.transaction():
+                    ids = self.db.execute_query(
+                        f"SELECT id FROM main.{table} WHERE id > ? AND created_at >= ? AND created_at < ? "
+                        "ORDER BY id LIMIT ?",
+                        (last_id, start, end, self.chunk_size), fetchall=True
+                    )
+                    if not ids:
+                        break
+                    first, last_id = ids[0][0], ids[-1][0]
+                    self.db.execute_query(
+                        f'''INSERT OR IGNORE INTO {alias}.{table} ({columns})
+                        SELECT {columns} FROM main.{table}
+                        WHERE id BETWEEN ? AND ? AND created_at >= ? AND created_at < ?''',
+                        (first, last_id, start, end)
+                    )
+
+                # لا يُحذف من القاعدة الرئيسية إلا ما وصل فعلاً إلى الأرشيف
+                with self.db.transaction():
+                    cursor = self.db.conn.execute(
+                        f'''DELETE FROM main.{table}
+                        WHERE id BETWEEN ? AND ? AND created_at >= ? AND created_at < ?
+                        AND id IN (SELECT id FROM {alias}.{table} WHERE id BETWEEN ? AND ?)''',
+                        (first, last_id, start, end, first, last_id)
+                    )
+                    moved += cursor.rowcount
+
+        return moved
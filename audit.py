@@ -0,0 +1,204 @@
+"""
+سجل تدقيق للإضافة فقط: من فعل ماذا ومتى
+
+تسجيل الحدث لا يلمس قاعدة البيانات: record يضيف صفاً إلى طابور في الذاكرة ويعود فوراً،
+وخيط في الخلفية يكتب الطابور على دفعات، كل دفعة في معاملة واحدة، في ملف SQLite مستقل
+(افتراضياً بجانب قاعدة البيانات الرئيسية باسم <القاعدة>.audit.db أو من AUDIT_DB_PATH).
+الملف المستقل لا يشارك القاعدة الرئيسية قفل الكتابة، والمحفزات فيه ترفض أي تعديل أو حذف.
+
+ما يبقى في الطابور يُكتب عند close أو عند خروج البرنامج.
+"""
+import atexit
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_INTERVAL = 1.0
+
+AuditEvent = namedtuple('AuditEvent', 'id at actor action target details')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS audit_events (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    actor TEXT,
+    action TEXT NOT NULL,
+    target TEXT,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_audit_actor ON audit_events (actor, created_at);
+CREATE INDEX IF NOT EXISTS idx_audit_action ON audit_events (action, created_at);
+CREATE TRIGGER IF NOT EXISTS audit_events_no_update BEFORE UPDATE ON audit_events
+BEGIN SELECT RAISE(ABORT, 'audit log is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS audit_events_no_delete BEFORE DELETE ON audit_events
+BEGIN SELECT RAISE(ABORT, 'audit log is append-only'); END;
+'''
+
+INSERT_QUERY = "INSERT INTO audit_events (created_at, actor, action, target, details) VALUES (?, ?, ?, ?, ?)"
+
+
+def audit_path_for(db_path):
+    """مسار سجل التدقيق الافتراضي لقاعدة بيانات"""
+    if os.getenv('AUDIT_DB_PATH'):
+        return os.getenv('AUDIT_DB_PATH')
+    if db_path == ':memory:':
+        return db_path
+    return f"{os.path.splitext(db_path)[0]}.audit.db"
+
+
+class AuditLog:
+    """
+    :param path: ملف SQLite الخاص بسجل التدقيق
+    :param batch_size: عدد الأحداث في كل معاملة كتابة؛ امتلاء دفعة يوقظ الكاتب مبكراً
+    :param flush_interval: أقصى مدة بالثواني يبقى فيها حدث في الذاكرة قبل كتابته
+    """
+
+    def __init__(self, path, batch_size=AUDIT_BATCH_SIZE, flush_interval=AUDIT_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # append و popleft في deque آمنتان بين الخيوط بدون قفل
+        self._pending = deque()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._conn = None
+
+    def record(self, actor, action, target=None, **details):
+        """
+        تسجيل حدث (بدون انتظار الكتابة)
+
+        :param actor: اسم المستخدم المنفذ (أو None للنظام)
+        :param action: نوع الحدث مثل login أو deduction
+        :param target: ما وقع عليه الحدث (مستخدم، موظف، صلاحية)
+        :param details: معلومات إضافية تُحفظ بصيغة JSON
+        """
+        self._pending.append((time.time(), actor, action, target, details or None))
+        if self._thread is None:
+            self.start()
+        elif len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def flush(self):
+        """كتابة كل الأحداث المنتظرة الآن في الخيط الحالي"""
+        self._write_pending()
+
+    def close(self):
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            self._wakeup.set()
+            thread.join()
+            atexit.unregister(self.close)
+        self._write_pending()
+        with self._write_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def events(self, actor=None, action=None, target=None, since=None, until=None, limit=100):
+        """
+        أحدث الأحداث المطابقة أولاً
+
+        :param since: من تاريخ (نص ISO، شامل)
+        :param until: حتى تاريخ (غير شامل)
+        :return: قائمة AuditEvent
+        """
+        import json
+        self._write_pending()
+        conditions = []
+        params = []
+        for condition, value in (
+            ("actor = ?", actor),
+            ("action = ?", action),
+            ("target = ?", target),
+            ("created_at >= ?", since),
+            ("created_at < ?", until),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._write_lock:
+            rows = self._connection().execute(
+                f"SELECT id, created_at, actor, action, target, details FROM audit_events {where} "
+                "ORDER BY id DESC LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+        return [AuditEvent(*row[:5], json.loads(row[5]) if row[5] else None) for row in rows]
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute("PRAGMA busy_timeout = 5000")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._write_pending()
+
+    def _write_pending(self):
+        # json يُستورد عند أول كتابة حتى لا يبطئ بدء الأوامر القصيرة
+        import json
+        with self._write_lock:
+            while self._pending:
+                batch = []
+                while self._pending and len(batch) < self.batch_size:
+                    batch.append(self._pending.popleft())
+                # تحويل الوقت و JSON هنا في الكاتب، لا في العملية التي سجلت الحدث
+                rows = [
+                    (str(datetime.fromtimestamp(at)), actor, action, target,
+                     json.dumps(details, ensure_ascii=False, default=str) if details else None)
+                    for at, actor, action, target, details in batch
+                ]
+                try:
+                    conn = self._connection()
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        conn.executemany(INSERT_QUERY, rows)
+                    except BaseException:
+                        conn.execute("ROLLBACK")
+                        raise
+                    conn.execute("COMMIT")
+                except sqlite3.Error as e:
+                    # إعادة الدفعة إلى مقدمة الطابور بترتيبها ومحاولة كتابتها في الدورة التالية
+                    self._pending.extendleft(reversed(batch))
+                    print(f"تعذرت كتابة سجل التدقيق: {e}", file=sys.stderr)
+                    return
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def get_audit_log(path):
+    """سجل تدقيق واحد مشترك لكل ملف، فكل مكونات العملية تكتب عبر خيط واحد"""
+    with _logs_lock:
+        log = _logs.get(path)
+        if log is None:
+            log = _logs[path] = AuditLog(path)
+        return log
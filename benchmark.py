@@ -0,0 +1,218 @@
+"""
+قياس أداء نظام الرواتب على بيانات اصطناعية
+
+يولد قاعدة بيانات بالحجم المطلوب ثم يقيس نقاط الدخول الفعلية ويطبع النتائج بصيغة JSON
+(عمليات في الثانية، زمن p50/p99 بالملي ثانية، وأقصى ذاكرة مستخدمة). الإشعارات تذهب إلى
+صندوق الصادر ولا يعمل أي عامل بريد، فلا يتصل القياس بأي خادم SMTP.
+
+الاستخدام:
+    python benchmark.py --employees 100000 --deductions 2000000 --payments 1200000 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+from crypto import encrypt_data, generate_key
+from employees import load_app
+from outbox import Outbox
+from reports import PayrollReports
+from stress import has_data
+
+
+POSITIONS = ('محاسب', 'مهندس', 'مشرف', 'فني', 'مندوب مبيعات', 'سائق', 'سكرتير', 'مدير قسم')
+DEDUCTION_REASONS = ('تأخير', 'غياب', 'سلفة', 'تأمين', 'مخالفة', 'قرض سكني')
+OPERATORS = ('bench_admin', 'hr_1', 'hr_2', 'finance_1', 'finance_2')
+BENCH_USER = 'bench_admin'
+BENCH_PASSWORD = 'bench-password'
+
+
+def emp_id_for(index):
+    return f"E{index:07d}"
+
+
+def generate_data(db, employees, deductions, payments, seed=0):
+    """
+    ملء قاعدة البيانات بموظفين وحساباتهم وسجلات استقطاعات ومدفوعات موزعة على سنتين
+
+    السجلات تُدرج مباشرة لسرعة التوليد، ثم تُبنى جداول الملخصات منها كما لو أُضيفت عبر العمليات.
+    """
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=730)
+
+    def timestamp():
+        return str(start + timedelta(seconds=rng.randrange(730 * 86400)))
+
+    db.executemany(
+        "INSERT OR IGNORE INTO users (username, password, role, email) VALUES (?, ?, ?, ?)",
+        ((name, '-', 'hr_manager', f"{name}@example.com") for name in OPERATORS[1:])
+    )
+    db.executemany(
+        '''INSERT INTO employees
+        (emp_id, name, position, salary, bank_account, current_balance, deductions, created_by, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?)''',
+        (
+            (emp_id_for(i), f"موظف {i}", rng.choice(POSITIONS), salary, encrypt_data(f"SA{rng.randrange(10**20):020d}"),
+             salary, rng.choice(OPERATORS), timestamp())
+            for i in range(employees)
+            for salary in (round(rng.uniform(3000, 25000), 2),)
+        )
+    )
+    db.executemany(
+        "INSERT INTO users (username, password, role, email) VALUES (?, '-', 'employee', ?)",
+        ((f"{emp_id_for(i)}_user", f"e{i}@example.com") for i in range(employees))
+    )
+    db.executemany(
+        "INSERT INTO deductions (emp_id, amount, reason, created_by, created_at) VALUES (?, ?, ?, ?, ?)",
+        (
+            (emp_id_for(rng.randrange(employees)), round(rng.uniform(10, 500), 2),
+             rng.choice(DEDUCTION_REASONS), rng.choice(OPERATORS), timestamp())
+            for _ in range(deductions)
+        )
+    )
+    db.executemany(
+        "INSERT INTO payments (emp_id, amount, created_by, created_at) VALUES (?, ?, ?, ?)",
+        (
+            (emp_id_for(rng.randrange(employees)), round(rng.uniform(3000, 25000), 2),
+             rng.choice(OPERATORS), timestamp())
+            for _ in range(payments)
+        )
+    )
+    PayrollReports(db).rebuild()
+
+
+def percentile(sorted_samples, fraction):
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def measure(name, operation, iterations):
+    """تشغيل العملية عدة مرات وإرجاع الإحصائيات (أو الخطأ إن فشلت)"""
+    samples = []
+    started = time.perf_counter()
+    try:
+        for i in range(iterations):
+            begin = time.perf_counter()
+            operation(i)
+            samples.append(time.perf_counter() - begin)
+    except Exception as e:
+        return {'op': name, 'error': f"{type(e).__name__}: {e}", 'completed': len(samples)}
+    elapsed = time.perf_counter() - started
+
+    samples.sort()
+    return {
+        'op': name,
+        'iterations': iterations,
+        'ops_per_sec': round(iterations / elapsed, 1),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 4),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 4),
+    }
+
+
+def run_benchmarks(app, db, employees, iterations, seed=0):
+    rng = random.Random(seed + 1)
+    notifier = Outbox(db)
+    auth = app.AuthenticationSystem(db, notifier)
+    emp_manager = app.EmployeeManager(db, auth, notifier)
+
+    def random_emp_id(_):
+        return emp_id_for(rng.randrange(employees))
+
+    reports = PayrollReports(db)
+    run_id = int(time.time())
+    operations = [
+        ('login', lambda i: auth.login(BENCH_USER, BENCH_PASSWORD), iterations),
+        ('has_permission', lambda i: auth.has_permission('can_pay_salary'), iterations * 10),
+        ('add_employee', lambda i: emp_manager.add_employee(
+            f"N{run_id}-{i}", f"موظف جديد {i}", rng.choice(POSITIONS), 5000.0, f"SA{i:020d}"), iterations),
+        ('deduct_from_salary', lambda i: emp_manager.deduct_from_salary(random_emp_id(i), 1.0, 'قياس'), iterations),
+        ('pay_salary', lambda i: emp_manager.pay_salary(random_emp_id(i)), iterations),
+        ('get_employee_info', lambda i: emp_manager.get_employee_info(random_emp_id(i)), iterations),
+        ('list_employees_page', lambda i: next(emp_manager.iter_employees(after=random_emp_id(i)), None), iterations),
+        ('report_deductions_by_month', lambda i: reports.totals('deductions', 'month'), iterations),
+        ('report_payments_by_position', lambda i: reports.totals('payments', 'position'), iterations),
+        ('pay_all', lambda i: emp_manager.pay_all(), 1),
+    ]
+
+    results = []
+    # العمليات تطبع رسائلها للمستخدم، فنحولها إلى devnull أثناء القياس
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, redirect_stdout(devnull):
+        if not db.execute_query("SELECT 1 FROM users WHERE username = ?", (BENCH_USER,), fetchone=True):
+            auth.register(BENCH_USER, BENCH_PASSWORD, 'bench@example.com', 'admin')
+        auth.login(BENCH_USER, BENCH_PASSWORD)
+
+        for name, operation, count in operations:
+            results.append(measure(name, operation, count))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس أداء نظام إدارة الموظفين')
+    parser.add_argument('--employees', type=int, default=10000)
+    parser.add_argument('--deductions', type=int, default=100000)
+    parser.add_argument('--payments', type=int, default=100000)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', help='مسار قاعدة البيانات (افتراضياً ملف مؤقت يُحذف بعد القياس)')
+    parser.add_argument('--reuse', action='store_true', help='استخدام البيانات الموجودة في --db بدون توليد (يتطلب --force)')
+    parser.add_argument('--force', action='store_true', help='السماح بالكتابة في قاعدة بيانات --db الموجودة')
+    parser.add_argument('--output', help='ملف JSON للنتائج (افتراضياً المخرج القياسي)')
+    args = parser.parse_args()
+
+    # القياس يضيف بيانات اصطناعية ويسجل استقطاعات ويصرف الرواتب حتى مع --reuse، فلا يعمل على قاعدة حقيقية خطأً
+    if args.db and has_data(args.db) and not args.force:
+        sys.exit(f"قاعدة البيانات {args.db} موجودة وفيها بيانات سيعدلها القياس؛ أضف --force للمتابعة")
+
+    # مفتاح مؤقت للبيانات الاصطناعية إن لم يُحدد مفتاح (لا يُنشأ مفتاح تلقائياً)
+    if not os.getenv('BANK_ACCOUNT_KEY_FILE'):
+        os.environ.setdefault('BANK_ACCOUNT_KEY', generate_key())
+    app = load_app()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or os.path.join(tmp, 'bench.db')
+        db = app.DatabaseManager(db_path)
+
+        generate_seconds = 0.0
+        if not args.reuse:
+            started = time.perf_counter()
+            generate_data(db, args.employees, args.deductions, args.payments, args.seed)
+            generate_seconds = time.perf_counter() - started
+
+        report = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'scale': {
+                'employees': args.employees,
+                'deductions': args.deductions,
+                'payments': args.payments,
+            },
+            'generate_seconds': round(generate_seconds, 2),
+            'totals_rows': {
+                table: db.execute_query(f"SELECT COUNT(*) FROM {table}", fetchone=True)[0]
+                for table in ('deduction_totals', 'payment_totals')
+            },
+            'full_scans': [query for query, _ in db.find_full_scans()],
+            'results': run_benchmarks(app, db, args.employees, args.iterations, args.seed),
+            # ru_maxrss بالكيلوبايت على لينكس
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+        db.close()
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
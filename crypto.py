@@ -0,0 +1,105 @@
+"""
+تشفير أرقام الحسابات البنكية بـ AES-256-GCM
+
+المفتاح يُقرأ مرة واحدة من المتغير البيئي BANK_ACCOUNT_KEY (أو من الملف المحدد في
+BANK_ACCOUNT_KEY_FILE) ويُبنى منه كائن التشفير مرة واحدة لكل العمليات. لا يُنشأ مفتاح
+تلقائياً أبداً: مفتاح جديد لا يفك تشفير الحسابات المحفوظة، فغياب المفتاح خطأ صريح.
+كل قيمة مشفرة تحمل بادئة الخوارزمية ورقماً عشوائياً (nonce) خاصاً بها:
+    aesgcm$<base64(nonce + ciphertext)>
+
+لتوليد مفتاح جديد:
+    python crypto.py
+"""
+import base64
+import os
+import threading
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+
+PREFIX = 'aesgcm$'
+NONCE_SIZE = 12
+
+_cipher = None
+_cipher_lock = threading.Lock()
+
+
+def generate_key():
+    return base64.urlsafe_b64encode(AESGCM.generate_key(bit_length=256)).decode('ascii')
+
+
+class KeyNotConfigured(RuntimeError):
+    """لم يُحدد مفتاح تشفير الحسابات البنكية"""
+
+
+def _load_key():
+    key = os.getenv('BANK_ACCOUNT_KEY')
+    if not key:
+        key_file = os.getenv('BANK_ACCOUNT_KEY_FILE')
+        if not key_file:
+            raise KeyNotConfigured(
+                "مفتاح تشفير الحسابات البنكية غير محدد: عيّن BANK_ACCOUNT_KEY أو BANK_ACCOUNT_KEY_FILE "
+                "(لتوليد مفتاح جديد لقاعدة بيانات جديدة: python crypto.py)"
+            )
+        try:
+            with open(key_file) as f:
+                key = f.read().strip()
+        except FileNotFoundError:
+            raise KeyNotConfigured(f"ملف مفتاح تشفير الحسابات البنكية غير موجود: {os.path.abspath(key_file)}")
+
+    raw = base64.urlsafe_b64decode(key)
+    if len(raw) != 32:
+        raise ValueError("مفتاح تشفير الحسابات يجب أن يكون 32 بايت (base64)")
+    return raw
+
+
+def _get_cipher():
+    global _cipher
+    if _cipher is None:
+        with _cipher_lock:
+            if _cipher is None:
+                _cipher = AESGCM(_load_key())
+    return _cipher
+
+
+def encrypt_many(values):
+    """تشفير مجموعة قيم بالمفتاح نفسه (للاستيراد وملفات البنك)"""
+    cipher = _get_cipher()
+    encrypted = []
+    for value in values:
+        nonce = os.urandom(NONCE_SIZE)
+        token = nonce + cipher.encrypt(nonce, value.encode(), None)
+        encrypted.append(PREFIX + base64.b64encode(token).decode('ascii'))
+    return encrypted
+
+
+def decrypt_many(values):
+    """
+    فك تشفير مجموعة قيم
+
+    :raises ValueError: إن كانت القيمة غير مشفرة بهذه الصيغة أو المفتاح لا يطابقها
+    """
+    cipher = _get_cipher()
+    decrypted = []
+    for value in values:
+        if not value.startswith(PREFIX):
+            raise ValueError("قيمة الحساب البنكي غير مشفرة بالصيغة المتوقعة")
+        token = base64.b64decode(value[len(PREFIX):])
+        try:
+            plain = cipher.decrypt(token[:NONCE_SIZE], token[NONCE_SIZE:], None)
+        except Exception:
+            raise ValueError("تعذر فك تشفير الحساب البنكي (مفتاح غير مطابق أو بيانات تالفة)")
+        decrypted.append(plain.decode())
+    return decrypted
+
+
+def encrypt_data(value):
+    return encrypt_many([value])[0]
+
+
+def decrypt_data(value):
+    return decrypt_many([value])[0]
+
+
+if __name__ == '__main__':
+    print(f"BANK_ACCOUNT_KEY={generate_key()}")
@@ -1,25 +1,214 @@
-import json
 import os
+import sys
 import hashlib
-import getpass
-from datetime import datetime
+import math
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import sqlite3
-import smtplib
-from email.mime.text import MIMEText
+import threading
 
-import secrets
-import string
+from collections import namedtuple
 
+from audit import audit_path_for, get_audit_log
+from outbox import DIGEST_PENDING_QUERY, DUE_QUERY, NOTIFY_USER_QUERY, Outbox, OutboxWorkerPool
+from passwords import PasswordHasher
+from sessions import SessionStore
+import reports
 
 
+# الحد الأقصى لعدد المعاملات في استعلام IN واحد
+QUERY_CHUNK_SIZE = 500
+
+# أعمدة جدول الصلاحيات، ولكل صلاحية بت في قناع الدور المخزن في الذاكرة
+PERMISSION_COLUMNS = (
+    'can_add_employee',
+    'can_deduct_salary',
+    'can_pay_salary',
+    'can_view_all_employees',
+    'can_manage_users',
+)
+PERMISSION_BITS = {name: 1 << index for index, name in enumerate(PERMISSION_COLUMNS)}
+
+# الأدوار وصلاحياتها الافتراضية بترتيب PERMISSION_COLUMNS (تُزرع في جدول الصلاحيات عند الإنشاء)
+DEFAULT_ROLE_PERMISSIONS = {
+    'admin': (1, 1, 1, 1, 1),
+    'hr_manager': (1, 1, 1, 1, 0),
+    'finance_manager': (0, 1, 1, 1, 0),
+    'department_manager': (1, 0, 0, 1, 0),
+    'employee': (0, 0, 0, 0, 0),
+}
+
+# إعدادات SQLite الافتراضية عند الاتصال (يمكن تجاوزها عبر المعامل pragmas)
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+}
+
+# استعلامات السجل المستخدمة في معلومات الموظف وقائمة المالية
+# سجلات الموظف تُقرأ صفحة بعد صفحة (الأحدث أولاً)؛ {after} يُستبدل بشرط المؤشر بعد الصفحة الأولى،
+# و{schema} فارغ للسجل الحالي أو اسم ملف أرشيف مربوط (انظر archive.py)
+DEDUCTION_HISTORY_QUERY = ("SELECT id, amount, reason, created_by, created_at FROM {schema}deductions "
+                           "WHERE emp_id = ? {after}ORDER BY created_at DESC, id DESC LIMIT ?")
+PAYMENT_HISTORY_QUERY = ("SELECT id, amount, created_by, created_at FROM {schema}payments "
+                         "WHERE emp_id = ? {after}ORDER BY created_at DESC, id DESC LIMIT ?")
+HISTORY_AFTER = "AND (created_at, id) < (?, ?) "
+HISTORY_PAGE_SIZE = 20
+
+# تحديث الرصيد بجملة واحدة: الشرط يُفحص والقيمة الجديدة تُحسب داخل UPDATE نفسه،
+# فلا يضيع استقطاع متزامن ولا ينزل الرصيد تحت الصفر مهما كان عدد المنفذين.
+# RETURNING يعيد القيمة قبل تطبيق نوع العمود، لذلك يُحوَّل الرصيد إلى REAL صراحة
+DEDUCT_BALANCE_QUERY = ("UPDATE employees SET current_balance = current_balance - ?, deductions = deductions + ? "
+                        "WHERE emp_id = ? AND current_balance >= ? "
+                        "RETURNING name, position, CAST(current_balance AS REAL)")
+PAY_BALANCE_QUERY = ("UPDATE employees SET current_balance = salary, deductions = 0 "
+                     "WHERE emp_id = ? RETURNING name, position, salary")
+
+# الاستعلامات المتكررة التي يجب أن تستخدم فهرساً (يتحقق منها check_query_plans)
+HOT_QUERIES = [
+    (DEDUCTION_HISTORY_QUERY.format(schema='', after=''), ('', 1)),
+    (DEDUCTION_HISTORY_QUERY.format(schema='', after=HISTORY_AFTER), ('', '', 0, 1)),
+    (PAYMENT_HISTORY_QUERY.format(schema='', after=''), ('', 1)),
+    (PAYMENT_HISTORY_QUERY.format(schema='', after=HISTORY_AFTER), ('', '', 0, 1)),
+    ("SELECT username FROM users WHERE email = ?", ('',)),
+    ("SELECT username, token_expiry FROM users WHERE reset_token = ?", ('',)),
+    (NOTIFY_USER_QUERY, ('', '', 0, 0, '', '')),
+    (DEDUCT_BALANCE_QUERY, (0, 0, '', 0)),
+    (PAY_BALANCE_QUERY, ('',)),
+    (DUE_QUERY, ('', 0, 1)),
+    (DIGEST_PENDING_QUERY.format(placeholders='?'), ('',)),
+    ("SELECT emp_id FROM employees WHERE position = ? AND emp_id > ? ORDER BY emp_id LIMIT ?", ('', '', 1)),
+    ("SELECT emp_id FROM employees WHERE created_by = ? AND emp_id > ? ORDER BY emp_id LIMIT ?", ('', '', 1)),
+]
+
+# إصدار مخطط قاعدة البيانات (PRAGMA user_version)؛ يُرفع مع كل تغيير في _create_tables
+SCHEMA_VERSION = 3
+
+# عدد الموظفين في كل صفحة من صفحات القائمة
+EMPLOYEE_PAGE_SIZE = 50
+
+# العبارات التي تُنفذ على اتصال القراءة الخاص بالخيط خارج المعاملات
+READ_STATEMENTS = ('SELECT', 'WITH', 'EXPLAIN')
+
+# مجموعة اتصالات قاعدة البيانات
+class ConnectionPool:
+    def __init__(self, db_path, pragmas, busy_timeout=5.0):
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.busy_timeout = busy_timeout
+        # كاتب واحد تتشاركه الخيوط بالتناوب عبر write_lock، وقارئ خاص بكل خيط
+        self.write_lock = threading.RLock()
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self.writer = self._open()
+    
+    def _open(self):
+        # نعطل المعاملات الضمنية ونتحكم بها صراحة عبر DatabaseManager.transaction()
+        conn = sqlite3.connect(
+            self.db_path, timeout=self.busy_timeout,
+            isolation_level=None, check_same_thread=False
+        )
+        for name, value in self.pragmas.items():
+            if value is not None:
+                conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+    
+    def reader(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+    
+    def close(self):
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            conn.close()
+        with self.write_lock:
+            self.writer.close()
+
 # إعداد قاعدة البيانات
 class DatabaseManager:
-    def __init__(self):
-        self.conn = sqlite3.connect('employee_management.db')
+    def __init__(self, db_path=None, pragmas=None, busy_timeout=None):
+        self.db_path = db_path or os.getenv('EMPLOYEE_DB_PATH', 'employee_management.db')
+        # كل اتصال بـ :memory: يفتح قاعدة فارغة خاصة به، فيقرأ قارئ كل خيط قاعدة غير التي كتبها الكاتب
+        if self.db_path == ':memory:':
+            raise ValueError("قاعدة البيانات في الذاكرة (:memory:) غير مدعومة؛ استخدم ملفاً مؤقتاً بدلاً منها")
+        if busy_timeout is None:
+            busy_timeout = float(os.getenv('EMPLOYEE_DB_BUSY_TIMEOUT', 5))
+        self.pool = ConnectionPool(self.db_path, {**DEFAULT_PRAGMAS, **(pragmas or {})}, busy_timeout)
+        # عمق المعاملات لكل خيط على حدة
+        self._local = threading.local()
         self.create_tables()
     
+    @property
+    def conn(self):
+        return self.pool.writer
+    
+    def in_transaction(self):
+        return getattr(self._local, 'depth', 0) > 0
+    
+    @contextmanager
+    def transaction(self):
+        # المعاملة الخارجية تحجز الكاتب وتبدأ بـ BEGIN، والمعاملات المتداخلة تستخدم نقاط الحفظ
+        depth = getattr(self._local, 'depth', 0)
+        savepoint = f"sp_{depth}"
+        if depth == 0:
+            self.pool.write_lock.acquire()
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+            except BaseException:
+                self.pool.write_lock.release()
+                raise
+        else:
+            self.conn.execute(f"SAVEPOINT {savepoint}")
+        self._local.depth = depth + 1
+        
+        try:
+            yield self
+        except BaseException:
+            self._local.depth = depth
+            if depth == 0:
+                try:
+                    self.conn.execute("ROLLBACK")
+                finally:
+                    self.pool.write_lock.release()
+            else:
+                self.conn.execute(f"ROLLBACK TO {savepoint}")
+                self.conn.execute(f"RELEASE {savepoint}")
+            raise
+        
+        self._local.depth = depth
+        if depth == 0:
+            try:
+                self.conn.execute("COMMIT")
+            except BaseException:
+                # فشل COMMIT (مثل SQLITE_BUSY أو خطأ قرص) يترك المعاملة مفتوحة على الكاتب المشترك
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                raise
+            finally:
+                self.pool.write_lock.release()
+        else:
+            self.conn.execute(f"RELEASE {savepoint}")
+    
     def create_tables(self):
-        cursor = self.conn.cursor()
+        # قاعدة بيانات محدثة: لا نحجز الكاتب ولا ننفذ DDL عند كل تشغيل
+        if self.pool.reader().execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+            return
+        
+        with self.transaction():
+            cursor = self.conn.cursor()
+            if cursor.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self._create_tables(cursor)
+                cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    
+    def _create_tables(self, cursor):
         
         # جدول المستخدمين
         cursor.execute('''
@@ -92,162 +281,440 @@ class DatabaseManager:
         ''')
         
         # إدخال الصلاحيات الافتراضية
+        cursor.executemany(
+            f"INSERT OR IGNORE INTO permissions (role, {', '.join(PERMISSION_COLUMNS)}) "
+            f"VALUES (?{', ?' * len(PERMISSION_COLUMNS)})",
+            ((role, *flags) for role, flags in DEFAULT_ROLE_PERMISSIONS.items())
+        )
+        
+        # صندوق صادر الإشعارات (يُكتب ضمن معاملة العملية ويُرسل في الخلفية)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            available_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            sent_at TEXT,
+            digest INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        
+        # عمود digest (تجميع إشعارات المستلم في ملخص) أضيف بعد إنشاء الجدول في القواعد القديمة
+        if 'digest' not in {row[1] for row in cursor.execute("PRAGMA table_info(outbox)")}:
+            cursor.execute("ALTER TABLE outbox ADD COLUMN digest INTEGER NOT NULL DEFAULT 0")
+        
+        # رموز الخدمة لتشغيل أوامر سطر الأوامر بدون كلمة مرور (تُخزن تجزئتها فقط)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS service_tokens (
+            token_hash TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (username) REFERENCES users(username)
+        )
+        ''')
+        
+        # الجلسات المحفوظة عند استخدام SessionStore مع قاعدة البيانات (تجزئة الرمز فقط)
         cursor.execute('''
-        INSERT OR IGNORE INTO permissions (role, can_add_employee, can_deduct_salary, can_pay_salary, can_view_all_employees, can_manage_users)
-        VALUES 
-            ('admin', 1, 1, 1, 1, 1),
-            ('hr_manager', 1, 1, 1, 1, 0),
-            ('finance_manager', 0, 1, 1, 1, 0),
-            ('department_manager', 1, 0, 0, 1, 0),
-            ('employee', 0, 0, 0, 0, 0)
+        CREATE TABLE IF NOT EXISTS sessions (
+            token_hash TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            role TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
         ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_username ON sessions(username)")
+        
+        # ملخصات التقارير: تُحدَّث مع كل استقطاع ودفعة (انظر reports.py)
+        needs_backfill = not cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'deduction_totals'"
+        ).fetchone()
         
-        self.conn.commit()
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deduction_totals (
+            period TEXT NOT NULL,
+            reason TEXT NOT NULL,
+            position TEXT NOT NULL,
+            created_by TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            entries INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, reason, position, created_by)
+        ) WITHOUT ROWID
+        ''')
+        
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payment_totals (
+            period TEXT NOT NULL,
+            position TEXT NOT NULL,
+            created_by TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            entries INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, position, created_by)
+        ) WITHOUT ROWID
+        ''')
+        
+        # قاعدة بيانات قائمة قبل إضافة الملخصات: نبنيها مرة واحدة من السجلات الموجودة
+        if needs_backfill:
+            for statement in reports.REBUILD_STATEMENTS:
+                cursor.execute(statement)
+        
+        # فهارس سجلات الاستقطاعات والمدفوعات والبحث في المستخدمين
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_deductions_emp_created ON deductions (emp_id, created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_payments_emp_created ON payments (emp_id, created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_email ON users (email)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (status, available_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_digest ON outbox (recipient, status) WHERE digest = 1')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_employees_position ON employees (position, emp_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_employees_created_by ON employees (created_by, emp_id)')
+        cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_reset_token
+        ON users (reset_token) WHERE reset_token IS NOT NULL
+        ''')
     
     def execute_query(self, query, params=(), fetchone=False, fetchall=False):
-        cursor = self.conn.cursor()
-        cursor.execute(query, params)
-        result = None
-        if fetchone:
-            result = cursor.fetchone()
-        elif fetchall:
-            result = cursor.fetchall()
-        self.conn.commit()
-        return result
+        # القراءة خارج المعاملات تتم على اتصال الخيط ولا تنتظر الكاتب،
+        # وكل كتابة خارج transaction() تصبح معاملة قصيرة خاصة بها
+        if self.in_transaction():
+            conn = self.conn
+        elif query.lstrip().split(None, 1)[0].upper() in READ_STATEMENTS:
+            conn = self.pool.reader()
+        else:
+            with self.transaction():
+                return self.execute_query(query, params, fetchone, fetchall)
+        
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            result = None
+            if fetchone:
+                result = cursor.fetchone()
+            elif fetchall:
+                result = cursor.fetchall()
+            return result
+        finally:
+            cursor.close()
+    
+    def iter_query(self, query, params=(), chunk_size=QUERY_CHUNK_SIZE):
+        # نتائج استعلام قراءة على دفعات من المؤشر مباشرة بدل تحميلها كلها في الذاكرة؛
+        # الاستعلام يرى لقطة واحدة ثابتة من البيانات حتى تنتهي قراءته
+        if query.lstrip().split(None, 1)[0].upper() not in READ_STATEMENTS:
+            raise ValueError("iter_query مخصص لاستعلامات القراءة فقط")
+
+        conn = self.conn if self.in_transaction() else self.pool.reader()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def attached(self, path, alias, write=False):
+        # ربط ملف قاعدة بيانات آخر (أرشيف) باسم alias طوال الكتلة: بقارئ الخيط الحالي،
+        # أو بالكاتب مع write=True لتتمكن المعاملات من الكتابة فيه
+        if self.in_transaction():
+            raise RuntimeError("لا يمكن ربط قاعدة بيانات داخل معاملة")
+        conn = self.pool.writer if write else self.pool.reader()
+        lock = self.pool.write_lock if write else threading.Lock()
+        with lock:
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+        try:
+            yield alias
+        finally:
+            with lock:
+                conn.execute(f"DETACH DATABASE {alias}")
+    
+    def executemany(self, query, seq_of_params):
+        with self.transaction():
+            return self.conn.executemany(query, seq_of_params).rowcount
+    
+    def find_full_scans(self, queries=HOT_QUERIES):
+        # إرجاع الاستعلامات التي تمسح جدولاً كاملاً أو تحتاج فرزاً مؤقتاً
+        offenders = []
+        for query, params in queries:
+            plan = self.execute_query(f"EXPLAIN QUERY PLAN {query}", params, fetchall=True)
+            details = [row[-1] for row in plan]
+            if any(detail.startswith('SCAN') or 'TEMP B-TREE' in detail for detail in details):
+                offenders.append((query, details))
+        return offenders
+    
+    def check_query_plans(self, queries=HOT_QUERIES):
+        offenders = self.find_full_scans(queries)
+        if offenders:
+            report = '\n'.join(f"{query}\n    -> {' | '.join(details)}" for query, details in offenders)
+            raise RuntimeError(f"استعلامات بدون فهرس مناسب:\n{report}")
     
     def close(self):
-        self.conn.close()
+        self.pool.close()
 
 # نظام الإشعارات
-class NotificationSystem:
-    def __init__(self):
-        self.smtp_server = "smtp.example.com"
-        self.smtp_port = 587
-        self.sender_email = "system@company.com"
-        self.sender_password = "email_password"
-    
-    def send_email(self, recipient, subject, body):
-        try:
-            msg = MIMEText(body)
-            msg['Subject'] = subject
-            msg['From'] = self.sender_email
-            msg['To'] = recipient
-            
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.sender_email, self.sender_password)
-                server.send_message(msg)
-            return True
-        except Exception as e:
-            print(f"فشل في إرسال البريد: {e}")
-            return False
+def mail_sender():
+    # مرسل البريد لعمال صندوق الصادر: مزودو SMTP_PROFILE بحدودهم وتوجيههم (انظر البريد.py)،
+    # ووحداته تُستورد عند الحاجة فقط لتسريع بدء التشغيل
+    from البريد import NotificationSystem
+    return NotificationSystem()
 
 # نظام المصادقة
 class AuthenticationSystem:
-    def __init__(self, db_manager, notification_system):
+    def __init__(self, db_manager, notification_system, hasher=None, sessions=None, audit=None):
         self.db = db_manager
         self.notifier = notification_system
-        self.current_user = None
-        self.login_attempts = 0
+        self.hasher = hasher or PasswordHasher.from_env()
+        # سجل التدقيق: التسجيل فيه إضافة إلى طابور في الذاكرة، والكتابة في الخلفية
+        self.audit = audit or get_audit_log(audit_path_for(db_manager.db_path))
+        # كل تسجيل دخول ينشئ جلسة مستقلة؛ current_session هي جلسة الواجهة التفاعلية فقط
+        self.sessions = sessions or SessionStore()
+        self.current_session = None
+        # المحاولات الفاشلة لكل اسم مستخدم، حتى لا يغلق عميل واحد النظام على الجميع؛ خيوط
+        # خدمة HTTP تحدّثها معاً فتُعدَّل تحت القفل حتى لا تضيع زيادة
+        self.login_attempts = {}
+        self._attempts_lock = threading.Lock()
         self.max_attempts = 5
+        # مصفوفة الصلاحيات: الدور -> قناع بتات، تُحمّل مرة واحدة عند أول استخدام
+        self._role_masks = None
     
     def hash_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
+        return self.hasher.hash(password)
+    
+    def verify_password(self, password, hashed_pw):
+        return self.hasher.verify(password, hashed_pw)
     
     def generate_reset_token(self):
+        import secrets
+        import string
         alphabet = string.ascii_letters + string.digits
         return ''.join(secrets.choice(alphabet) for _ in range(32))
     
-    def register(self, username, password, email, role='employee'):
-        if self.db.execute_query("SELECT username FROM users WHERE username = ?", (username,), fetchone):
-            print("اسم المستخدم موجود بالفعل!")
-            return False
-        
+    def _actor(self, session):
+        session = session or self.current_session
+        return session.username if session else None
+    
+    def register(self, username, password, email, role='employee', session=None):
         hashed_pw = self.hash_password(password)
-        self.db.execute_query(
-            "INSERT INTO users (username, password, role, email, last_login) VALUES (?, ?, ?, ?, ?)",
-            (username, hashed_pw, role, email, None)
-        )
         
-        # إرسال إشعار الترحيب
-        subject = "حسابك الجديد في نظام إدارة الموظفين"
-        body = f"مرحباً {username},\n\nتم إنشاء حسابك بنجاح في نظام إدارة الموظفين.\n\nصلاحيتك: {role}\n\nيمكنك تسجيل الدخول الآن."
-        self.notifier.send_email(email, subject, body)
+        with self.db.transaction():
+            if self.db.execute_query("SELECT username FROM users WHERE username = ?", (username,), fetchone=True):
+                print("اسم المستخدم موجود بالفعل!")
+                return False
+            
+            self.db.execute_query(
+                "INSERT INTO users (username, password, role, email, last_login) VALUES (?, ?, ?, ?, ?)",
+                (username, hashed_pw, role, email, None)
+            )
         
+            # إرسال إشعار الترحيب
+            subject = "حسابك الجديد في نظام إدارة الموظفين"
+            body = f"مرحباً {username},\n\nتم إنشاء حسابك بنجاح في نظام إدارة الموظفين.\n\nصلاحيتك: {role}\n\nيمكنك تسجيل الدخول الآن."
+            self.notifier.send_email(email, subject, body)
+        
+        self.audit.record(self._actor(session), 'user_registered', username, role=role)
         print(f"تم تسجيل المستخدم {username} بنجاح!")
         return True
     
-    def login(self, username, password):
-        if self.login_attempts >= self.max_attempts:
-            print("تم تجاوز عدد المحاولات المسموح بها! النظام مغلق مؤقتاً.")
-            return False
+    def _record_failed_login(self, username):
+        with self._attempts_lock:
+            self.login_attempts[username] = self.login_attempts.get(username, 0) + 1
+    
+    def open_session(self, username, password, out=None):
+        """
+        التحقق من كلمة المرور وإنشاء جلسة جديدة بدون تغيير الجلسة الحالية
+
+        :param out: مكان كتابة رسائل النتيجة (افتراضياً sys.stdout)
+        :return: Session أو None عند الفشل
+        """
+        if self.login_attempts.get(username, 0) >= self.max_attempts:
+            self.audit.record(username, 'login_failed', username, reason='locked_out')
+            print("تم تجاوز عدد المحاولات المسموح بها! النظام مغلق مؤقتاً.", file=out)
+            return None
         
         user = self.db.execute_query(
             "SELECT username, password, role, failed_attempts, is_active FROM users WHERE username = ?",
-            (username,), fetchone
+            (username,), fetchone=True
         )
         
         if not user:
-            print("اسم المستخدم أو كلمة المرور غير صحيحة!")
-            self.login_attempts += 1
-            return False
+            self.audit.record(username, 'login_failed', username, reason='unknown_user')
+            print("اسم المستخدم أو كلمة المرور غير صحيحة!", file=out)
+            self._record_failed_login(username)
+            return None
         
         username_db, password_db, role, failed_attempts, is_active = user
         
         if not is_active:
-            print("الحساب معطل! يرجى التواصل مع المدير.")
-            return False
+            self.audit.record(username, 'login_failed', username, reason='inactive')
+            print("الحساب معطل! يرجى التواصل مع المدير.", file=out)
+            return None
         
         if failed_attempts >= 3:
-            print("الحساب مؤقتاً بسبب كثرة المحاولات الفاشلة!")
-            return False
+            self.audit.record(username, 'login_failed', username, reason='too_many_failures')
+            print("الحساب مؤقتاً بسبب كثرة المحاولات الفاشلة!", file=out)
+            return None
         
-        if password_db != self.hash_password(password):
+        if not self.verify_password(password, password_db):
             self.db.execute_query(
                 "UPDATE users SET failed_attempts = failed_attempts + 1 WHERE username = ?",
                 (username,)
             )
-            print("اسم المستخدم أو كلمة المرور غير صحيحة!")
-            self.login_attempts += 1
-            return False
+            self.audit.record(username, 'login_failed', username, reason='bad_password')
+            print("اسم المستخدم أو كلمة المرور غير صحيحة!", file=out)
+            self._record_failed_login(username)
+            return None
         
-        self.current_user = {
-            'username': username,
-            'role': role
-        }
+        if self.hasher.needs_rehash(password_db):
+            # ترقية التجزئة القديمة أو ضعيفة التكلفة بعد التحقق من كلمة المرور
+            self.db.execute_query(
+                "UPDATE users SET last_login = ?, failed_attempts = 0, password = ? WHERE username = ?",
+                (str(datetime.now()), self.hash_password(password), username))
+        else:
+            self.db.execute_query(
+                "UPDATE users SET last_login = ?, failed_attempts = 0 WHERE username = ?",
+                (str(datetime.now()), username))
+        
+        with self._attempts_lock:
+            self.login_attempts.pop(username, None)
+        self.audit.record(username, 'login', username, role=role)
+        print(f"مرحباً {username}! تم تسجيل الدخول بنجاح.", file=out)
+        return self.sessions.create(username, role)
+    
+    def login(self, username, password):
+        session = self.open_session(username, password)
+        if session:
+            self.current_session = session
+        return session
+    
+    def get_session(self, token):
+        # التحقق من رمز الجلسة من الذاكرة مباشرة دون سؤال جدول users
+        return self.sessions.get(token)
+    
+    def create_service_token(self, username, session=None):
+        """
+        إنشاء رمز خدمة لمستخدم (لمهام cron والسكربتات)
+
+        :return: الرمز نفسه (يُعرض مرة واحدة ولا يُخزن إلا تجزئته)، أو None عند الفشل
+        """
+        if not self.has_permission('can_manage_users', session):
+            print("ليس لديك صلاحية لإدارة المستخدمين!")
+            return None
+        if not self.db.execute_query("SELECT 1 FROM users WHERE username = ?", (username,), fetchone=True):
+            print("المستخدم غير موجود!")
+            return None
         
+        import secrets
+        token = secrets.token_urlsafe(32)
+        # الرمز عشوائي بطول كافٍ فلا حاجة لدالة اشتقاق بطيئة، وSHA-256 يكفي للبحث عنه
         self.db.execute_query(
-            "UPDATE users SET last_login = ?, failed_attempts = 0 WHERE username = ?",
-            (str(datetime.now)), username)
+            "INSERT INTO service_tokens (token_hash, username, created_at) VALUES (?, ?, ?)",
+            (hashlib.sha256(token.encode()).hexdigest(), username, str(datetime.now()))
+        )
+        self.audit.record(self._actor(session), 'service_token_created', username)
+        return token
+    
+    def open_token_session(self, token):
+        user = self.db.execute_query(
+            '''SELECT u.username, u.role, u.is_active FROM service_tokens t
+            JOIN users u ON u.username = t.username WHERE t.token_hash = ?''',
+            (hashlib.sha256(token.encode()).hexdigest(),), fetchone=True
+        )
+        if not user:
+            self.audit.record(None, 'token_login_failed', reason='unknown_token')
+            print("رمز الخدمة غير صحيح!")
+            return None
         
-        self.login_attempts = 0
-        print(f"مرحباً {username}! تم تسجيل الدخول بنجاح.")
-        return True
+        username, role, is_active = user
+        if not is_active:
+            self.audit.record(username, 'token_login_failed', username, reason='inactive')
+            print("الحساب معطل! يرجى التواصل مع المدير.")
+            return None
+        self.audit.record(username, 'token_login', username, role=role)
+        return self.sessions.create(username, role)
+    
+    def login_with_token(self, token):
+        session = self.open_token_session(token)
+        if session:
+            self.current_session = session
+        return session
+    
+    def logout(self, session=None, out=None):
+        session = session or self.current_session
+        if not session:
+            print("لا يوجد مستخدم مسجل حالياً!", file=out)
+            return
+        
+        self.sessions.revoke(session.token)
+        self.audit.record(session.username, 'logout', session.username)
+        if session is self.current_session:
+            self.current_session = None
+        print(f"تم تسجيل الخروج للمستخدم {session.username}", file=out)
     
-    def logout(self):
-        if self.current_user:
-            print(f"تم تسجيل الخروج للمستخدم {self.current_user['username']}")
-            self.current_user = None
+    def set_user_active(self, username, active, session=None):
+        if active:
+            self.db.execute_query("UPDATE users SET is_active = 1, failed_attempts = 0 WHERE username = ?", (username,))
         else:
-            print("لا يوجد مستخدم مسجل حالياً!")
+            self.db.execute_query("UPDATE users SET is_active = 0 WHERE username = ?", (username,))
+            # الحساب المعطل يخرج من كل جلساته المفتوحة
+            self.sessions.revoke_user(username)
+        self.audit.record(self._actor(session), 'user_enabled' if active else 'user_disabled', username)
     
-    def has_permission(self, permission_name):
-        if not self.current_user:
-            return False
+    def load_permissions(self):
+        rows = self.db.execute_query(
+            f"SELECT role, {', '.join(PERMISSION_COLUMNS)} FROM permissions",
+            fetchall=True
+        )
         
-        role = self.current_user['role']
-        query = f"SELECT {permission_name} FROM permissions WHERE role = ?"
-        result = self.db.execute_query(query, (role,), fetchone)
+        self._role_masks = {
+            row[0]: sum(PERMISSION_BITS[name] for name, granted in zip(PERMISSION_COLUMNS, row[1:]) if granted == 1)
+            for row in rows
+        }
+        return self._role_masks
+    
+    def invalidate_permissions(self):
+        self._role_masks = None
+    
+    def get_role_permissions(self, role):
+        role_masks = self._role_masks if self._role_masks is not None else self.load_permissions()
+        if role not in role_masks:
+            return None
+        
+        mask = role_masks[role]
+        return [bool(mask & PERMISSION_BITS[name]) for name in PERMISSION_COLUMNS]
+    
+    def set_permission(self, role, permission_name, granted, session=None):
+        if permission_name not in PERMISSION_BITS:
+            raise ValueError(f"صلاحية غير معروفة: {permission_name}")
+        
+        self.db.execute_query(
+            f"UPDATE permissions SET {permission_name} = ? WHERE role = ?",
+            (int(granted), role)
+        )
+        self.invalidate_permissions()
+        self.audit.record(self._actor(session), 'permission_changed', role,
+                          permission=permission_name, granted=bool(granted))
+    
+    def has_permission(self, permission_name, session=None):
+        session = session or self.current_session
+        if not session:
+            return False
         
-        return result and result[0] == 1
+        role_masks = self._role_masks if self._role_masks is not None else self.load_permissions()
+        return bool(role_masks.get(session.role, 0) & PERMISSION_BITS.get(permission_name, 0))
     
     def request_password_reset(self, email):
         user = self.db.execute_query(
             "SELECT username FROM users WHERE email = ?",
-            (email,), fetchone
+            (email,), fetchone=True
         )
         
         if not user:
+            self.audit.record(None, 'password_reset_requested', reason='unknown_email', email=email)
             print("لا يوجد حساب مرتبط بهذا البريد الإلكتروني!")
             return False
         
@@ -255,16 +722,19 @@ class AuthenticationSystem:
         token = self.generate_reset_token()
         expiry = datetime.now() + timedelta(hours=1)
         
-        self.db.execute_query(
-            "UPDATE users SET reset_token = ?, token_expiry = ? WHERE username = ?",
-            (token, str(expiry), username)
-        )
-        
         reset_link = f"https://yourapp.com/reset-password?token={token}"
         subject = "إعادة تعيين كلمة المرور"
         body = f"مرحباً {username},\n\nلإعادة تعيين كلمة المرور، يرجى النقر على الرابط التالي:\n{reset_link}\n\nالرابط صالح لمدة ساعة واحدة."
         
-        if self.notifier.send_email(email, subject, body):
+        with self.db.transaction():
+            self.db.execute_query(
+                "UPDATE users SET reset_token = ?, token_expiry = ? WHERE username = ?",
+                (token, str(expiry), username)
+            )
+            queued = self.notifier.send_email(email, subject, body)
+        
+        self.audit.record(username, 'password_reset_requested', username)
+        if queued:
             print("تم إرسال رابط إعادة تعيين كلمة المرور إلى بريدك الإلكتروني.")
             return True
         else:
@@ -272,244 +742,419 @@ class AuthenticationSystem:
             return False
     
     def reset_password(self, token, new_password):
-        user = self.db.execute_query(
-            "SELECT username, token_expiry FROM users WHERE reset_token = ?",
-            (token,), fetchone
-        )
-        
-        if not user:
-            print("رابط إعادة التعيين غير صالح!")
-            return False
-        
-        username, expiry_str = user
-        expiry = datetime.strptime(expiry_str, '%Y-%m-%d %H:%M:%S.%f')
-        
-        if datetime.now() > expiry:
-            print("انتهت صلاحية رابط إعادة التعيين!")
-            return False
-        
         hashed_pw = self.hash_password(new_password)
-        self.db.execute_query(
-            "UPDATE users SET password = ?, reset_token = NULL, token_expiry = NULL WHERE username = ?",
-            (hashed_pw, username)
-        )
         
+        with self.db.transaction():
+            user = self.db.execute_query(
+                "SELECT username, token_expiry FROM users WHERE reset_token = ?",
+                (token,), fetchone=True
+            )
+            
+            if not user:
+                self.audit.record(None, 'password_reset_failed', reason='invalid_token')
+                print("رابط إعادة التعيين غير صالح!")
+                return False
+            
+            username, expiry_str = user
+            expiry = datetime.strptime(expiry_str, '%Y-%m-%d %H:%M:%S.%f')
+            
+            if datetime.now() > expiry:
+                self.audit.record(username, 'password_reset_failed', username, reason='expired')
+                print("انتهت صلاحية رابط إعادة التعيين!")
+                return False
+            
+            self.db.execute_query(
+                "UPDATE users SET password = ?, reset_token = NULL, token_expiry = NULL WHERE username = ?",
+                (hashed_pw, username)
+            )
+        
+        self.audit.record(username, 'password_reset', username)
         print("تم إعادة تعيين كلمة المرور بنجاح!")
         return True
 
 # نظام إدارة الموظفين
+DeductionEntry = namedtuple('DeductionEntry', 'amount reason by at')
+PaymentEntry = namedtuple('PaymentEntry', 'amount by at')
+
+
+def iter_history(db, query, emp_id, page_size=HISTORY_PAGE_SIZE, archived=False):
+    # صفحات من سجل موظف، كل صفحة تبدأ بعد آخر (created_at, id) في سابقتها بدل OFFSET؛
+    # السجل الحالي فقط، أو مع archived=True ملفات الأرشيف من الأحدث إلى الأقدم
+    if archived:
+        from archive import iter_archives
+        for schema in iter_archives(db):
+            yield from _iter_history(db, query, emp_id, page_size, schema)
+    else:
+        yield from _iter_history(db, query, emp_id, page_size, '')
+
+
+def _iter_history(db, query, emp_id, page_size, schema):
+    entry_type = DeductionEntry if query is DEDUCTION_HISTORY_QUERY else PaymentEntry
+    after = None
+    while True:
+        if after is None:
+            rows = db.execute_query(query.format(schema=schema, after=''), (emp_id, page_size), fetchall=True)
+        else:
+            rows = db.execute_query(query.format(schema=schema, after=HISTORY_AFTER),
+                                    (emp_id, *after, page_size), fetchall=True)
+        if not rows:
+            return
+        
+        yield [entry_type(*row[1:]) for row in rows]
+        if len(rows) < page_size:
+            return
+        after = (rows[-1][-1], rows[-1][0])
+
+
+class Employee:
+    """
+    سجل موظف بأعمدة مسماة
+
+    الحساب البنكي يبقى مشفراً حتى أول قراءة لـ bank_account، وسجلات الاستقطاعات
+    والمدفوعات لا تُقرأ من قاعدة البيانات إلا عند المرور على صفحاتها.
+    """
+    __slots__ = ('emp_id', 'name', 'position', 'salary', 'current_balance', 'deductions',
+                 'created_by', 'created_at', '_encrypted_account', '_bank_account', '_db')
+    
+    COLUMNS = 'emp_id, name, position, salary, bank_account, current_balance, deductions, created_by, created_at'
+    
+    def __init__(self, db, emp_id, name, position, salary, bank_account, current_balance,
+                 deductions, created_by, created_at):
+        self._db = db
+        self.emp_id = emp_id
+        self.name = name
+        self.position = position
+        self.salary = salary
+        self._encrypted_account = bank_account
+        self._bank_account = None
+        self.current_balance = current_balance
+        self.deductions = deductions
+        self.created_by = created_by
+        self.created_at = created_at
+    
+    @property
+    def bank_account(self):
+        if self._bank_account is None:
+            from crypto import decrypt_data
+            self._bank_account = decrypt_data(self._encrypted_account)
+        return self._bank_account
+    
+    def deduction_history(self, page_size=HISTORY_PAGE_SIZE, archived=False):
+        return iter_history(self._db, DEDUCTION_HISTORY_QUERY, self.emp_id, page_size, archived)
+    
+    def payment_history(self, page_size=HISTORY_PAGE_SIZE, archived=False):
+        return iter_history(self._db, PAYMENT_HISTORY_QUERY, self.emp_id, page_size, archived)
+    
+    def __repr__(self):
+        return f"Employee(emp_id={self.emp_id!r}, name={self.name!r})"
+
+
 class EmployeeManager:
     def __init__(self, db_manager, auth_system, notifier):
         self.db = db_manager
         self.auth = auth_system
         self.notifier = notifier
+        self.audit = auth_system.audit
+    
+    def _session(self, session):
+        # كل عملية تعمل بجلسة صريحة، وإلا فبجلسة الواجهة التفاعلية الحالية
+        return session or self.auth.current_session
     
-    def add_employee(self, emp_id, name, position, salary, bank_account):
-        if not self.auth.has_permission('can_add_employee'):
+    def encrypt_accounts(self, bank_accounts):
+        # نقطة التشفير بالجملة للاستيراد
+        from crypto import encrypt_many
+        return encrypt_many(bank_accounts)
+    
+    def add_employee(self, emp_id, name, position, salary, bank_account, session=None):
+        session = self._session(session)
+        if not self.auth.has_permission('can_add_employee', session):
             print("ليس لديك صلاحية لإضافة موظفين!")
             return False
         
-        if self.db.execute_query("SELECT emp_id FROM employees WHERE emp_id = ?", (emp_id,), fetchone):
-            print("موظف بهذا الرقم موجود بالفعل!")
-            return False
-        
+        from crypto import encrypt_data
         encrypted_account = encrypt_data(bank_account)
         
-        self.db.execute_query(
-            '''INSERT INTO employees 
-            (emp_id, name, position, salary, bank_account, current_balance, created_by, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-            (emp_id, name, position, salary, encrypted_account, salary, 
-             self.auth.current_user['username'], str(datetime.now)))
-        
-        # إرسال إشعار للموظف الجديد
-        user_email = self.db.execute_query(
-            "SELECT email FROM users WHERE username = ?",
-            (f"{emp_id}_user",), fetchone
-        )
+        with self.db.transaction():
+            if self.db.execute_query("SELECT emp_id FROM employees WHERE emp_id = ?", (emp_id,), fetchone=True):
+                print("موظف بهذا الرقم موجود بالفعل!")
+                return False
+            
+            self.db.execute_query(
+                '''INSERT INTO employees 
+                (emp_id, name, position, salary, bank_account, current_balance, created_by, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                (emp_id, name, position, salary, encrypted_account, salary, 
+                 session.username, str(datetime.now())))
         
-        if user_email:
+            # إرسال إشعار للموظف الجديد (عنوانه يُقرأ في جملة الإدراج نفسها)
             subject = "تمت إضافتك إلى نظام الموظفين"
             body = f"مرحباً {name},\n\nتمت إضافتك إلى نظام إدارة الموظفين.\n\nالوظيفة: {position}\nالراتب: {salary}"
-            self.notifier.send_email(user_email[0], subject, body)
+            self.notifier.notify_users([(f"{emp_id}_user", subject, body)])
         
+        self.audit.record(session.username, 'employee_added', emp_id, position=position, salary=salary)
         print(f"تم إضافة الموظف {name} بنجاح!")
         return True
     
-    def list_employees(self):
-        if not self.auth.has_permission('can_view_all_employees'):
+    def iter_employees(self, position=None, min_balance=None, max_balance=None, created_by=None,
+                       page_size=EMPLOYEE_PAGE_SIZE, after=None, session=None):
+        # الصلاحية تُفحص فوراً لا عند أول صفحة، فيُعاد None بدون صلاحية بدل مولّد فارغ
+        if not self.auth.has_permission('can_view_all_employees', self._session(session)):
             print("ليس لديك صلاحية لعرض قائمة الموظفين!")
-            return
-        
-        employees = self.db.execute_query(
-            "SELECT emp_id, name, position, salary, current_balance FROM employees",
-            fetchall=True
-        )
-        
-        if not employees:
+            return None
+        return self._employee_pages(position, min_balance, max_balance, created_by, page_size, after)
+    
+    def _employee_pages(self, position, min_balance, max_balance, created_by, page_size, after):
+        # صفحات متتالية مرتبة حسب emp_id، كل صفحة تبدأ بعد آخر رقم في سابقتها بدل OFFSET
+        conditions = []
+        params = []
+        for condition, value in (
+            ("position = ?", position),
+            ("created_by = ?", created_by),
+            ("current_balance >= ?", min_balance),
+            ("current_balance <= ?", max_balance),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        
+        while True:
+            page_conditions = conditions + ["emp_id > ?"] if after is not None else conditions
+            page_params = params + [after] if after is not None else params
+            where = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ""
+            
+            page = self.db.execute_query(
+                f"SELECT emp_id, name, position, salary, current_balance FROM employees {where} "
+                "ORDER BY emp_id LIMIT ?",
+                (*page_params, page_size), fetchall=True
+            )
+            if not page:
+                return
+            
+            yield page
+            if len(page) < page_size:
+                return
+            after = page[-1][0]
+    
+    def list_employees(self, **filters):
+        pages = self.iter_employees(**filters)
+        if pages is None:
+            return 0
+        
+        printed = 0
+        for page in pages:
+            if not printed:
+                print("\nقائمة الموظفين:")
+            for emp in page:
+                print(f"ID: {emp[0]} | الاسم: {emp[1]} | الوظيفة: {emp[2]} | الراتب: {emp[3]} | الرصيد الحالي: {emp[4]}")
+            printed += len(page)
+        
+        if not printed:
             print("لا يوجد موظفين مسجلين!")
-            return
-        
-        print("\nقائمة الموظفين:")
-        for emp in employees:
-            print(f"ID: {emp[0]} | الاسم: {emp[1]} | الوظيفة: {emp[2]} | الراتب: {emp[3]} | الرصيد الحالي: {emp[4]}")
+        return printed
     
-    def deduct_from_salary(self, emp_id, amount, reason):
-        if not self.auth.has_permission('can_deduct_salary'):
-            print("ليس لديك صلاحية لاستقطاع من الرواتب!")
+    def deduct_from_salary(self, emp_id, amount, reason, session=None, out=None):
+        session = self._session(session)
+        if not self.auth.has_permission('can_deduct_salary', session):
+            print("ليس لديك صلاحية لاستقطاع من الرواتب!", file=out)
             return False
         
-        employee = self.db.execute_query(
-            "SELECT name, current_balance FROM employees WHERE emp_id = ?",
-            (emp_id,), fetchone
-        )
-        
-        if not employee:
-            print("رقم الموظف غير صحيح!")
+        # مبلغ سالب أو صفر أو nan/inf يمر من شرط الرصيد فيزيد الرصيد أو يفسده بدل أن يخصم منه
+        if not math.isfinite(amount) or amount <= 0:
+            print("المبلغ المراد استقطاعه يجب أن يكون رقماً موجباً!", file=out)
             return False
         
-        name, current_balance = employee
-        if amount > current_balance:
-            print("المبلغ المطلوب استقطاعه أكبر من الرصيد المتاح!")
-            return False
-        
-        new_balance = current_balance - amount
-        
-        # تحديث رصيد الموظف
-        self.db.execute_query(
-            "UPDATE employees SET current_balance = ?, deductions = deductions + ? WHERE emp_id = ?",
-            (new_balance, amount, emp_id)
-        )
-        
-        # تسجيل عملية الاستقطاع
-        self.db.execute_query(
-            '''INSERT INTO deductions 
-            (emp_id, amount, reason, created_by, created_at)
-            VALUES (?, ?, ?, ?, ?)''',
-            (emp_id, amount, reason, self.auth.current_user['username'], str(datetime.now)))
-        
-        # إرسال إشعار للموظف
-        user_email = self.db.execute_query(
-            "SELECT email FROM users WHERE username = ?",
-            (f"{emp_id}_user",), fetchone
-        )
+        # الخصم المشروط وتسجيل الاستقطاع في معاملة واحدة
+        with self.db.transaction():
+            employee = self.db.execute_query(
+                DEDUCT_BALANCE_QUERY, (amount, amount, emp_id, amount), fetchone=True
+            )
+            
+            if not employee:
+                # لم يُحدَّث شيء: إما أن الموظف غير موجود أو أن رصيده لا يكفي
+                if self.db.execute_query("SELECT 1 FROM employees WHERE emp_id = ?", (emp_id,), fetchone=True):
+                    print("المبلغ المطلوب استقطاعه أكبر من الرصيد المتاح!", file=out)
+                else:
+                    print("رقم الموظف غير صحيح!", file=out)
+                return False
+            
+            name, position, new_balance = employee
+            
+            # تسجيل عملية الاستقطاع وإضافتها إلى ملخص التقارير
+            created_by = session.username
+            created_at = str(datetime.now())
+            self.db.execute_query(
+                '''INSERT INTO deductions 
+                (emp_id, amount, reason, created_by, created_at)
+                VALUES (?, ?, ?, ?, ?)''',
+                (emp_id, amount, reason, created_by, created_at))
+            reports.record_deduction(self.db, created_at, reason, position, created_by, amount)
         
-        if user_email:
+            # إشعار الموظف يُجمع مع إشعاراته الأخرى في مهلة التجميع أو مع دفعة الراتب التالية
             subject = "تم استقطاع من راتبك"
             body = f"مرحباً {name},\n\nتم استقطاع مبلغ {amount} من راتبك.\nالسبب: {reason}\n\nالرصيد الحالي: {new_balance}"
-            self.notifier.send_email(user_email[0], subject, body)
+            self.notifier.notify_users([(f"{emp_id}_user", subject, body)], digest=True)
         
-        print(f"تم استقطاع {amount} من راتب الموظف {name}. الرصيد المتبقي: {new_balance}")
+        self.audit.record(session.username, 'deduction', emp_id, amount=amount, reason=reason, balance=new_balance)
+        print(f"تم استقطاع {amount} من راتب الموظف {name}. الرصيد المتبقي: {new_balance}", file=out)
         return True
     
-    def pay_salary(self, emp_id):
-        if not self.auth.has_permission('can_pay_salary'):
-            print("ليس لديك صلاحية لدفع الرواتب!")
+    def pay_salary(self, emp_id, session=None, out=None):
+        session = self._session(session)
+        if not self.auth.has_permission('can_pay_salary', session):
+            print("ليس لديك صلاحية لدفع الرواتب!", file=out)
             return False
         
-        employee = self.db.execute_query(
-            "SELECT name, salary FROM employees WHERE emp_id = ?",
-            (emp_id,), fetchone
-        )
-        
-        if not employee:
-            print("رقم الموظف غير صحيح!")
-            return False
-        
-        name, salary = employee
-        
-        # تحديث رصيد الموظف
-        self.db.execute_query(
-            "UPDATE employees SET current_balance = ?, deductions = 0 WHERE emp_id = ?",
-            (salary, emp_id)
-        )
-        
-        # تسجيل عملية الدفع
-        self.db.execute_query(
-            '''INSERT INTO payments 
-            (emp_id, amount, created_by, created_at)
-            VALUES (?, ?, ?, ?)''',
-            (emp_id, salary, self.auth.current_user['username'], str(datetime.now)))
-        
-        # إرسال إشعار للموظف
-        user_email = self.db.execute_query(
-            "SELECT email FROM users WHERE username = ?",
-            (f"{emp_id}_user",), fetchone
-        )
+        with self.db.transaction():
+            # إعادة الرصيد إلى الراتب من قيمة الراتب المخزنة نفسها، لا من قراءة سابقة
+            employee = self.db.execute_query(PAY_BALANCE_QUERY, (emp_id,), fetchone=True)
+            
+            if not employee:
+                print("رقم الموظف غير صحيح!", file=out)
+                return False
+            
+            name, position, salary = employee
+            
+            # تسجيل عملية الدفع وإضافتها إلى ملخص التقارير
+            created_by = session.username
+            created_at = str(datetime.now())
+            self.db.execute_query(
+                '''INSERT INTO payments 
+                (emp_id, amount, created_by, created_at)
+                VALUES (?, ?, ?, ?)''',
+                (emp_id, salary, created_by, created_at))
+            reports.record_payments(self.db, created_at, created_by, [(position, salary)])
         
-        if user_email:
+            # إشعار الدفع يُرسل فوراً ويحمل معه إشعارات الاستقطاع المنتظرة للموظف في ملخص واحد
             subject = "تم دفع راتبك"
             body = f"مرحباً {name},\n\nتم دفع راتبك بالكامل.\n\nالمبلغ: {salary}"
-            self.notifier.send_email(user_email[0], subject, body)
+            self.notifier.notify_users([(f"{emp_id}_user", subject, body)], digest=True, delay=0)
         
-        print(f"تم دفع راتب الموظف {name} بالكامل. المبلغ: {salary}")
+        self.audit.record(session.username, 'salary_paid', emp_id, amount=salary)
+        print(f"تم دفع راتب الموظف {name} بالكامل. المبلغ: {salary}", file=out)
         return True
     
-    def get_employee_info(self, emp_id):
-        # الموظف العادي يمكنه فقط رؤية معلوماته الخاصة
-        if (self.auth.current_user['role'] == 'employee' and 
-            not emp_id.startswith(self.auth.current_user['username'])):
-            print("ليس لديك صلاحية لعرض معلومات هذا الموظف!")
-            return None
+    def pay_many(self, emp_ids=None, session=None):
+        # دفع رواتب مجموعة من الموظفين (أو جميعهم) في معاملة واحدة
+        session = self._session(session)
+        if not self.auth.has_permission('can_pay_salary', session):
+            print("ليس لديك صلاحية لدفع الرواتب!")
+            return 0
         
-        employee = self.db.execute_query(
-            "SELECT * FROM employees WHERE emp_id = ?",
-            (emp_id,), fetchone
+        paid_by = session.username
+        paid_at = str(datetime.now())
+        select_sql = (
+            "SELECT e.emp_id, e.name, e.salary, u.email, e.position FROM employees e "
+            "LEFT JOIN users u ON u.username = e.emp_id || '_user'"
         )
         
-        if not employee:
-            print("رقم الموظف غير صحيح!")
+        with self.db.transaction():
+            if emp_ids is None:
+                employees = self.db.execute_query(select_sql, fetchall=True)
+                self.db.execute_query("UPDATE employees SET current_balance = salary, deductions = 0")
+                self.db.execute_query(
+                    '''INSERT INTO payments (emp_id, amount, created_by, created_at)
+                    SELECT emp_id, salary, ?, ? FROM employees''',
+                    (paid_by, paid_at))
+                reports.record_pay_all(self.db, paid_at, paid_by)
+            else:
+                requested = list(dict.fromkeys(emp_ids))
+                employees = []
+                for start in range(0, len(requested), QUERY_CHUNK_SIZE):
+                    chunk = requested[start:start + QUERY_CHUNK_SIZE]
+                    placeholders = ','.join('?' * len(chunk))
+                    employees.extend(self.db.execute_query(
+                        f"{select_sql} WHERE e.emp_id IN ({placeholders})", chunk, fetchall=True))
+                
+                found = {emp[0] for emp in employees}
+                for emp_id in requested:
+                    if emp_id not in found:
+                        print(f"رقم الموظف غير صحيح: {emp_id}")
+                
+                self.db.executemany(
+                    "UPDATE employees SET current_balance = salary, deductions = 0 WHERE emp_id = ?",
+                    [(emp[0],) for emp in employees])
+                self.db.executemany(
+                    '''INSERT INTO payments (emp_id, amount, created_by, created_at)
+                    VALUES (?, ?, ?, ?)''',
+                    [(emp[0], emp[2], paid_by, paid_at) for emp in employees])
+                reports.record_payments(self.db, paid_at, paid_by, [(emp[4], emp[2]) for emp in employees])
+            
+            # إضافة الإشعارات دفعة واحدة ضمن المعاملة نفسها؛ كل موظف يصله ملخص واحد للدفعة
+            # يضم إشعارات الاستقطاع التي لم تُرسل بعد
+            messages = [
+                (email, "تم دفع راتبك", f"مرحباً {name},\n\nتم دفع راتبك بالكامل.\n\nالمبلغ: {salary}")
+                for _, name, salary, email, _ in employees if email
+            ]
+            self.notifier.send_many(messages, digest=True, delay=0)
+        
+        # حدث واحد للدفعة كلها؛ تفاصيل كل موظف محفوظة في جدول payments
+        self.audit.record(paid_by, 'payroll_run', None, employees=len(employees),
+                          total=sum(emp[2] for emp in employees), scope='all' if emp_ids is None else 'selected')
+        print(f"تم دفع رواتب {len(employees)} موظف بنجاح.")
+        return len(employees)
+    
+    def pay_all(self, session=None):
+        return self.pay_many(session=session)
+    
+    def get_employee_info(self, emp_id, session=None, out=None):
+        session = self._session(session)
+        if not session:
+            print("يجب تسجيل الدخول أولاً!", file=out)
             return None
         
-        # فك تشفير الحساب البنكي
-        decrypted_account = decrypt_data(employee[4])
-        
-        emp_info = {
-            'emp_id': employee[0],
-            'name': employee[1],
-            'position': employee[2],
-            'salary': employee[3],
-            'bank_account': decrypted_account,
-            'current_balance': employee[5],
-            'deductions': employee[6],
-            'created_by': employee[7],
-            'created_at': employee[8]
-        }
-        
-        # الحصول على سجل الاستقطاعات
-        deductions = self.db.execute_query(
-            "SELECT amount, reason, created_by, created_at FROM deductions WHERE emp_id = ? ORDER BY created_at DESC",
-            (emp_id,), fetchall=True
-        )
+        # الموظف العادي يمكنه فقط رؤية معلوماته الخاصة
+        if (session.role == 'employee' and 
+            not emp_id.startswith(session.username)):
+            print("ليس لديك صلاحية لعرض معلومات هذا الموظف!", file=out)
+            return None
         
-        if deductions:
-            emp_info['deduction_history'] = []
-            for ded in deductions:
-                emp_info['deduction_history'].append({
-                    'amount': ded[0],
-                    'reason': ded[1],
-                    'by': ded[2],
-                    'at': ded[3]
-                })
-        
-        # الحصول على سجل المدفوعات
-        payments = self.db.execute_query(
-            "SELECT amount, created_by, created_at FROM payments WHERE emp_id = ? ORDER BY created_at DESC",
-            (emp_id,), fetchall=True
+        row = self.db.execute_query(
+            f"SELECT {Employee.COLUMNS} FROM employees WHERE emp_id = ?",
+            (emp_id,), fetchone=True
         )
         
-        if payments:
-            emp_info['payment_history'] = []
-            for pay in payments:
-                emp_info['payment_history'].append({
-                    'amount': pay[0],
-                    'by': pay[1],
-                    'at': pay[2]
-                })
+        if not row:
+            print("رقم الموظف غير صحيح!", file=out)
+            return None
         
-        return emp_info
+        return Employee(self.db, *row)
 
 # الواجهات المختلفة
+def read_password(prompt):
+    # getpass يُستورد عند الحاجة فقط حتى لا يُبطئ أوامر سطر الأوامر التي لا تطلب كلمة مرور
+    import getpass
+    return getpass.getpass(prompt)
+
+def print_pages(pages, title, empty_message, describe, page_size=HISTORY_PAGE_SIZE):
+    shown = 0
+    for page in pages:
+        if not shown:
+            print(title)
+        for entry in page:
+            print(describe(entry))
+        shown += len(page)
+        
+        if len(page) == page_size and input("اضغط Enter للصفحة التالية أو q للعودة: ").strip().lower() == 'q':
+            break
+    
+    if not shown:
+        print(empty_message)
+
+def print_history(db, query, emp_id, title, empty_message, describe):
+    # السجل الحالي أولاً، والأرشيف لا يُفتح إلا إذا طلبه المستخدم
+    print_pages(iter_history(db, query, emp_id), title, empty_message, describe)
+    
+    from archive import archive_years
+    if archive_years(db.db_path) and input("عرض السجل الأقدم من الأرشيف؟ (y/n): ").strip().lower() == 'y':
+        print_pages(iter_history(db, query, emp_id, archived=True), "\nالسجل المؤرشف:",
+                    "لا يوجد سجل مؤرشف لهذا الموظف.", describe)
+
+def describe_deduction(ded):
+    return f"المبلغ: {ded.amount} | السبب: {ded.reason} | بواسطة: {ded.by} | في: {ded.at}"
+
+def describe_payment(pay):
+    return f"المبلغ: {pay.amount} | بواسطة: {pay.by} | في: {pay.at}"
+
 def admin_menu(db, auth, emp_manager):
     while True:
         print("\nلوحة المدير العام:")
@@ -523,7 +1168,7 @@ def admin_menu(db, auth, emp_manager):
         
         if choice == '1':
             username = input("ادخل اسم المستخدم الجديد: ")
-            password = getpass.getpass("ادخل كلمة المرور: ")
+            password = read_password("ادخل كلمة المرور: ")
             email = input("ادخل البريد الإلكتروني: ")
             role = input("ادخل الصلاحية (admin/hr_manager/finance_manager/department_manager/employee): ")
             auth.register(username, password, email, role)
@@ -540,18 +1185,15 @@ def admin_menu(db, auth, emp_manager):
             action = input("1. تعطيل الحساب\n2. تفعيل الحساب\nاختر الإجراء: ")
             
             if action == '1':
-                db.execute_query("UPDATE users SET is_active = 0 WHERE username = ?", (username,))
+                auth.set_user_active(username, False)
                 print("تم تعطيل الحساب بنجاح!")
             elif action == '2':
-                db.execute_query("UPDATE users SET is_active = 1, failed_attempts = 0 WHERE username = ?", (username,))
+                auth.set_user_active(username, True)
                 print("تم تفعيل الحساب بنجاح!")
         
         elif choice == '4':
             role = input("ادخل الصلاحية التي تريد تعديلها: ")
-            permissions = db.execute_query(
-                "SELECT can_add_employee, can_deduct_salary, can_pay_salary, can_view_all_employees, can_manage_users FROM permissions WHERE role = ?",
-                (role,), fetchone
-            )
+            permissions = auth.get_role_permissions(role)
             
             if not permissions:
                 print("الصلاحية غير موجودة!")
@@ -567,18 +1209,10 @@ def admin_menu(db, auth, emp_manager):
             perm_choice = input("اختر رقم الصلاحية لتعديلها (أو اتركه فارغاً للعودة): ")
             
             if perm_choice in ['1', '2', '3', '4', '5']:
-                column = [
-                    'can_add_employee',
-                    'can_deduct_salary',
-                    'can_pay_salary',
-                    'can_view_all_employees',
-                    'can_manage_users'
-                ][int(perm_choice)-1]
+                column = PERMISSION_COLUMNS[int(perm_choice)-1]
                 
                 new_value = not permissions[int(perm_choice)-1]
-                db.execute_query
-                    
-            
+                auth.set_permission(role, column, new_value)
                 
                 print(f"تم تحديث صلاحية {column} إلى {'نعم' if new_value else 'لا'}")
         
@@ -594,7 +1228,8 @@ def hr_manager_menu(db, auth, emp_manager):
         print("1. إضافة موظف جديد")
         print("2. عرض قائمة الموظفين")
         print("3. عرض معلومات موظف")
-        print("4. العودة للقائمة الرئيسية")
+        print("4. استيراد موظفين من ملف (CSV / JSONL)")
+        print("5. العودة للقائمة الرئيسية")
         
         choice = input("اختر الخيار: ")
         
@@ -607,20 +1242,59 @@ def hr_manager_menu(db, auth, emp_manager):
             emp_manager.add_employee(emp_id, name, position, salary, bank_account)
         
         elif choice == '2':
-            emp_manager.list_employees()
+            position = input("تصفية حسب الوظيفة (اتركه فارغاً للكل): ").strip() or None
+            min_balance = input("أقل رصيد (اختياري): ").strip()
+            max_balance = input("أعلى رصيد (اختياري): ").strip()
+            created_by = input("تصفية حسب المُنشئ (اختياري): ").strip() or None
+            
+            pages = emp_manager.iter_employees(
+                position=position,
+                min_balance=float(min_balance) if min_balance else None,
+                max_balance=float(max_balance) if max_balance else None,
+                created_by=created_by
+            )
+            if pages is None:
+                continue
+            
+            shown = 0
+            for page in pages:
+                if not shown:
+                    print("\nقائمة الموظفين:")
+                for emp in page:
+                    print(f"ID: {emp[0]} | الاسم: {emp[1]} | الوظيفة: {emp[2]} | الراتب: {emp[3]} | الرصيد الحالي: {emp[4]}")
+                shown += len(page)
+                
+                if len(page) == EMPLOYEE_PAGE_SIZE and input("اضغط Enter للصفحة التالية أو q للعودة: ").strip().lower() == 'q':
+                    break
+            
+            if not shown:
+                print("لا يوجد موظفين مطابقين!")
         
         elif choice == '3':
             emp_id = input("ادخل رقم الموظف: ")
             emp_info = emp_manager.get_employee_info(emp_id)
             if emp_info:
                 print("\nمعلومات الموظف:")
-                print(f"الاسم: {emp_info['name']}")
-                print(f"الوظيفة: {emp_info['position']}")
-                print(f"الراتب: {emp_info['salary']}")
-                print(f"الرصيد الحالي: {emp_info['current_balance']}")
-                print(f"إجمالي الاستقطاعات: {emp_info['deductions']}")
+                print(f"الاسم: {emp_info.name}")
+                print(f"الوظيفة: {emp_info.position}")
+                print(f"الراتب: {emp_info.salary}")
+                print(f"الرصيد الحالي: {emp_info.current_balance}")
+                print(f"إجمالي الاستقطاعات: {emp_info.deductions}")
         
         elif choice == '4':
+            path = input("ادخل مسار الملف: ").strip()
+            if not os.path.isfile(path):
+                print("الملف غير موجود!")
+                continue
+            
+            from importer import EmployeeImporter
+            summary = EmployeeImporter(emp_manager).import_file(path)
+            if summary:
+                print(f"تم استيراد {summary['imported']} موظف.")
+                if summary['rejected']:
+                    print(f"تم رفض {summary['rejected']} صف، التفاصيل في {summary['rejects_path']}")
+        
+        elif choice == '5':
             break
         
         else:
@@ -631,9 +1305,12 @@ def finance_manager_menu(db, auth, emp_manager):
         print("\nلوحة مدير المالية:")
         print("1. استقطاع من راتب موظف")
         print("2. دفع راتب موظف")
-        print("3. عرض سجل الاستقطاعات")
-        print("4. عرض سجل المدفوعات")
-        print("5. العودة للقائمة الرئيسية")
+        print("3. دفع رواتب جميع الموظفين")
+        print("4. عرض سجل الاستقطاعات")
+        print("5. عرض سجل المدفوعات")
+        print("6. تقارير الرواتب")
+        print("7. تصدير المدفوعات أو الاستقطاعات إلى ملف")
+        print("8. العودة للقائمة الرئيسية")
         
         choice = input("اختر الخيار: ")
         
@@ -648,41 +1325,70 @@ def finance_manager_menu(db, auth, emp_manager):
             emp_manager.pay_salary(emp_id)
         
         elif choice == '3':
-            emp_id = input("ادخل رقم الموظف: ")
-            deductions = db.execute_query(
-                "SELECT amount, reason, created_by, created_at FROM deductions WHERE emp_id = ? ORDER BY created_at DESC",
-                (emp_id,), fetchall=True
-            )
-            
-            if deductions:
-                print("\nسجل الاستقطاعات:")
-                for ded in deductions:
-                    print(f"المبلغ: {ded[0]} | السبب: {ded[1]} | بواسطة: {ded[2]} | في: {ded[3]}")
-            else:
-                print("لا يوجد استقطاعات مسجلة لهذا الموظف.")
+            emp_manager.pay_all()
         
         elif choice == '4':
             emp_id = input("ادخل رقم الموظف: ")
-            payments = db.execute_query(
-                "SELECT amount, created_by, created_at FROM payments WHERE emp_id = ? ORDER BY created_at DESC",
-                (emp_id,), fetchall=True
-            )
+            print_history(db, DEDUCTION_HISTORY_QUERY, emp_id, "\nسجل الاستقطاعات:",
+                          "لا يوجد استقطاعات مسجلة لهذا الموظف.", describe_deduction)
+        
+        elif choice == '5':
+            emp_id = input("ادخل رقم الموظف: ")
+            print_history(db, PAYMENT_HISTORY_QUERY, emp_id, "\nسجل المدفوعات:",
+                          "لا يوجد مدفوعات مسجلة لهذا الموظف.", describe_payment)
+        
+        elif choice == '6':
+            kind = 'payments' if input("1. الاستقطاعات\n2. المدفوعات\nاختر النوع: ") == '2' else 'deductions'
+            dimensions = ['month', 'reason', 'position', 'operator'] if kind == 'deductions' else ['month', 'position', 'operator']
+            labels = {'month': 'الشهر', 'reason': 'السبب', 'position': 'الوظيفة', 'operator': 'المنفذ'}
+            for index, dimension in enumerate(dimensions, 1):
+                print(f"{index}. حسب {labels[dimension]}")
+            dim_choice = input("اختر التجميع: ")
+            if not dim_choice.isdigit() or not 1 <= int(dim_choice) <= len(dimensions):
+                print("اختيار غير صحيح!")
+                continue
             
-            if payments:
-                print("\nسجل المدفوعات:")
-                for pay in payments:
-                    print(f"المبلغ: {pay[0]} | بواسطة: {pay[1]} | في: {pay[2]}")
+            dimension = dimensions[int(dim_choice) - 1]
+            start = input("من شهر (YYYY-MM، اختياري): ").strip() or None
+            end = input("إلى شهر (YYYY-MM، اختياري): ").strip() or None
+            rows = reports.PayrollReports(db).totals(kind, dimension, start, end)
+            
+            if rows:
+                print(f"\nالتقرير حسب {labels[dimension]}:")
+                for key, total, entries in rows:
+                    print(f"{key} | الإجمالي: {total:.2f} | عدد العمليات: {entries}")
             else:
-                print("لا يوجد مدفوعات مسجلة لهذا الموظف.")
+                print("لا توجد بيانات في هذه الفترة.")
+        
+        elif choice == '7':
+            kind = 'payments' if input("1. الاستقطاعات\n2. المدفوعات\nاختر النوع: ") == '2' else 'deductions'
+            formats = ['csv', 'jsonl', 'bank'] if kind == 'payments' else ['csv', 'jsonl']
+            file_format = input(f"الصيغة ({' / '.join(formats)}): ").strip().lower() or 'csv'
+            if file_format not in formats:
+                print("صيغة غير صحيحة!")
+                continue
+            
+            path = input("مسار ملف التصدير (أضف .gz للضغط): ").strip()
+            start = input("من تاريخ (YYYY-MM-DD، اختياري): ").strip() or None
+            end = input("حتى تاريخ غير شامل (YYYY-MM-DD، اختياري): ").strip() or None
+            emp_ids = input("أرقام الموظفين مفصولة بفواصل (اتركه فارغاً للكل): ").strip()
+            
+            from exporter import PayrollExporter
+            result = PayrollExporter(emp_manager).export(
+                kind, path, file_format, start, end,
+                [emp_id.strip() for emp_id in emp_ids.split(',') if emp_id.strip()] if emp_ids else None
+            )
+            if result:
+                print(f"تم تصدير {result['rows']} سجل بإجمالي {result['total']} إلى {result['path']}")
         
-        elif choice == '5':
+        elif choice == '8':
             break
         
         else:
             print("اختيار غير صحيح!")
 
 def employee_menu(db, auth, emp_manager):
-    emp_id = f"{auth.current_user['username']}_emp"
+    emp_id = f"{auth.current_session.username}_emp"
     
     while True:
         print("\nلوحة الموظف:")
@@ -696,21 +1402,19 @@ def employee_menu(db, auth, emp_manager):
             emp_info = emp_manager.get_employee_info(emp_id)
             if emp_info:
                 print("\nمعلومات الموظف:")
-                print(f"الاسم: {emp_info['name']}")
-                print(f"الوظيفة: {emp_info['position']}")
-                print(f"الراتب: {emp_info['salary']}")
-                print(f"الرصيد الحالي: {emp_info['current_balance']}")
-                print(f"إجمالي الاستقطاعات: {emp_info['deductions']}")
+                print(f"الاسم: {emp_info.name}")
+                print(f"الوظيفة: {emp_info.position}")
+                print(f"الراتب: {emp_info.salary}")
+                print(f"الرصيد الحالي: {emp_info.current_balance}")
+                print(f"إجمالي الاستقطاعات: {emp_info.deductions}")
                 
-                if 'deduction_history' in emp_info:
-                    print("\nسجل الاستقطاعات:")
-                    for ded in emp_info['deduction_history']:
-                        print(f"المبلغ: {ded['amount']} | السبب: {ded['reason']} | بواسطة: {ded['by']} | في: {ded['at']}")
+                print_history(db, DEDUCTION_HISTORY_QUERY, emp_info.emp_id, "\nسجل الاستقطاعات:",
+                              "لا يوجد استقطاعات مسجلة.", describe_deduction)
         
         elif choice == '2':
-            old_password = getpass.getpass("ادخل كلمة المرور الحالية: ")
-            new_password = getpass.getpass("ادخل كلمة المرور الجديدة: ")
-            confirm_password = getpass.getpass("أعد إدخال كلمة المرور الجديدة: ")
+            old_password = read_password("ادخل كلمة المرور الحالية: ")
+            new_password = read_password("ادخل كلمة المرور الجديدة: ")
+            confirm_password = read_password("أعد إدخال كلمة المرور الجديدة: ")
             
             if new_password != confirm_password:
                 print("كلمة المرور الجديدة غير متطابقة!")
@@ -719,14 +1423,14 @@ def employee_menu(db, auth, emp_manager):
             # التحقق من كلمة المرور الحالية
             user = db.execute_query(
                 "SELECT password FROM users WHERE username = ?",
-                (auth.current_user['username'],), fetchone
+                (auth.current_session.username,), fetchone=True
             )
             
-            if user and user[0] == auth.hash_password(old_password):
+            if user and auth.verify_password(old_password, user[0]):
                 hashed_pw = auth.hash_password(new_password)
                 db.execute_query(
                     "UPDATE users SET password = ? WHERE username = ?",
-                    (hashed_pw, auth.current_user['username'])
+                    (hashed_pw, auth.current_session.username)
                 )
                 print("تم تغيير كلمة المرور بنجاح!")
             else:
@@ -738,18 +1442,209 @@ def employee_menu(db, auth, emp_manager):
         else:
             print("اختيار غير صحيح!")
 
+# واجهة سطر الأوامر للمهام غير التفاعلية (cron والسكربتات)
+ROLES = tuple(DEFAULT_ROLE_PERMISSIONS)
+
+def build_parser():
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description='نظام إدارة الموظفين. بدون أوامر تعمل الواجهة التفاعلية.',
+        epilog='كلمة المرور تُقرأ من EMPLOYEE_PASSWORD أو تُطلب، والرمز من EMPLOYEE_SERVICE_TOKEN.'
+    )
+    parser.add_argument('--user', default=os.getenv('EMPLOYEE_USER'), help='اسم المستخدم')
+    parser.add_argument('--token', default=os.getenv('EMPLOYEE_SERVICE_TOKEN'), help='رمز خدمة بدل كلمة المرور')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    commands.add_parser('pay-all', help='دفع رواتب جميع الموظفين')
+    
+    deduct = commands.add_parser('deduct', help='استقطاع مبلغ من راتب موظف')
+    deduct.add_argument('emp_id')
+    deduct.add_argument('amount', type=float)
+    deduct.add_argument('reason')
+    
+    import_cmd = commands.add_parser('import', help='استيراد موظفين من ملف CSV أو JSONL')
+    import_cmd.add_argument('path')
+    import_cmd.add_argument('--format', choices=('csv', 'jsonl'))
+    import_cmd.add_argument('--rejects', help='ملف الصفوف المرفوضة')
+    
+    export = commands.add_parser('export', help='تصدير المدفوعات أو الاستقطاعات')
+    export.add_argument('kind', choices=('payments', 'deductions'))
+    export.add_argument('path', help='ملف الناتج (.gz للضغط)')
+    export.add_argument('--format', choices=('csv', 'jsonl', 'bank'), default='csv')
+    export.add_argument('--start', help='من تاريخ YYYY-MM-DD')
+    export.add_argument('--end', help='حتى تاريخ YYYY-MM-DD (غير شامل)')
+    export.add_argument('--emp', action='append', help='رقم موظف (يمكن تكراره)')
+    
+    report = commands.add_parser('report', help='تقرير إجماليات بصيغة JSON Lines')
+    report.add_argument('kind', choices=('payments', 'deductions'))
+    report.add_argument('--by', choices=tuple(reports.DIMENSIONS), default='month')
+    report.add_argument('--start', help='من شهر YYYY-MM')
+    report.add_argument('--end', help='إلى شهر YYYY-MM')
+    
+    commands.add_parser('send-mail', help='إرسال رسائل صندوق الصادر المستحقة ثم الخروج')
+    
+    archive = commands.add_parser('archive', help='نقل سجلات الأشهر المغلقة إلى ملفات الأرشيف السنوية')
+    archive.add_argument('--before', help='أول شهر يبقى في القاعدة الرئيسية YYYY-MM (افتراضياً قبل 12 شهراً)')
+    
+    audit = commands.add_parser('audit', help='عرض سجل التدقيق بصيغة JSON Lines (الأحدث أولاً)')
+    audit.add_argument('--actor')
+    audit.add_argument('--action')
+    audit.add_argument('--target')
+    audit.add_argument('--since', help='من تاريخ YYYY-MM-DD')
+    audit.add_argument('--until', help='حتى تاريخ YYYY-MM-DD (غير شامل)')
+    audit.add_argument('--limit', type=int, default=100)
+    
+    user = commands.add_parser('user', help='إدارة المستخدمين')
+    user_commands = user.add_subparsers(dest='user_command', required=True)
+    user_add = user_commands.add_parser('add', help='إضافة مستخدم')
+    user_add.add_argument('username')
+    user_add.add_argument('--email', required=True)
+    user_add.add_argument('--role', choices=ROLES, default='employee')
+    user_add.add_argument('--password-stdin', action='store_true', help='قراءة كلمة مرور المستخدم الجديد من المدخل القياسي')
+    user_token = user_commands.add_parser('token', help='إنشاء رمز خدمة لمستخدم')
+    user_token.add_argument('username')
+    
+    db_cmd = commands.add_parser('db', help='صيانة قاعدة البيانات (بدون تسجيل دخول)')
+    db_commands = db_cmd.add_subparsers(dest='db_command', required=True)
+    db_commands.add_parser('check', help='إنشاء المخطط أو ترقيته ثم التحقق من أن الاستعلامات المتكررة تستخدم فهارسها')
+    
+    return parser
+
+def authenticate(auth, args):
+    if args.token:
+        return auth.login_with_token(args.token)
+    if args.user:
+        password = os.getenv('EMPLOYEE_PASSWORD') or read_password("كلمة المرور: ")
+        return auth.login(args.user, password)
+    print("يجب تحديد --user أو --token!", file=sys.stderr)
+    return False
+
+def run_command(args, db, auth, emp_manager):
+    if args.command == 'db':
+        try:
+            db.check_query_plans()
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            return False
+        print(f"مخطط قاعدة البيانات بالإصدار {SCHEMA_VERSION}، وكل الاستعلامات المتكررة ({len(HOT_QUERIES)}) تستخدم فهارسها.")
+        return True
+    
+    if args.command == 'pay-all':
+        return emp_manager.pay_all()
+    
+    if args.command == 'deduct':
+        return emp_manager.deduct_from_salary(args.emp_id, args.amount, args.reason)
+    
+    if args.command == 'import':
+        from importer import EmployeeImporter
+        summary = EmployeeImporter(emp_manager).import_file(args.path, args.rejects, args.format)
+        if summary:
+            print(f"تم استيراد {summary['imported']} موظف، ورفض {summary['rejected']} صف.")
+        return summary is not None
+    
+    if args.command == 'export':
+        from exporter import PayrollExporter
+        result = PayrollExporter(emp_manager).export(args.kind, args.path, args.format, args.start, args.end, args.emp)
+        if result:
+            print(f"تم تصدير {result['rows']} سجل بإجمالي {result['total']} إلى {result['path']}")
+        return result is not None
+    
+    if args.command == 'report':
+        import json
+        permission = 'can_pay_salary' if args.kind == 'payments' else 'can_deduct_salary'
+        if not auth.has_permission(permission):
+            print("ليس لديك صلاحية لعرض هذا التقرير!")
+            return False
+        for key, total, entries in reports.PayrollReports(db).totals(args.kind, args.by, args.start, args.end):
+            print(json.dumps({args.by: key, 'total': round(total, 2), 'entries': entries}, ensure_ascii=False))
+        return True
+    
+    if args.command == 'send-mail':
+        if not auth.has_permission('can_manage_users'):
+            print("ليس لديك صلاحية لإدارة البريد!")
+            return False
+        sender = mail_sender()
+        try:
+            sent = OutboxWorkerPool(db, sender).drain()
+        finally:
+            sender.close()
+        print(f"تمت معالجة {sent} رسالة من صندوق الصادر.")
+        return True
+    
+    if args.command == 'archive':
+        from archive import PayrollArchiver
+        summary = PayrollArchiver(emp_manager).archive(args.before)
+        if summary:
+            print(f"تمت أرشفة {summary['deductions']} استقطاع و{summary['payments']} دفعة قبل {summary['before']}.")
+        return summary is not None
+    
+    if args.command == 'audit':
+        import json
+        if not auth.has_permission('can_manage_users'):
+            print("ليس لديك صلاحية لعرض سجل التدقيق!")
+            return False
+        for event in auth.audit.events(args.actor, args.action, args.target, args.since, args.until, args.limit):
+            print(json.dumps(event._asdict(), ensure_ascii=False))
+        return True
+    
+    if args.user_command == 'add':
+        if auth.current_session and not auth.has_permission('can_manage_users'):
+            print("ليس لديك صلاحية لإدارة المستخدمين!")
+            return False
+        if args.password_stdin:
+            password = sys.stdin.readline().rstrip('\n')
+        else:
+            password = read_password("كلمة مرور المستخدم الجديد: ")
+        if not password:
+            print("كلمة المرور مطلوبة!")
+            return False
+        return auth.register(args.username, password, args.email, args.role)
+    
+    token = auth.create_service_token(args.username)
+    if token:
+        print(token)
+    return token is not None
+
+def run_cli(argv):
+    args = build_parser().parse_args(argv)
+    
+    db = DatabaseManager()
+    try:
+        notifier = Outbox(db)
+        auth = AuthenticationSystem(db, notifier)
+        emp_manager = EmployeeManager(db, auth, notifier)
+        
+        # أول مستخدم في قاعدة بيانات جديدة يُنشأ بدون تسجيل دخول
+        bootstrap = (args.command == 'user' and args.user_command == 'add'
+                     and not db.execute_query("SELECT 1 FROM users LIMIT 1", fetchone=True))
+        # فحص قاعدة البيانات لا يقرأ بيانات المستخدمين، فيعمل في سكربتات النشر بلا حساب
+        if not bootstrap and args.command != 'db' and not authenticate(auth, args):
+            return 1
+        return 0 if run_command(args, db, auth, emp_manager) else 1
+    finally:
+        db.close()
+
 def main():
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+    
     db = DatabaseManager()
-    notifier = NotificationSystem()
+    notifier = Outbox(db)
     auth = AuthenticationSystem(db, notifier)
     emp_manager = EmployeeManager(db, auth, notifier)
     
+    # عمال الخلفية يرسلون رسائل صندوق الصادر حتى لا تنتظر العمليات خادم البريد
+    sender = mail_sender()
+    mail_workers = OutboxWorkerPool(db, sender)
+    mail_workers.start()
+    
     # إنشاء مستخدم مدير افتراضي إذا لم يكن موجوداً
 
 
     
     while True:
-        if not auth.current_user:
+        if not auth.current_session:
             print("\nنظام إدارة الموظفين - تسجيل الدخول")
             print("1. تسجيل الدخول")
             print("2. استعادة كلمة المرور")
@@ -759,7 +1654,7 @@ def main():
             
             if choice == '1':
                 username = input("اسم المستخدم: ")
-                password = getpass.getpass("كلمة المرور: ")
+                password = read_password("كلمة المرور: ")
                 auth.login(username, password)
             
             elif choice == '2':
@@ -768,18 +1663,20 @@ def main():
             
             elif choice == '3':
                 print("شكراً لاستخدامك النظام. إلى اللقاء!")
+                mail_workers.stop()
+                sender.close()
                 break
             
             else:
                 print("اختيار غير صحيح!")
         else:
-            if auth.current_user['role'] == 'admin':
+            if auth.current_session.role == 'admin':
                 admin_menu(db, auth, emp_manager)
-            elif auth.current_user['role'] == 'hr_manager':
+            elif auth.current_session.role == 'hr_manager':
                 hr_manager_menu(db, auth, emp_manager)
-            elif auth.current_user['role'] == 'finance_manager':
+            elif auth.current_session.role == 'finance_manager':
                 finance_manager_menu(db, auth, emp_manager)
-            elif auth.current_user['role'] == 'employee':
+            elif auth.current_session.role == 'employee':
                 employee_menu(db, auth, emp_manager)
             else:
                 print("صلاحيتك غير معروفة!")
@@ -0,0 +1,36 @@
+"""
+نقطة الدخول لنظام إدارة الموظفين
+
+اسم الملف الرئيسي لا يصلح للاستيراد المباشر، وعند تشغيله كسكربت يُترجم كاملاً في كل مرة
+لأن بايتكود السكربت الرئيسي لا يُحفظ. هذا الملف يحمّله كوحدة فيُحفظ البايتكود في
+__pycache__ ويبدأ كل أمر أسرع، لذلك يُفضّل استخدامه في cron والسكربتات:
+
+    python employees.py --token "$TOKEN" report payments
+    python employees.py db check
+"""
+import importlib.util
+import os
+import sys
+
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deepseek_python_20250602_762869 (1).py')
+
+
+def load_app():
+    """تحميل الوحدة الرئيسية للنظام (اسم ملفها لا يصلح للاستيراد المباشر)"""
+    module = sys.modules.get('employee_management')
+    if module is not None:
+        return module
+    spec = importlib.util.spec_from_file_location('employee_management', APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['employee_management'] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules['employee_management']
+        raise
+    return module
+
+
+if __name__ == '__main__':
+    load_app().main()
@@ -0,0 +1,217 @@
+"""
+تصدير المدفوعات والاستقطاعات بذاكرة ثابتة
+
+تُقرأ السجلات من مؤشر قاعدة البيانات على دفعات وتُكتب مباشرة إلى الملف، فلا يُحمَّل
+السجل كاملاً في الذاكرة مهما كان حجمه. الصيغ المتاحة:
+    csv    جدول للمراجعين
+    jsonl  سطر JSON لكل سجل
+    bank   ملف صرف بعرض ثابت للبنك (للمدفوعات فقط)
+وإذا انتهى اسم الملف بـ .gz يُضغط الناتج بـ gzip أثناء الكتابة.
+
+ملفات الأرشيف السنوية (archive.py) التي تقع في الفترة المطلوبة تُقرأ أولاً ثم السجل الحالي.
+"""
+import csv
+import gzip
+import json
+import os
+from datetime import datetime
+
+from archive import iter_archives
+from crypto import decrypt_many
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+# emp_id داخل IN (...) على دفعات لا تتجاوز حد متغيرات SQLite
+EMPLOYEE_FILTER_CHUNK = 500
+
+COLUMNS = {
+    'payments': ('id', 'emp_id', 'name', 'amount', 'created_by', 'created_at'),
+    'deductions': ('id', 'emp_id', 'name', 'amount', 'reason', 'created_by', 'created_at'),
+}
+
+QUERIES = {
+    'payments': '''SELECT p.id, p.emp_id, e.name, p.amount, p.created_by, p.created_at, e.bank_account
+        FROM {schema}payments p LEFT JOIN main.employees e ON e.emp_id = p.emp_id {where} ORDER BY {order}''',
+    'deductions': '''SELECT d.id, d.emp_id, e.name, d.amount, d.reason, d.created_by, d.created_at, e.bank_account
+        FROM {schema}deductions d LEFT JOIN main.employees e ON e.emp_id = d.emp_id {where} ORDER BY {order}''',
+}
+
+PERMISSIONS = {
+    'payments': 'can_pay_salary',
+    'deductions': 'can_deduct_salary',
+}
+
+# تخطيط سجل الصرف: (الحقل، العرض)
+BANK_LAYOUT = (
+    ('record_type', 1),
+    ('emp_id', 12),
+    ('name', 35),
+    ('bank_account', 34),
+    ('amount', 15),
+    ('date', 8),
+)
+
+
+def open_output(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+class CSVWriter:
+    def __init__(self, f, kind):
+        self.writer = csv.writer(f)
+        self.writer.writerow(COLUMNS[kind])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self, count, total):
+        pass
+
+
+class JSONLinesWriter:
+    def __init__(self, f, kind):
+        self.f = f
+        self.columns = COLUMNS[kind]
+
+    def write(self, rows):
+        self.f.writelines(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + '\n' for row in rows)
+
+    def close(self, count, total):
+        pass
+
+
+class BankFileWriter:
+    """
+    ملف صرف بعرض ثابت: سجل رأس H، سجل D لكل دفعة، وسجل ختام T بالعدد والإجمالي
+
+    المبالغ بالهللات بدون فاصلة عشرية، والعرض محسوب بالأحرف لا بالبايتات.
+    """
+
+    def __init__(self, f, kind):
+        if kind != 'payments':
+            raise ValueError("ملف البنك متاح للمدفوعات فقط")
+        self.f = f
+        self.f.write(self._record('H', os.getenv('COMPANY_NAME', ''), datetime.now().strftime('%Y%m%d')))
+
+    @staticmethod
+    def _field(value, width, numeric=False):
+        value = str(value)[:width]
+        return value.rjust(width, '0') if numeric else value.ljust(width)
+
+    def _record(self, record_type, *fields):
+        return record_type + ''.join(self._field(value, 40) for value in fields).rstrip() + '\n'
+
+    def write(self, rows):
+        lines = []
+        for _, emp_id, name, amount, _, created_at, bank_account in rows:
+            values = ('D', emp_id, name or '', bank_account, round(amount * 100), created_at[:10].replace('-', ''))
+            lines.append(''.join(
+                self._field(value, width, numeric=field == 'amount')
+                for (field, width), value in zip(BANK_LAYOUT, values)
+            ) + '\n')
+        self.f.writelines(lines)
+
+    def close(self, count, total):
+        self.f.write('T' + self._field(count, 10, numeric=True) + self._field(round(total * 100), 18, numeric=True) + '\n')
+
+
+WRITERS = {
+    'csv': CSVWriter,
+    'jsonl': JSONLinesWriter,
+    'bank': BankFileWriter,
+}
+
+
+class PayrollExporter:
+    """
+    :param emp_manager: EmployeeManager (يوفر قاعدة البيانات والصلاحيات)
+    :param chunk_size: عدد السجلات المقروءة من المؤشر في كل دفعة
+    """
+
+    def __init__(self, emp_manager, chunk_size=EXPORT_CHUNK_SIZE):
+        self.emp_manager = emp_manager
+        self.db = emp_manager.db
+        self.chunk_size = chunk_size
+
+    def _chunks(self, kind, start, end, emp_ids):
+        # السنوات المؤرشفة من الأقدم، ثم السجل الحالي
+        for schema in iter_archives(self.db, start, end, newest_first=False):
+            yield from self._source_chunks(kind, schema, start, end, emp_ids)
+        yield from self._source_chunks(kind, '', start, end, emp_ids)
+
+    def _source_chunks(self, kind, schema, start, end, emp_ids):
+        alias = kind[0]
+        conditions = []
+        params = []
+        if start:
+            conditions.append(f"{alias}.created_at >= ?")
+            params.append(start)
+        if end:
+            conditions.append(f"{alias}.created_at < ?")
+            params.append(end)
+
+        if emp_ids is None:
+            # بدون تصفية بالموظفين نقرأ الجدول بترتيب الإدخال (rowid) فلا نحتاج فرزاً مؤقتاً
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            yield from self.db.iter_query(
+                QUERIES[kind].format(schema=schema, where=where, order=f"{alias}.id"), params, self.chunk_size
+            )
+            return
+
+        # مع قائمة موظفين نستخدم فهرس (emp_id, created_at) على دفعات من الأرقام
+        emp_ids = sorted(set(emp_ids))
+        for index in range(0, len(emp_ids), EMPLOYEE_FILTER_CHUNK):
+            chunk = emp_ids[index:index + EMPLOYEE_FILTER_CHUNK]
+            chunk_conditions = conditions + [f"{alias}.emp_id IN ({','.join('?' * len(chunk))})"]
+            yield from self.db.iter_query(
+                QUERIES[kind].format(
+                    schema=schema,
+                    where=f"WHERE {' AND '.join(chunk_conditions)}",
+                    order=f"{alias}.emp_id, {alias}.created_at"
+                ),
+                params + chunk, self.chunk_size
+            )
+
+    def export(self, kind, path, file_format='csv', start=None, end=None, emp_ids=None, session=None):
+        """
+        تصدير سجل المدفوعات أو الاستقطاعات إلى ملف
+
+        :param kind: payments أو deductions
+        :param file_format: csv أو jsonl أو bank
+        :param start: بداية الفترة (تاريخ بصيغة YYYY-MM-DD، شاملة)
+        :param end: نهاية الفترة (غير شاملة)
+        :param emp_ids: أرقام الموظفين المطلوبين (افتراضياً الجميع)
+        :param session: جلسة المستخدم المنفذ (افتراضياً الجلسة الحالية)
+        :return: قاموس بعدد السجلات وإجمالي المبالغ، أو None إن لم تكن هناك صلاحية
+        """
+        if kind not in QUERIES or file_format not in WRITERS:
+            raise ValueError(f"تصدير غير معروف: {kind}/{file_format}")
+        session = self.emp_manager._session(session)
+        if not self.emp_manager.auth.has_permission(PERMISSIONS[kind], session):
+            print("ليس لديك صلاحية لتصدير هذا السجل!")
+            return None
+
+        count = 0
+        total = 0.0
+        with open_output(path) as f:
+            writer = WRITERS[file_format](f, kind)
+            for rows in self._chunks(kind, start, end, emp_ids):
+                if file_format == 'bank':
+                    # فك تشفير الحسابات دفعة واحدة لكل مجموعة سجلات
+                    accounts = iter(decrypt_many([row[-1] for row in rows if row[-1]]))
+                    rows = [row[:-1] + (next(accounts) if row[-1] else '',) for row in rows]
+                else:
+                    # الحساب البنكي لا يخرج إلا في ملف البنك
+                    rows = [row[:-1] for row in rows]
+                writer.write(rows)
+                count += len(rows)
+                total += sum(row[3] for row in rows)
+            writer.close(count, total)
+
+        # ملف البنك يحمل الحسابات مفكوكة التشفير، فكل تصدير يُسجل
+        self.emp_manager.audit.record(session.username, 'export', path, kind=kind, format=file_format,
+                                      rows=count, start=start, end=end)
+        return {'rows': count, 'total': round(total, 2), 'path': path}
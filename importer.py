@@ -0,0 +1,184 @@
+"""
+استيراد الموظفين بالجملة من ملف CSV أو JSON Lines
+
+يُقرأ الملف سطراً بسطر وتُعالج الصفوف على دفعات: فحص الصلاحية مرة واحدة، فحص الأرقام
+الموجودة بسؤال واحد لكل دفعة، تشفير الحسابات البنكية دفعة واحدة، ثم الإدراج ورسائل
+الترحيب في معاملة واحدة لكل دفعة. الذاكرة المستخدمة ثابتة مهما كان حجم الملف.
+
+الأعمدة المطلوبة: emp_id, name, position, salary, bank_account
+الصفوف المرفوضة تُكتب مع سبب الرفض في ملف CSV منفصل.
+"""
+import csv
+import json
+import math
+import os
+from datetime import datetime
+
+
+REQUIRED_FIELDS = ('emp_id', 'name', 'position', 'salary', 'bank_account')
+IMPORT_CHUNK_SIZE = 500
+
+WELCOME_SUBJECT = "تمت إضافتك إلى نظام الموظفين"
+WELCOME_BODY = "مرحباً {name},\n\nتمت إضافتك إلى نظام إدارة الموظفين.\n\nالوظيفة: {position}\nالراتب: {salary}"
+
+
+def read_rows(path, file_format=None):
+    """
+    قراءة صفوف الملف واحداً تلو الآخر
+
+    :param file_format: csv أو jsonl (افتراضياً حسب امتداد الملف)
+    :return: مولد أزواج (رقم السطر، قاموس الصف أو None إن تعذرت قراءته)
+    """
+    file_format = file_format or ('jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_num, row if isinstance(row, dict) else None
+
+
+def validate_row(row):
+    """
+    التحقق من صف واحد وتحويل قيمه
+
+    :return: (emp_id, name, position, salary, bank_account)
+    :raises ValueError: برسالة سبب الرفض
+    """
+    if row is None:
+        raise ValueError("صف غير قابل للقراءة")
+
+    values = []
+    for field in REQUIRED_FIELDS:
+        value = row.get(field)
+        value = str(value).strip() if value is not None else ''
+        if not value:
+            raise ValueError(f"الحقل {field} مفقود")
+        values.append(value)
+
+    emp_id, name, position, salary, bank_account = values
+    try:
+        salary = float(salary)
+    except ValueError:
+        raise ValueError(f"راتب غير صحيح: {salary}")
+    # nan يُخزن NULL فيفشل إدراج الدفعة كلها، و inf لا معنى له كراتب
+    if not math.isfinite(salary) or salary <= 0:
+        raise ValueError(f"راتب غير صحيح: {salary}")
+
+    return emp_id, name, position, salary, bank_account
+
+
+class EmployeeImporter:
+    """
+    :param emp_manager: EmployeeManager (يوفر قاعدة البيانات والمستخدم الحالي والإشعارات والتشفير)
+    :param chunk_size: عدد الصفوف في كل معاملة
+    """
+
+    def __init__(self, emp_manager, chunk_size=IMPORT_CHUNK_SIZE):
+        self.emp_manager = emp_manager
+        self.db = emp_manager.db
+        self.chunk_size = chunk_size
+
+    def import_file(self, path, rejects_path=None, file_format=None, session=None):
+        """
+        استيراد ملف كامل
+
+        :param rejects_path: ملف الصفوف المرفوضة (افتراضياً <الملف>.rejects.csv)
+        :param session: جلسة المستخدم المنفذ (افتراضياً الجلسة الحالية)
+        :return: قاموس بعدد الصفوف المستوردة والمرفوضة، أو None إن لم تكن هناك صلاحية
+        """
+        session = session or self.emp_manager.auth.current_session
+        if not self.emp_manager.auth.has_permission('can_add_employee', session):
+            print("ليس لديك صلاحية لإضافة موظفين!")
+            return None
+
+        rejects_path = rejects_path or f"{os.path.splitext(path)[0]}.rejects.csv"
+        summary = {'imported': 0, 'rejected': 0, 'rejects_path': None}
+
+        with open(rejects_path, 'w', newline='', encoding='utf-8') as rejects_file:
+            rejects = csv.writer(rejects_file)
+            rejects.writerow(('line', 'error', 'row'))
+
+            def reject(line_num, error, row):
+                rejects.writerow((line_num, error, json.dumps(row, ensure_ascii=False)))
+                summary['rejected'] += 1
+
+            chunk = []
+            for line_num, row in read_rows(path, file_format):
+                try:
+                    chunk.append((line_num, row, validate_row(row)))
+                except ValueError as e:
+                    reject(line_num, str(e), row)
+                    continue
+
+                if len(chunk) >= self.chunk_size:
+                    summary['imported'] += self._import_chunk(chunk, reject, session.username)
+                    chunk = []
+            if chunk:
+                summary['imported'] += self._import_chunk(chunk, reject, session.username)
+
+        if summary['rejected']:
+            summary['rejects_path'] = rejects_path
+        else:
+            os.remove(rejects_path)
+        self.emp_manager.audit.record(session.username, 'employees_imported', path,
+                                      imported=summary['imported'], rejected=summary['rejected'])
+        return summary
+
+    def _import_chunk(self, chunk, reject, created_by):
+        created_at = str(datetime.now())
+
+        with self.db.transaction():
+            ids = [values[0] for _, _, values in chunk]
+            placeholders = ','.join('?' * len(ids))
+            existing = {
+                emp_id for emp_id, in self.db.execute_query(
+                    f"SELECT emp_id FROM employees WHERE emp_id IN ({placeholders})", ids, fetchall=True
+                )
+            }
+
+            accepted = []
+            for line_num, row, values in chunk:
+                if values[0] in existing:
+                    reject(line_num, "موظف بهذا الرقم موجود بالفعل", row)
+                    continue
+                # يمنع تكرار الرقم داخل الدفعة نفسها
+                existing.add(values[0])
+                accepted.append(values)
+            if not accepted:
+                return 0
+
+            encrypted_accounts = self.emp_manager.encrypt_accounts([values[4] for values in accepted])
+            self.db.executemany(
+                '''INSERT INTO employees
+                (emp_id, name, position, salary, bank_account, current_balance, created_by, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                [
+                    (emp_id, name, position, salary, account, salary, created_by, created_at)
+                    for (emp_id, name, position, salary, _), account in zip(accepted, encrypted_accounts)
+                ]
+            )
+
+            usernames = [f"{values[0]}_user" for values in accepted]
+            emails = dict(self.db.execute_query(
+                f"SELECT username, email FROM users WHERE username IN ({','.join('?' * len(usernames))})",
+                usernames, fetchall=True
+            ))
+            messages = [
+                (emails[f"{emp_id}_user"], WELCOME_SUBJECT,
+                 WELCOME_BODY.format(name=name, position=position, salary=salary))
+                for emp_id, name, position, salary, _ in accepted
+                if emails.get(f"{emp_id}_user")
+            ]
+            if messages:
+                self.emp_manager.notifier.send_many(messages)
+
+        return len(accepted)
@@ -0,0 +1,215 @@
+"""
+اختبار حمل لخدمة HTTP (server.py)
+
+يفتح عدداً من العملاء المتزامنين، كل عميل يسجل الدخول مرة ثم يرسل طلبات متتالية على
+اتصال keep-alive واحد بنسب من عمليات القراءة والكتابة، ويطبع النتائج بصيغة JSON
+(طلبات في الثانية وزمن p50/p99 لكل مسار).
+
+بدون --url يُشغَّل الخادم في عملية مستقلة على قاعدة بيانات مؤقتة مملوءة ببيانات اصطناعية.
+
+الاستخدام:
+    python loadtest.py --clients 50 --seconds 10
+    python loadtest.py --url http://127.0.0.1:8080 --user admin --password ... --employees 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from urllib.parse import urlsplit
+
+from benchmark import percentile
+from crypto import generate_key
+from employees import load_app
+from outbox import Outbox
+from stress import seed_employees
+
+
+LOAD_USER = 'load_admin'
+LOAD_PASSWORD = 'load-password'
+
+# نسب المسارات في كل عميل: (الاسم، الوزن)
+MIX = (
+    ('get_employee', 60),
+    ('list_employees', 20),
+    ('deduct', 15),
+    ('pay', 5),
+)
+
+
+class Client:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.token = None
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        headers = [f"{method} {path} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(body)}"]
+        if self.token:
+            headers.append(f"Authorization: Bearer {self.token}")
+        self.writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length)) if length else None
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+
+async def run_client(host, port, user, password, employees, deadline, rng, samples, errors):
+    client = Client(host, port)
+    await client.connect()
+    try:
+        status, response = await client.request('POST', '/login', {'username': user, 'password': password})
+        if status != 200:
+            raise RuntimeError(f"فشل تسجيل الدخول: {response}")
+        client.token = response['token']
+
+        names, weights = zip(*MIX)
+        while time.monotonic() < deadline:
+            op = rng.choices(names, weights)[0]
+            emp_id = f"E{rng.randrange(employees):07d}"
+            started = time.perf_counter()
+            if op == 'get_employee':
+                status, _ = await client.request('GET', f"/employees/{emp_id}")
+            elif op == 'list_employees':
+                status, _ = await client.request('GET', f"/employees?after={emp_id}&page_size=50")
+            elif op == 'deduct':
+                status, _ = await client.request('POST', f"/employees/{emp_id}/deduct", {'amount': 1, 'reason': 'load'})
+            else:
+                status, _ = await client.request('POST', f"/employees/{emp_id}/pay")
+            elapsed = time.perf_counter() - started
+
+            samples[op].append(elapsed)
+            if status != 200:
+                errors[op] = errors.get(op, 0) + 1
+    finally:
+        client.close()
+
+
+async def run_load(host, port, user, password, employees, clients, seconds, seed=0):
+    samples = {name: [] for name, _ in MIX}
+    errors = {}
+    deadline = time.monotonic() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_client(host, port, user, password, employees, deadline, random.Random(seed + i), samples, errors)
+        for i in range(clients)
+    ))
+    elapsed = time.perf_counter() - started
+
+    results = []
+    for name, op_samples in samples.items():
+        if not op_samples:
+            continue
+        op_samples.sort()
+        results.append({
+            'op': name,
+            'requests': len(op_samples),
+            'errors': errors.get(name, 0),
+            'p50_ms': round(percentile(op_samples, 0.50) * 1000, 3),
+            'p99_ms': round(percentile(op_samples, 0.99) * 1000, 3),
+        })
+    total = sum(len(op_samples) for op_samples in samples.values())
+    return {
+        'clients': clients,
+        'seconds': round(elapsed, 2),
+        'requests_per_sec': round(total / elapsed, 1),
+        'results': results,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(host, port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("لم يبدأ الخادم في الوقت المحدد")
+
+
+def prepare_database(db_path, employees):
+    app = load_app()
+    db = app.DatabaseManager(db_path)
+    seed_employees(db, employees)
+    auth = app.AuthenticationSystem(db, Outbox(db))
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, redirect_stdout(devnull):
+        auth.register(LOAD_USER, LOAD_PASSWORD, 'load@example.com', 'admin')
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='اختبار حمل لخدمة HTTP لنظام إدارة الموظفين')
+    parser.add_argument('--url', help='عنوان خادم يعمل مسبقاً (افتراضياً يُشغَّل خادم مؤقت)')
+    parser.add_argument('--user', default=LOAD_USER)
+    parser.add_argument('--password', default=LOAD_PASSWORD)
+    parser.add_argument('--employees', type=int, default=10000)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=8, help='خيوط الخادم المؤقت')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.url:
+        url = urlsplit(args.url)
+        report = asyncio.run(run_load(url.hostname, url.port or 80, args.user, args.password,
+                                      args.employees, args.clients, args.seconds, args.seed))
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    # مفتاح مؤقت للقاعدة المؤقتة، ويرثه الخادم من البيئة
+    if not os.getenv('BANK_ACCOUNT_KEY_FILE'):
+        os.environ.setdefault('BANK_ACCOUNT_KEY', generate_key())
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'load.db')
+        prepare_database(db_path, args.employees)
+
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py'),
+             '--port', str(port), '--db', db_path, '--workers', str(args.workers), '--no-mail'],
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_for_port('127.0.0.1', port)
+            report = asyncio.run(run_load('127.0.0.1', port, LOAD_USER, LOAD_PASSWORD,
+                                          args.employees, args.clients, args.seconds, args.seed))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
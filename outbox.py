@@ -0,0 +1,274 @@
+"""
+صندوق صادر دائم للإشعارات
+
+الرسائل تُكتب في جدول outbox ضمن معاملة العملية، وعمال OutboxWorkerPool يرسلونها لاحقاً.
+الرسائل المعلَّمة digest (إشعارات الرواتب) تنتظر مهلة التجميع OUTBOX_DIGEST_WINDOW، وعند
+إرسال أي منها تُضم إليها كل رسائل digest المنتظرة للمستلم نفسه في رسالة ملخص واحدة؛ فدفعة
+الراتب المستحقة فوراً تحمل معها الاستقطاعات التي سبقتها. والعامل يسلّم دفعة الرسائل المستحقة
+كلها إلى مرسل البريد مرة واحدة (send_many)، ونتيجة كل رسالة تُحفظ على حدة.
+"""
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+
+ENQUEUE_QUERY = '''INSERT INTO outbox (recipient, subject, body, digest, available_at, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)'''
+
+# عنوان المستلم يُقرأ من جدول users داخل جملة الإدراج نفسها؛ المستخدم بلا بريد لا تُضاف له رسالة
+NOTIFY_USER_QUERY = '''INSERT INTO outbox (recipient, subject, body, digest, available_at, created_at)
+    SELECT email, ?, ?, ?, ?, ? FROM users WHERE username = ? AND email IS NOT NULL AND email != \'\''''
+
+# الرسائل المستحقة بحالة معينة: pending، أو sending انتهت مدة حجزها دون نتيجة (توقف عاملها)
+DUE_QUERY = '''SELECT id, recipient, digest FROM outbox
+    WHERE status = ? AND available_at <= ?
+    ORDER BY available_at, id LIMIT ?'''
+
+# رسائل digest المنتظرة لمستلمين معينين، تُضم إلى ملخصهم مهما بقي من مهلة تجميعها
+DIGEST_PENDING_QUERY = '''SELECT id FROM outbox
+    WHERE digest = 1 AND status = 'pending' AND recipient IN ({placeholders})'''
+
+# حجز الرسائل: الحالة sending حتى لا يضمها عامل آخر إلى ملخصه، وavailable_at نهاية مدة الحجز
+CLAIM_QUERY = '''UPDATE outbox SET status = 'sending', attempts = attempts + 1, available_at = ?
+    WHERE status IN ('pending', 'sending') AND id IN ({placeholders})
+    RETURNING id, recipient, subject, body, attempts, digest'''
+
+# تأجيل رسائل استنفدت حدود المزود: تعود متاحة بعد مهلته ولا يُحتسب حجزها محاولة
+DEFER_QUERY = '''UPDATE outbox SET status = 'pending', attempts = attempts - 1, available_at = ?, last_error = ?
+    WHERE id = ?'''
+
+DIGEST_WINDOW = 120.0
+DIGEST_MAX_MESSAGES = 50
+DIGEST_SUBJECT = "ملخص إشعارات نظام الموظفين"
+
+# الحد الأقصى لعدد المعاملات في استعلام IN واحد
+IN_CHUNK_SIZE = 500
+
+
+def build_digest(messages):
+    """
+    دمج رسائل مستلم واحد في رسالة واحدة
+
+    :param messages: قائمة (subject, body) بترتيب إنشائها
+    :return: (subject, body)
+    """
+    if len(messages) == 1:
+        return messages[0]
+    sections = [f"{index}. {subject}\n\n{body}" for index, (subject, body) in enumerate(messages, 1)]
+    return f"{DIGEST_SUBJECT} ({len(messages)})", f"\n\n{'-' * 40}\n\n".join(sections)
+
+
+class Outbox:
+    """
+    صندوق صادر دائم بواجهة NotificationSystem (send_email و send_many)
+
+    تُكتب الرسائل في جدول outbox على اتصال قاعدة البيانات نفسه، فتدخل في معاملة
+    العملية الجارية وتُحفظ أو تُلغى معها. يتولى OutboxWorkerPool الإرسال الفعلي.
+
+    :param digest_window: مهلة تجميع رسائل digest بالثواني (افتراضياً OUTBOX_DIGEST_WINDOW أو 120)
+    """
+
+    def __init__(self, db_manager, digest_window=None):
+        self.db = db_manager
+        if digest_window is None:
+            digest_window = float(os.getenv('OUTBOX_DIGEST_WINDOW', DIGEST_WINDOW))
+        self.digest_window = digest_window
+
+    def _available_at(self, digest, delay):
+        if delay is None:
+            delay = self.digest_window if digest else 0
+        return time.time() + delay
+
+    def send_email(self, recipient, subject, body, digest=False, delay=None):
+        self.db.execute_query(
+            ENQUEUE_QUERY,
+            (recipient, subject, body, int(digest), self._available_at(digest, delay), str(datetime.now()))
+        )
+        return True
+
+    def send_many(self, messages, digest=False, delay=None):
+        """
+        :param messages: قائمة (recipient, subject, body)
+        :param digest: تجميع الرسائل مع غيرها لنفس المستلم في رسالة ملخص
+        :param delay: تأجيل الإرسال بالثواني (افتراضياً مهلة التجميع لرسائل digest، وإلا فوراً)
+        """
+        available_at = self._available_at(digest, delay)
+        created_at = str(datetime.now())
+        rows = [(recipient, subject, body, int(digest), available_at, created_at) for recipient, subject, body in messages]
+        if not rows:
+            return 0
+        return self.db.executemany(ENQUEUE_QUERY, rows)
+
+    def notify_users(self, messages, digest=False, delay=None):
+        """
+        إضافة رسائل لمستخدمين بأسمائهم بدل عناوينهم
+
+        :param messages: قائمة (username, subject, body)
+        :return: عدد الرسائل المضافة (المستخدمون بلا بريد يُتجاوزون)
+        """
+        available_at = self._available_at(digest, delay)
+        created_at = str(datetime.now())
+        rows = [(subject, body, int(digest), available_at, created_at, username) for username, subject, body in messages]
+        if not rows:
+            return 0
+        return self.db.executemany(NOTIFY_USER_QUERY, rows)
+
+
+class OutboxWorkerPool:
+    """
+    مجموعة عمال في الخلفية تفرغ جدول outbox عبر مرسل البريد
+
+    :param db_manager: مدير قاعدة البيانات المشترك (آمن للاستخدام من عدة خيوط)
+    :param sender: كائن يملك send_many(messages) ويعيد نتيجة كل رسالة بترتيبها: True إن أُرسلت،
+                   أو عدد الثواني قبل إعادة المحاولة إن أجّلتها حدود المزود، أو False عند الفشل
+    :param workers: عدد العمال
+    :param max_attempts: عدد المحاولات قبل اعتبار الرسالة فاشلة نهائياً
+    :param base_delay: مهلة إعادة المحاولة الأولى بالثواني (تتضاعف مع كل محاولة)
+    :param max_delay: الحد الأعلى لمهلة إعادة المحاولة
+    :param lease: مدة حجز الرسالة؛ إن توقف العامل قبل إنهائها تعود متاحة بعدها
+    :param batch_size: أقصى عدد رسائل مستحقة تُحجز وتُرسل عبر اتصال واحد
+    """
+
+    def __init__(self, db_manager, sender, workers=4, max_attempts=8, base_delay=5.0,
+                 max_delay=3600.0, lease=300.0, poll_interval=1.0, batch_size=100):
+        self.db = db_manager
+        self.sender = sender
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbox-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def drain(self):
+        """إرسال كل الرسائل المستحقة في الخيط الحالي ثم العودة (للأوامر غير التفاعلية)"""
+        processed = 0
+        while True:
+            count = self._process_batch()
+            if not count:
+                return processed
+            processed += count
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._process_batch():
+                self._stop.wait(self.poll_interval)
+
+    def _claim(self):
+        """
+        حجز دفعة من الرسائل المستحقة مع كل رسائل digest المنتظرة لمستلميها
+
+        :return: قائمة رسائل بصيغة (ids, recipient, subject, body, attempts)، رسالة لكل مستلم digest
+        """
+        now = time.time()
+        with self.db.transaction():
+            # المحجوزة المنتهية أولاً لأنها الأقدم؛ استعلام لكل حالة حتى يُقرأ الترتيب من الفهرس
+            due = self.db.execute_query(DUE_QUERY, ('sending', now, self.batch_size), fetchall=True)
+            if len(due) < self.batch_size:
+                due += self.db.execute_query(DUE_QUERY, ('pending', now, self.batch_size - len(due)), fetchall=True)
+            if not due:
+                return []
+
+            ids = {message_id for message_id, _, _ in due}
+            recipients = sorted({recipient for _, recipient, digest in due if digest})
+            for start in range(0, len(recipients), IN_CHUNK_SIZE):
+                chunk = recipients[start:start + IN_CHUNK_SIZE]
+                ids.update(message_id for message_id, in self.db.execute_query(
+                    DIGEST_PENDING_QUERY.format(placeholders=','.join('?' * len(chunk))), chunk, fetchall=True
+                ))
+
+            ids = sorted(ids)
+            claimed = []
+            for start in range(0, len(ids), IN_CHUNK_SIZE):
+                chunk = ids[start:start + IN_CHUNK_SIZE]
+                claimed.extend(self.db.execute_query(
+                    CLAIM_QUERY.format(placeholders=','.join('?' * len(chunk))),
+                    (now + self.lease, *chunk), fetchall=True
+                ))
+
+        groups = {}
+        messages = []
+        for message_id, recipient, subject, body, attempts, digest in sorted(claimed):
+            group = groups.get(recipient) if digest else None
+            if group is None or len(group['parts']) >= DIGEST_MAX_MESSAGES:
+                group = {'ids': [], 'recipient': recipient, 'parts': [], 'attempts': 0}
+                messages.append(group)
+                if digest:
+                    groups[recipient] = group
+            group['ids'].append(message_id)
+            group['parts'].append((subject, body))
+            group['attempts'] = max(group['attempts'], attempts)
+
+        return [
+            (group['ids'], group['recipient'], *build_digest(group['parts']), group['attempts'])
+            for group in messages
+        ]
+
+    def _process_batch(self):
+        messages = self._claim()
+        if not messages:
+            return 0
+
+        try:
+            results = list(self.sender.send_many([(recipient, subject, body) for _, recipient, subject, body, _ in messages]))
+            error = "تعذر إرسال الرسالة (السبب في سجل البريد)"
+        except Exception as e:
+            results = []
+            error = str(e)
+
+        # ما وصل يُعلَّم مرسلاً، وما أجّلته حدود المزود ينتظر مهلتها، والباقي (أو ما لم تُعد له
+        # نتيجة) يُعاد جدولته كمحاولة فاشلة
+        results += [False] * (len(messages) - len(results))
+        sent_ids, deferred, failed = [], [], []
+        now = time.time()
+        for message, result in zip(messages, results):
+            if result is True:
+                sent_ids.extend(message[0])
+            elif result is False or result is None:
+                failed.append(message)
+            else:
+                # الحد اليومي قد لا يتسع قبل ساعات، فالرسالة تنتظره دون أن تستنفد محاولاتها
+                deferred.extend((now + result, "حد الإرسال لدى المزود مستنفد", message_id) for message_id in message[0])
+
+        if sent_ids:
+            sent_at = str(datetime.now())
+            self.db.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                [(sent_at, message_id) for message_id in sent_ids]
+            )
+        if deferred:
+            self.db.executemany(DEFER_QUERY, deferred)
+
+        for ids, _, _, _, attempts in failed:
+            if attempts >= self.max_attempts:
+                self.db.executemany(
+                    "UPDATE outbox SET status = 'failed', last_error = ? WHERE id = ?",
+                    [(error, message_id) for message_id in ids]
+                )
+            else:
+                # تراجع أسي مع قدر عشوائي حتى لا تتزامن المحاولات بعد تعطل الخادم
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                available_at = time.time() + delay * random.uniform(0.5, 1.0)
+                self.db.executemany(
+                    "UPDATE outbox SET status = 'pending', available_at = ?, last_error = ? WHERE id = ?",
+                    [(available_at, error, message_id) for message_id in ids]
+                )
+        return len(messages)
@@ -0,0 +1,201 @@
+"""
+تجزئة كلمات المرور بدوال اشتقاق المفاتيح (scrypt / PBKDF2)
+
+كل تجزئة مخزنة تحمل خوارزميتها ومعاملاتها وملحها، مثل:
+    scrypt$16384$8$1$<salt>$<hash>
+    pbkdf2_sha256$600000$<salt>$<hash>
+والتجزئات القديمة (SHA-256 بدون ملح) تُقبل للتحقق فقط وتُعلَّم للترقية.
+
+لمعايرة التكلفة على الجهاز الحالي:
+    python passwords.py --target-ms 100
+"""
+import base64
+import hashlib
+import hmac
+import os
+import time
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+class ScryptHasher:
+    algorithm = 'scrypt'
+
+    def __init__(self, n=2 ** 14, r=8, p=1):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def _derive(self, password, salt, n, r, p):
+        # ذاكرة scrypt تساوي 128 * n * r * p بايت، نسمح بضعفها تحسباً
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p, dklen=32)
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        digest = self._derive(password, salt, self.n, self.r, self.p)
+        return f"{self.algorithm}${self.n}${self.r}${self.p}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def verify(self, password, encoded):
+        _, n, r, p, salt, digest = encoded.split('$')
+        candidate = self._derive(password, _b64decode(salt), int(n), int(r), int(p))
+        return hmac.compare_digest(candidate, _b64decode(digest))
+
+    def needs_rehash(self, encoded):
+        _, n, r, p, _, _ = encoded.split('$')
+        return (int(n), int(r), int(p)) != (self.n, self.r, self.p)
+
+    def with_cost(self, cost):
+        return ScryptHasher(n=cost, r=self.r, p=self.p)
+
+    @property
+    def cost(self):
+        return self.n
+
+
+class PBKDF2Hasher:
+    algorithm = 'pbkdf2_sha256'
+
+    def __init__(self, iterations=600000):
+        self.iterations = iterations
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, self.iterations)
+        return f"{self.algorithm}${self.iterations}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def verify(self, password, encoded):
+        _, iterations, salt, digest = encoded.split('$')
+        candidate = hashlib.pbkdf2_hmac('sha256', password.encode(), _b64decode(salt), int(iterations))
+        return hmac.compare_digest(candidate, _b64decode(digest))
+
+    def needs_rehash(self, encoded):
+        return int(encoded.split('$')[1]) != self.iterations
+
+    def with_cost(self, cost):
+        return PBKDF2Hasher(iterations=cost)
+
+    @property
+    def cost(self):
+        return self.iterations
+
+
+class LegacySHA256Hasher:
+    """تجزئات SHA-256 القديمة بدون ملح: للتحقق فقط، وكل تجزئة منها تحتاج ترقية"""
+    algorithm = 'sha256'
+
+    def hash(self, password):
+        raise ValueError('لا يُسمح بإنشاء تجزئات SHA-256 جديدة')
+
+    def verify(self, password, encoded):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), encoded)
+
+    def needs_rehash(self, encoded):
+        return True
+
+
+HASHERS = {
+    ScryptHasher.algorithm: ScryptHasher,
+    PBKDF2Hasher.algorithm: PBKDF2Hasher,
+}
+
+
+def calibrate(hasher, target_ms=100.0, password='calibration-password'):
+    """
+    مضاعفة تكلفة الخوارزمية حتى يقترب زمن التجزئة الواحدة على هذا الجهاز من الهدف
+
+    :return: نسخة من الخوارزمية بالتكلفة المختارة
+    """
+    candidate = hasher.with_cost(2 ** 10 if isinstance(hasher, ScryptHasher) else 10000)
+    last_working = None
+    while True:
+        started = time.perf_counter()
+        try:
+            candidate.hash(password)
+        except (ValueError, MemoryError):
+            # scrypt يرفض n الذي تتجاوز ذاكرته حد OpenSSL أو حد maxmem، فنكتفي بآخر n نجح
+            if last_working is None:
+                raise
+            return last_working
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= target_ms:
+            return candidate
+        last_working = candidate
+        if isinstance(candidate, ScryptHasher):
+            # n يجب أن يبقى قوة للعدد 2
+            candidate = candidate.with_cost(candidate.cost * 2)
+        else:
+            candidate = candidate.with_cost(int(candidate.cost * max(1.2, target_ms / max(elapsed_ms, 0.1))))
+
+
+class PasswordHasher:
+    """
+    واجهة التجزئة المستخدمة في AuthenticationSystem
+
+    تُنشأ التجزئات الجديدة بالخوارزمية الحالية، ويُتحقق من المخزنة بالخوارزمية المسجلة فيها.
+    hash و verify تعملان في خيط المستدعي، وhashlib يحرر GIL أثناء scrypt و PBKDF2 فتتوزع
+    الخيوط المتزامنة (مثل خيوط خدمة HTTP) على الأنوية.
+
+    :param hasher: خوارزمية التجزئات الجديدة
+    """
+
+    def __init__(self, hasher=None):
+        self.hasher = hasher or ScryptHasher()
+        self._legacy = LegacySHA256Hasher()
+
+    @classmethod
+    def from_env(cls):
+        """قراءة الخوارزمية وتكلفتها من المتغيرات البيئية (ناتج python passwords.py)"""
+        algorithm = os.getenv('PASSWORD_HASH_ALGORITHM', ScryptHasher.algorithm)
+        if algorithm == PBKDF2Hasher.algorithm:
+            hasher = PBKDF2Hasher(iterations=int(os.getenv('PBKDF2_ITERATIONS', 600000)))
+        else:
+            hasher = ScryptHasher(
+                n=int(os.getenv('SCRYPT_N', 2 ** 14)),
+                r=int(os.getenv('SCRYPT_R', 8)),
+                p=int(os.getenv('SCRYPT_P', 1))
+            )
+        return cls(hasher)
+
+    def _hasher_for(self, encoded):
+        algorithm = encoded.split('$', 1)[0]
+        if algorithm == self.hasher.algorithm:
+            return self.hasher
+        if algorithm in HASHERS:
+            return HASHERS[algorithm]()
+        return self._legacy
+
+    def hash(self, password):
+        return self.hasher.hash(password)
+
+    def verify(self, password, encoded):
+        return self._hasher_for(encoded).verify(password, encoded)
+
+    def needs_rehash(self, encoded):
+        hasher = self._hasher_for(encoded)
+        return hasher is not self.hasher or hasher.needs_rehash(encoded)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='معايرة تكلفة تجزئة كلمات المرور على هذا الجهاز')
+    parser.add_argument('--algorithm', choices=sorted(HASHERS), default=ScryptHasher.algorithm)
+    parser.add_argument('--target-ms', type=float, default=100.0)
+    args = parser.parse_args()
+
+    hasher = calibrate(HASHERS[args.algorithm](), args.target_ms)
+    print(f"PASSWORD_HASH_ALGORITHM={hasher.algorithm}")
+    if isinstance(hasher, ScryptHasher):
+        print(f"SCRYPT_N={hasher.n}\nSCRYPT_R={hasher.r}\nSCRYPT_P={hasher.p}")
+    else:
+        print(f"PBKDF2_ITERATIONS={hasher.iterations}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+تقارير الرواتب من جداول ملخصة تُحدَّث تدريجياً
+
+كل استقطاع أو دفعة تضيف قيمتها إلى صف واحد في deduction_totals أو payment_totals
+(حسب الشهر والسبب والوظيفة والمنفذ) ضمن معاملة العملية نفسها، فيصبح تقرير سنة كاملة
+قراءة لبضع مئات من الصفوف بدلاً من مسح كل سجلات الاستقطاعات والمدفوعات.
+"""
+
+
+DEDUCTION_TOTALS_UPSERT = '''INSERT INTO deduction_totals (period, reason, position, created_by, total, entries)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (period, reason, position, created_by)
+    DO UPDATE SET total = total + excluded.total, entries = entries + excluded.entries'''
+
+PAYMENT_TOTALS_UPSERT = '''INSERT INTO payment_totals (period, position, created_by, total, entries)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (period, position, created_by)
+    DO UPDATE SET total = total + excluded.total, entries = entries + excluded.entries'''
+
+# دفع رواتب الجميع يُلخص مباشرة من جدول الموظفين (WHERE true مطلوبة قبل ON CONFLICT)
+PAY_ALL_TOTALS_UPSERT = '''INSERT INTO payment_totals (period, position, created_by, total, entries)
+    SELECT ?, position, ?, SUM(salary), COUNT(*) FROM employees WHERE true GROUP BY position
+    ON CONFLICT (period, position, created_by)
+    DO UPDATE SET total = total + excluded.total, entries = entries + excluded.entries'''
+
+# ملخصات السجلات الخام في قاعدة واحدة: {source} هو main أو اسم ملف أرشيف مربوط
+DEDUCTION_TOTALS_SELECT = '''SELECT substr(d.created_at, 1, 7), d.reason, COALESCE(e.position, ''), d.created_by, SUM(d.amount), COUNT(*)
+    FROM {source}.deductions d LEFT JOIN main.employees e ON e.emp_id = d.emp_id
+    GROUP BY 1, 2, 3, 4'''
+
+PAYMENT_TOTALS_SELECT = '''SELECT substr(p.created_at, 1, 7), COALESCE(e.position, ''), p.created_by, SUM(p.amount), COUNT(*)
+    FROM {source}.payments p LEFT JOIN main.employees e ON e.emp_id = p.emp_id
+    GROUP BY 1, 2, 3'''
+
+# إعادة بناء الملخصات من سجلات القاعدة الرئيسية (مرة واحدة عند إنشاء الجداول أو ضمن rebuild)
+REBUILD_STATEMENTS = (
+    "DELETE FROM deduction_totals",
+    "INSERT INTO deduction_totals (period, reason, position, created_by, total, entries) "
+    + DEDUCTION_TOTALS_SELECT.format(source='main'),
+    "DELETE FROM payment_totals",
+    "INSERT INTO payment_totals (period, position, created_by, total, entries) "
+    + PAYMENT_TOTALS_SELECT.format(source='main'),
+)
+
+# جداول مؤقتة على اتصال الكاتب تجمع ملخصات ملفات الأرشيف قبل استبدال الملخصات
+ARCHIVED_TOTALS_SETUP = (
+    "DROP TABLE IF EXISTS temp.archived_deduction_totals",
+    "CREATE TEMP TABLE archived_deduction_totals (period, reason, position, created_by, total, entries)",
+    "DROP TABLE IF EXISTS temp.archived_payment_totals",
+    "CREATE TEMP TABLE archived_payment_totals (period, position, created_by, total, entries)",
+)
+
+ARCHIVED_TOTALS_MERGE = (
+    '''INSERT INTO deduction_totals (period, reason, position, created_by, total, entries)
+    SELECT period, reason, position, created_by, total, entries FROM temp.archived_deduction_totals WHERE true
+    ON CONFLICT (period, reason, position, created_by)
+    DO UPDATE SET total = total + excluded.total, entries = entries + excluded.entries''',
+    '''INSERT INTO payment_totals (period, position, created_by, total, entries)
+    SELECT period, position, created_by, total, entries FROM temp.archived_payment_totals WHERE true
+    ON CONFLICT (period, position, created_by)
+    DO UPDATE SET total = total + excluded.total, entries = entries + excluded.entries''',
+    "DROP TABLE temp.archived_deduction_totals",
+    "DROP TABLE temp.archived_payment_totals",
+)
+
+TOTALS_TABLES = {
+    'deductions': 'deduction_totals',
+    'payments': 'payment_totals',
+}
+
+DIMENSIONS = {
+    'month': 'period',
+    'reason': 'reason',
+    'position': 'position',
+    'operator': 'created_by',
+}
+
+
+def period_of(created_at):
+    # created_at بصيغة str(datetime) فأول سبعة أحرف هي YYYY-MM
+    return created_at[:7]
+
+
+def record_deduction(db, created_at, reason, position, created_by, amount):
+    db.execute_query(DEDUCTION_TOTALS_UPSERT, (period_of(created_at), reason, position, created_by, amount, 1))
+
+
+def record_payments(db, created_at, created_by, payments):
+    """
+    إضافة مجموعة دفعات إلى الملخص بعد تجميعها حسب الوظيفة
+
+    :param payments: أزواج (الوظيفة، المبلغ)
+    """
+    by_position = {}
+    for position, amount in payments:
+        total, entries = by_position.get(position, (0.0, 0))
+        by_position[position] = (total + amount, entries + 1)
+
+    period = period_of(created_at)
+    db.executemany(
+        PAYMENT_TOTALS_UPSERT,
+        [(period, position, created_by, total, entries) for position, (total, entries) in by_position.items()]
+    )
+
+
+def record_pay_all(db, created_at, created_by):
+    db.execute_query(PAY_ALL_TOTALS_UPSERT, (period_of(created_at), created_by))
+
+
+class PayrollReports:
+    def __init__(self, db_manager):
+        self.db = db_manager
+
+    def totals(self, kind, dimension, start=None, end=None):
+        """
+        إجمالي المبالغ وعدد العمليات مجمعة حسب بُعد واحد
+
+        :param kind: deductions أو payments
+        :param dimension: month أو reason (للاستقطاعات فقط) أو position أو operator
+        :param start: أول شهر في الفترة بصيغة YYYY-MM (اختياري)
+        :param end: آخر شهر في الفترة بصيغة YYYY-MM (اختياري)
+        :return: قائمة (القيمة، الإجمالي، عدد العمليات) مرتبة حسب القيمة
+        """
+        if kind not in TOTALS_TABLES or dimension not in DIMENSIONS:
+            raise ValueError(f"تقرير غير معروف: {kind}/{dimension}")
+        if dimension == 'reason' and kind != 'deductions':
+            raise ValueError("التجميع حسب السبب متاح للاستقطاعات فقط")
+
+        column = DIMENSIONS[dimension]
+        conditions = []
+        params = []
+        if start:
+            conditions.append("period >= ?")
+            params.append(start)
+        if end:
+            conditions.append("period <= ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        return self.db.execute_query(
+            f"SELECT {column}, SUM(total), SUM(entries) FROM {TOTALS_TABLES[kind]} {where} "
+            f"GROUP BY {column} ORDER BY {column}",
+            params, fetchall=True
+        )
+
+    def year_summary(self, year):
+        """إجماليات كل شهر من السنة للاستقطاعات والمدفوعات"""
+        start, end = f"{year}-01", f"{year}-12"
+        return {
+            'deductions': self.totals('deductions', 'month', start, end),
+            'payments': self.totals('payments', 'month', start, end),
+        }
+
+    def rebuild(self):
+        """
+        إعادة بناء الملخصات من السجلات الخام في القاعدة الرئيسية وفي كل ملفات الأرشيف
+
+        ملخص كل ملف أرشيف يُحسب أولاً في جدول مؤقت (الربط غير ممكن داخل معاملة، وعدد
+        الملفات المربوطة معاً محدود)، ثم تُستبدل الملخصات كلها في معاملة واحدة.
+        """
+        from archive import archive_path, archive_years
+
+        with self.db.transaction():
+            for statement in ARCHIVED_TOTALS_SETUP:
+                self.db.execute_query(statement)
+
+        for year in archive_years(self.db.db_path):
+            with self.db.attached(archive_path(self.db.db_path, year), f"archive_{year}", write=True) as alias:
+                with self.db.transaction():
+                    self.db.execute_query(
+                        "INSERT INTO temp.archived_deduction_totals " + DEDUCTION_TOTALS_SELECT.format(source=alias)
+                    )
+                    self.db.execute_query(
+                        "INSERT INTO temp.archived_payment_totals " + PAYMENT_TOTALS_SELECT.format(source=alias)
+                    )
+
+        with self.db.transaction():
+            for statement in REBUILD_STATEMENTS + ARCHIVED_TOTALS_MERGE:
+                self.db.execute_query(statement)
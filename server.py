@@ -0,0 +1,329 @@
+"""
+خدمة HTTP/JSON محلية فوق EmployeeManager
+
+حلقة asyncio واحدة تستقبل الطلبات (HTTP/1.1 مع keep-alive) وتنفذ عمل قاعدة البيانات
+في مجموعة خيوط محدودة، فيخدم العملية الواحدة عدداً كبيراً من العملاء المتزامنين.
+كل تسجيل دخول يعطي رمزاً يُرسل في ترويسة Authorization: Bearer <الرمز>.
+
+    POST /login                  {"username": ..., "password": ...}
+    POST /logout
+    GET  /employees              ?position=&created_by=&min_balance=&max_balance=&after=&page_size=
+    GET  /employees/<id>
+    POST /employees/<id>/deduct  {"amount": ..., "reason": ...}
+    POST /employees/<id>/pay
+
+الاستخدام:
+    python server.py --host 127.0.0.1 --port 8080 --workers 8
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from employees import load_app
+from outbox import Outbox, OutboxWorkerPool
+from sessions import SessionStore
+
+
+MAX_BODY_SIZE = 64 * 1024
+MAX_PAGE_SIZE = 500
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def employee_to_json(employee):
+    return {
+        'emp_id': employee.emp_id,
+        'name': employee.name,
+        'position': employee.position,
+        'salary': employee.salary,
+        'current_balance': employee.current_balance,
+        'deductions': employee.deductions,
+        'created_by': employee.created_by,
+        'created_at': employee.created_at,
+    }
+
+
+class EmployeeService:
+    """
+    :param app: الوحدة الرئيسية للنظام
+    :param db: مدير قاعدة البيانات المشترك بين كل الطلبات
+    :param workers: عدد خيوط تنفيذ عمل قاعدة البيانات
+    :param max_pending: أقصى عدد طلبات تنتظر أو تُنفذ في الخيوط؛ الزائد ينتظر في الحلقة
+    :param sessions: مخزن الجلسات (افتراضياً في الذاكرة فقط)
+    """
+
+    def __init__(self, app, db, workers=8, max_pending=256, sessions=None):
+        self.app = app
+        self.db = db
+        self.notifier = Outbox(db)
+        # نظام مصادقة ومدير موظفين واحد لكل الطلبات؛ كل طلب يمرر جلسته صراحة
+        self.auth = app.AuthenticationSystem(db, self.notifier, sessions=sessions)
+        self.emp_manager = app.EmployeeManager(db, self.auth, self.notifier)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http-db')
+        # منذ Python 3.10 لا يرتبط Semaphore بحلقة عند إنشائه، فيمكن استدعاء route قبل start
+        self._pending = asyncio.Semaphore(max_pending)
+        self.max_pending = max_pending
+
+    async def start(self, host, port):
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        # كتابة أحداث التدقيق المتبقية في الذاكرة قبل الخروج
+        self.auth.audit.close()
+
+    async def run_blocking(self, function, *args, session=None, permission=None):
+        """
+        تنفيذ دالة متزامنة في مجموعة الخيوط
+
+        الدالة تُستدعى مع out=<كاتب خاص بهذا الطلب> فتكتب رسائل نتيجتها فيه بدلاً من sys.stdout
+
+        :param permission: صلاحية يُتحقق منها أولاً في الخيط نفسه (قد تقرأ قاعدة البيانات)
+        :return: (النتيجة، الرسائل التي كتبتها الدالة)
+        """
+        def call():
+            if permission and not self.auth.has_permission(permission, session):
+                raise HTTPError(403, "ليس لديك صلاحية لتنفيذ هذه العملية!")
+            out = io.StringIO()
+            return function(*args, out=out), out.getvalue().strip()
+
+        async with self._pending:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    # ---- الجلسات ----
+
+    async def _session(self, headers):
+        authorization = headers.get('authorization', '')
+        token = authorization[7:] if authorization.startswith('Bearer ') else ''
+        if self.auth.sessions.db is None:
+            session = self.auth.get_session(token)
+        else:
+            # الجلسة التي ليست في الذاكرة تُقرأ من قاعدة البيانات، فلا تُنفذ في حلقة الأحداث
+            session, _ = await self.run_blocking(lambda out: self.auth.get_session(token))
+        if session is None:
+            raise HTTPError(401, "يجب تسجيل الدخول أولاً")
+        return session
+
+    # ---- المسارات ----
+
+    async def route(self, method, path, query, headers, body):
+        parts = [part for part in path.split('/') if part]
+
+        if parts == ['login']:
+            if method != 'POST':
+                raise HTTPError(405, "الطريقة غير مسموحة")
+            session, message = await self.run_blocking(
+                self.auth.open_session, str(body.get('username', '')), str(body.get('password', ''))
+            )
+            if not session:
+                raise HTTPError(401, message)
+            return 200, {'token': session.token, 'expires_at': session.expires_at, 'message': message}
+
+        # الجلسات محفوظة في الذاكرة، فهذا التحقق لا يسأل قاعدة البيانات في الغالب
+        session = await self._session(headers)
+
+        if parts == ['logout'] and method == 'POST':
+            _, message = await self.run_blocking(self.auth.logout, session)
+            return 200, {'message': message}
+
+        if parts == ['employees'] and method == 'GET':
+            return await self._list_employees(session, query)
+
+        if len(parts) == 2 and parts[0] == 'employees' and method == 'GET':
+            employee, message = await self.run_blocking(self.emp_manager.get_employee_info, parts[1], session)
+            if employee is None:
+                # الموظف الذي يطلب سجل غيره يحصل على 404 أيضاً فلا يعرف إن كان الرقم موجوداً
+                raise HTTPError(404, message)
+            return 200, employee_to_json(employee)
+
+        if len(parts) == 3 and parts[0] == 'employees' and method == 'POST':
+            if parts[2] == 'deduct':
+                try:
+                    amount = float(body['amount'])
+                    reason = str(body['reason'])
+                except (KeyError, TypeError, ValueError):
+                    raise HTTPError(400, "المطلوب amount و reason")
+                if not math.isfinite(amount) or amount <= 0:
+                    raise HTTPError(400, "amount يجب أن يكون رقماً موجباً")
+                ok, message = await self.run_blocking(
+                    self.emp_manager.deduct_from_salary, parts[1], amount, reason, session,
+                    session=session, permission='can_deduct_salary'
+                )
+            elif parts[2] == 'pay':
+                ok, message = await self.run_blocking(
+                    self.emp_manager.pay_salary, parts[1], session,
+                    session=session, permission='can_pay_salary'
+                )
+            else:
+                raise HTTPError(404, "المسار غير موجود")
+            if not ok:
+                raise HTTPError(400, message)
+            return 200, {'message': message}
+
+        raise HTTPError(404, "المسار غير موجود")
+
+    async def _list_employees(self, session, query):
+        try:
+            filters = {
+                'position': query.get('position'),
+                'created_by': query.get('created_by'),
+                'min_balance': float(query['min_balance']) if 'min_balance' in query else None,
+                'max_balance': float(query['max_balance']) if 'max_balance' in query else None,
+                'after': query.get('after'),
+                'page_size': int(query.get('page_size', self.app.EMPLOYEE_PAGE_SIZE)),
+                'session': session,
+            }
+        except ValueError:
+            raise HTTPError(400, "معاملات تصفية غير صحيحة")
+        # الصفر أو السالب يصبح LIMIT بلا حد في SQLite
+        if not 1 <= filters['page_size'] <= MAX_PAGE_SIZE:
+            raise HTTPError(400, f"page_size يجب أن يكون بين 1 و {MAX_PAGE_SIZE}")
+
+        # صفحة واحدة لكل طلب؛ العميل يطلب التالية بـ after=<next>
+        page, _ = await self.run_blocking(
+            lambda out: next(self.emp_manager.iter_employees(**filters) or iter(()), []),
+            session=session, permission='can_view_all_employees'
+        )
+        columns = ('emp_id', 'name', 'position', 'salary', 'current_balance')
+        return 200, {
+            'employees': [dict(zip(columns, row)) for row in page],
+            'next': page[-1][0] if len(page) == filters['page_size'] else None,
+        }
+
+    # ---- HTTP ----
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {'error': "طلب غير صالح"}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                status, payload = await self._dispatch(method, target, headers, reader)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, target, headers, reader):
+        try:
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_SIZE:
+                raise HTTPError(413, "حجم الطلب أكبر من المسموح")
+            raw = await reader.readexactly(length) if length else b''
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                raise HTTPError(400, "محتوى JSON غير صالح")
+            if not isinstance(body, dict):
+                raise HTTPError(400, "محتوى JSON يجب أن يكون كائناً")
+
+            url = urlsplit(target)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            return await self.route(method, url.path, query, headers, body)
+        except HTTPError as e:
+            return e.status, {'error': e.message}
+        except Exception as e:
+            print(f"خطأ في معالجة الطلب {method} {target}: {e}", file=sys.stderr)
+            return 500, {'error': "خطأ داخلي في الخادم"}
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(host, port, workers, max_pending, db_path=None, send_mail=True, persist_sessions=False):
+    app = load_app()
+    db = app.DatabaseManager(db_path)
+    service = EmployeeService(app, db, workers, max_pending, SessionStore(db if persist_sessions else None))
+    sender = app.mail_sender() if send_mail else None
+    mail_workers = OutboxWorkerPool(db, sender) if send_mail else None
+    if mail_workers:
+        mail_workers.start()
+
+    server = await service.start(host, port)
+    try:
+        # SIGTERM يوقف الخدمة بنفس مسار الإغلاق المنظم بدل إنهاء العملية مباشرة
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    print(f"الخدمة تعمل على http://{host}:{port}", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if mail_workers:
+            mail_workers.stop()
+            sender.close()
+        service.close()
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='خدمة HTTP/JSON لنظام إدارة الموظفين')
+    parser.add_argument('--host', default=os.getenv('EMPLOYEE_HTTP_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('EMPLOYEE_HTTP_PORT', 8080)))
+    parser.add_argument('--workers', type=int, default=8, help='خيوط تنفيذ عمل قاعدة البيانات')
+    parser.add_argument('--max-pending', type=int, default=256, help='أقصى عدد طلبات قيد التنفيذ')
+    parser.add_argument('--db', help='مسار قاعدة البيانات (افتراضياً EMPLOYEE_DB_PATH)')
+    parser.add_argument('--no-mail', action='store_true', help='عدم تشغيل عمال إرسال البريد')
+    parser.add_argument('--persist-sessions', action='store_true', help='حفظ الجلسات في قاعدة البيانات لتبقى بعد إعادة التشغيل')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_pending, args.db,
+                          not args.no_mail, args.persist_sessions))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+جلسات المستخدمين: رمز عشوائي لكل تسجيل دخول مع مدة صلاحية
+
+SessionStore يحفظ الجلسات في ذاكرة LRU محدودة الحجم، فالتحقق من الجلسة في كل عملية
+لا يسأل جدول users. وعند تمرير مدير قاعدة بيانات تُحفظ الجلسات أيضاً في جدول sessions
+(تجزئة الرمز فقط)، فتبقى صالحة بعد إعادة تشغيل الخدمة أو خروجها من الذاكرة.
+"""
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class Session:
+    __slots__ = ('token', 'username', 'role', 'created_at', 'expires_at')
+
+    def __init__(self, token, username, role, created_at, expires_at):
+        self.token = token
+        self.username = username
+        self.role = role
+        self.created_at = created_at
+        self.expires_at = expires_at
+
+    def expired(self, now=None):
+        return (now or time.time()) >= self.expires_at
+
+    def __repr__(self):
+        return f"Session(username={self.username!r}, role={self.role!r})"
+
+
+class SessionStore:
+    """
+    :param db_manager: لحفظ الجلسات في جدول sessions (اختياري؛ بدونه تبقى في الذاكرة فقط)
+    :param max_size: أقصى عدد جلسات في الذاكرة؛ الأقدم استخداماً يخرج أولاً
+    :param ttl: مدة صلاحية الجلسة بالثواني من لحظة إنشائها
+    """
+
+    def __init__(self, db_manager=None, max_size=None, ttl=None):
+        self.db = db_manager
+        self.max_size = max_size or int(os.getenv('SESSION_CACHE_SIZE', 10000))
+        self.ttl = ttl or float(os.getenv('SESSION_TTL', 8 * 3600))
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, session):
+        with self._lock:
+            self._sessions[session.token] = session
+            self._sessions.move_to_end(session.token)
+            while len(self._sessions) > self.max_size:
+                self._sessions.popitem(last=False)
+
+    def create(self, username, role):
+        now = time.time()
+        session = Session(secrets.token_urlsafe(32), username, role, now, now + self.ttl)
+        if self.db is not None:
+            self.db.execute_query(
+                "INSERT INTO sessions (token_hash, username, role, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (_token_hash(session.token), username, role, now, session.expires_at)
+            )
+        self._remember(session)
+        return session
+
+    def get(self, token):
+        """الجلسة الصالحة لهذا الرمز، أو None إن لم توجد أو انتهت صلاحيتها"""
+        if not token:
+            return None
+
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is not None:
+                self._sessions.move_to_end(token)
+
+        if session is None and self.db is not None:
+            row = self.db.execute_query(
+                "SELECT username, role, created_at, expires_at FROM sessions WHERE token_hash = ?",
+                (_token_hash(token),), fetchone=True
+            )
+            if row:
+                session = Session(token, *row)
+                self._remember(session)
+
+        if session is not None and session.expired():
+            self.revoke(token)
+            return None
+        return session
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+        if self.db is not None:
+            self.db.execute_query("DELETE FROM sessions WHERE token_hash = ?", (_token_hash(token),))
+
+    def revoke_user(self, username):
+        """إنهاء كل جلسات المستخدم (عند تعطيل حسابه أو تغيير صلاحيته)"""
+        with self._lock:
+            for token in [token for token, session in self._sessions.items() if session.username == username]:
+                del self._sessions[token]
+        if self.db is not None:
+            self.db.execute_query("DELETE FROM sessions WHERE username = ?", (username,))
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for token in [token for token, session in self._sessions.items() if session.expired(now)]:
+                del self._sessions[token]
+        if self.db is not None:
+            self.db.execute_query("DELETE FROM sessions WHERE expires_at <= ?", (now,))
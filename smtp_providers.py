@@ -0,0 +1,434 @@
+"""
+ملفات تعريف مزودي البريد، جدولة الإرسال بحدود المعدل، والتوجيه بين المزودين
+
+ملف التعريف (Gmail.ini وأمثاله) أسطر KEY=VALUE بأسماء متغيرات البيئة نفسها، ويحدد إلى جانب
+الخادم والمنفذ حدود المزود وقاطع الدائرة الخاص به:
+    SMTP_RATE_PER_MINUTE   أقصى عدد رسائل في الدقيقة (0 بلا حد)
+    SMTP_RATE_PER_DAY      أقصى عدد رسائل في أي 24 ساعة (0 بلا حد)
+    SMTP_BREAKER_FAILURES  عدد الإخفاقات المتتالية التي يُستبعد بعدها المزود مؤقتاً
+    SMTP_BREAKER_RESET     ثواني الاستبعاد قبل تجربة المزود برسالة واحدة
+
+SendScheduler يوزع الرسائل على خيوط الإرسال بالتناوب بين المستلمين، فلا تحجز رسائل مستلم
+واحد كثيرة الدور عن الآخرين، ويوقف من يضيف الرسائل إن امتلأ الطابور.
+
+ProviderRegistry يختار لكل رسالة المزود الأقل تكلفة متوقعة (زمن الاستجابة الأخير ونسبة
+الإخفاق) من بين المزودين الذين يسمح قاطعهم وحدودهم بالإرسال، وإن تعطل المزود أثناء الإرسال
+تنتقل الرسالة نفسها إلى المزود التالي.
+"""
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+
+DAY = 86400.0
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """حدود المزود لا تسمح بالإرسال قبل مدة أطول من SMTP_MAX_RATE_WAIT"""
+
+    def __init__(self, wait):
+        super().__init__(f"حد الإرسال لدى المزود مستنفد، الإرسال التالي ممكن بعد {wait:.0f} ثانية")
+        self.wait = wait
+
+
+class NoProviderAvailable(Exception):
+    """كل المزودين مستبعدون بقواطع مفتوحة"""
+
+
+def load_profile(path):
+    """
+    قراءة ملف تعريف مزود البريد
+
+    :param path: مسار ملف .ini بصيغة KEY=VALUE (بلا أقسام، والأسطر التي تبدأ بـ # تعليقات)
+    :return: قاموس الإعدادات؛ القيم الفارغة تُتجاوز حتى تبقى قيم البيئة
+    """
+    settings = {}
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith(('#', ';')):
+                continue
+            key, sep, value = line.partition('=')
+            if not sep:
+                raise ValueError(f"{path}:{number}: سطر غير صحيح: {line}")
+            value = value.strip()
+            if value:
+                settings[key.strip()] = value
+    return settings
+
+
+def profile_name(path):
+    """اسم المزود من اسم ملف تعريفه ("Yahoo Mail.ini" -> "Yahoo Mail")"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class TokenBucket:
+    """
+    :param rate: عدد الرسائل المسموح بها في الثانية
+    :param capacity: أقصى عدد رسائل تُرسل متتالية بلا انتظار
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def delay(self, now):
+        """الثواني حتى يتوفر إذن إرسال واحد (0 إن كان متوفراً)"""
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def take(self, now):
+        self._tokens -= 1
+
+
+class RollingQuota:
+    """
+    حد يومي بنافذة متحركة: في أي window ثانية لا تُرسل أكثر من limit رسالة
+
+    دلو الرموز يسمح بضعف سعته في نافذة واحدة (السعة ثم ما يعاد ملؤه)، فلا يصلح لحد يومي صارم.
+
+    :param limit: أقصى عدد رسائل في النافذة
+    :param window: طول النافذة بالثواني
+    """
+
+    def __init__(self, limit, window=DAY):
+        self.limit = limit
+        self.window = window
+        self._sent = deque()
+
+    def delay(self, now):
+        while self._sent and self._sent[0] <= now - self.window:
+            self._sent.popleft()
+        return 0.0 if len(self._sent) < self.limit else self._sent[0] + self.window - now
+
+    def take(self, now):
+        self._sent.append(now)
+
+
+def build_limiters(per_minute=None, per_day=None):
+    limiters = []
+    if per_minute:
+        limiters.append(TokenBucket(per_minute / 60.0, per_minute))
+    if per_day:
+        limiters.append(RollingQuota(per_day))
+    return limiters
+
+
+class SendScheduler:
+    """
+    طابور إرسال بتناوب عادل بين المستلمين
+
+    حدود المعدل لكل مزود في ProviderRegistry: الخيط الذي ينتظر إذن المزود لا يأخذ رسالة أخرى،
+    فتتراكم الرسائل هنا ويبقى التناوب بينها عادلاً.
+
+    :param send: دالة send(recipient, *args) تنفذ الإرسال الفعلي؛ قيمتها تصبح نتيجة Future
+    :param workers: عدد الخيوط التي ترسل في الوقت نفسه (عادة مجموع جلسات SMTP)
+    :param max_queue: أقصى عدد رسائل منتظرة؛ بعده يتوقف submit حتى يتسع الطابور
+    :param name: اسم الخيوط
+    """
+
+    def __init__(self, send, workers=1, max_queue=1000, name='smtp'):
+        self._send = send
+        self.workers = workers
+        self.max_queue = max_queue
+        self.name = name
+        # طابور لكل مستلم بترتيب دوره؛ المستلم الذي يُرسل له ينتقل إلى آخر الدور
+        self._queues = OrderedDict()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._closed = False
+
+    @property
+    def pending(self):
+        return self._size
+
+    def submit(self, recipient, *args, timeout=None):
+        """
+        إضافة رسالة إلى الطابور
+
+        :param args: بقية معاملات send
+        :param timeout: أقصى انتظار بالثواني إن كان الطابور ممتلئاً (None بلا حد)
+        :return: Future بنتيجة send أو استثنائه
+        :raises queue.Full: إن بقي الطابور ممتلئاً طوال timeout
+        """
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("تم إغلاق طابور الإرسال")
+            if not self._cond.wait_for(lambda: self._size < self.max_queue, timeout):
+                raise queue.Full
+            self._queues.setdefault(recipient, deque()).append((future, recipient, args))
+            self._size += 1
+            if len(self._threads) < self.workers:
+                self._start_worker()
+            self._cond.notify_all()
+        return future
+
+    def close(self, timeout=None):
+        """إيقاف الخيوط بعد إرسال ما في الطابور"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def _start_worker(self):
+        thread = threading.Thread(target=self._run, name=f"{self.name}-sender-{len(self._threads)}", daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _next(self):
+        """
+        أخذ الرسالة التالية بالتناوب بين المستلمين
+
+        :return: (future, recipient, args) أو None عند الإغلاق وفراغ الطابور
+        """
+        with self._cond:
+            while True:
+                if not self._size:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+
+                recipient, messages = next(iter(self._queues.items()))
+                item = messages.popleft()
+                if messages:
+                    self._queues.move_to_end(recipient)
+                else:
+                    del self._queues[recipient]
+                self._size -= 1
+                self._cond.notify_all()
+                return item
+
+    def _run(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            future, recipient, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._send(recipient, *args))
+            except BaseException as e:
+                future.set_exception(e)
+
+
+def is_provider_failure(error):
+    """
+    هل الخطأ من المزود (انقطاع، مهلة، رفض مؤقت، مصادقة) فتنتقل الرسالة إلى غيره؟
+
+    رفض المستلمين ورفض الرسالة نفسها برمز 5xx يتكرران مع أي مزود فلا يستحقان الانتقال.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return False
+    if isinstance(error, (smtplib.SMTPAuthenticationError, smtplib.SMTPSenderRefused,
+                          smtplib.SMTPHeloError, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPException, OSError))
+
+
+class CircuitBreaker:
+    """
+    :param failure_threshold: عدد الإخفاقات المتتالية التي يُفتح بعدها القاطع
+    :param reset_timeout: ثواني بقاء القاطع مفتوحاً قبل السماح برسالة تجريبية واحدة
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=3, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+
+    def available(self, now):
+        if self.state == self.CLOSED:
+            return True
+        return self.state == self.OPEN and now - self._opened_at >= self.reset_timeout
+
+    def acquire(self, now):
+        # بعد انتهاء مهلة القاطع المفتوح تمر رسالة تجريبية واحدة، ونتيجتها تغلقه أو تعيد فتحه
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self, now):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = now
+
+
+class ProviderHealth:
+    """
+    متوسطات متحركة أسية لزمن الإرسال ونسبة الإخفاق، فتغلب عليها آخر الرسائل
+
+    :param alpha: وزن القياس الجديد (0-1)
+    """
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.latency = None
+        self.error_rate = 0.0
+        self.updated = float('-inf')
+
+    def record(self, latency=None, failed=False):
+        self.updated = time.monotonic()
+        self.error_rate += self.alpha * (float(failed) - self.error_rate)
+        if latency is not None:
+            self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+
+    def cost(self, failure_cost):
+        """الزمن المتوقع للإرسال: الإخفاق يكلف مهلة الاتصال كاملة"""
+        return (self.latency or 0.0) + self.error_rate * failure_cost
+
+
+class Provider:
+    """
+    :param name: اسم المزود (اسم ملف التعريف)
+    :param deliver: دالة deliver(recipient, *args) ترسل الرسالة عبر هذا المزود
+    :param failure_cost: تكلفة الإخفاق بالثواني في المقارنة بين المزودين (عادة مهلة الاتصال)
+    """
+
+    def __init__(self, name, deliver, per_minute=None, per_day=None, failure_threshold=3,
+                 reset_timeout=60.0, failure_cost=30.0):
+        self.name = name
+        self.deliver = deliver
+        self.limiters = build_limiters(per_minute, per_day)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.health = ProviderHealth()
+        self.failure_cost = failure_cost
+
+    def delay(self, now):
+        return max((limiter.delay(now) for limiter in self.limiters), default=0.0)
+
+    def status(self):
+        return {
+            'name': self.name,
+            'state': self.breaker.state,
+            'latency': self.health.latency,
+            'error_rate': round(self.health.error_rate, 3),
+        }
+
+
+class ProviderRegistry:
+    """
+    توجيه الرسائل بين عدة مزودين مع قواطع دائرة وحدود معدل لكل مزود
+
+    :param providers: قائمة Provider بترتيب الأفضلية عند التساوي
+    :param max_delay: أقصى انتظار لإذن الإرسال لدى أي مزود؛ إن زاد تفشل الرسالة بـ RateLimitExceeded
+    :param probe_interval: ثوانٍ بعدها يُعد قياس المزود قديماً فيأخذ رسالة تجدده، حتى لا يبقى
+                           مزود بطيء سابقاً مستبعداً بعد تحسنه
+    """
+
+    def __init__(self, providers, max_delay=60.0, probe_interval=30.0):
+        if not providers:
+            raise ValueError("يجب تحديد مزود بريد واحد على الأقل")
+        self.providers = list(providers)
+        self.max_delay = max_delay
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+
+    def status(self):
+        with self._lock:
+            return [provider.status() for provider in self.providers]
+
+    def _choose(self, now, tried):
+        """
+        :return: (provider, 0) جاهز للإرسال وقد حُجز إذنه، أو (None, wait) لأقصر انتظار
+        """
+        # المزود الذي لم يُجرب أو قدم قياسه تكلفته صفر، فيأخذ الرسالة التالية
+        candidates = [
+            (0.0 if now - provider.health.updated >= self.probe_interval else provider.health.cost(provider.failure_cost),
+             index, provider)
+            for index, provider in enumerate(self.providers)
+            if provider not in tried and provider.breaker.available(now)
+        ]
+        if not candidates:
+            return None, None
+
+        waits = []
+        for _, _, provider in sorted(candidates, key=lambda candidate: candidate[:2]):
+            wait = provider.delay(now)
+            if not wait:
+                # رسالة تجريبية واحدة للقياس القديم، لا كل ما يصل قبل عودة نتيجتها
+                provider.health.updated = max(provider.health.updated, now)
+                provider.breaker.acquire(now)
+                for limiter in provider.limiters:
+                    limiter.take(now)
+                return provider, 0.0
+            waits.append(wait)
+        return None, min(waits)
+
+    def send(self, recipient, *args):
+        """
+        إرسال رسالة عبر أفضل مزود متاح، والانتقال إلى التالي إن تعطل
+
+        :return: نتيجة deliver لدى المزود الذي أرسل
+        :raises: آخر خطأ مزود إن تعطلوا جميعاً، أو خطأ الرسالة نفسها دون انتقال،
+                 أو RateLimitExceeded، أو NoProviderAvailable
+        """
+        tried = set()
+        last_error = None
+        while True:
+            with self._lock:
+                provider, wait = self._choose(time.monotonic(), tried)
+            if provider is None:
+                if wait is None:
+                    if last_error is not None:
+                        raise last_error
+                    raise NoProviderAvailable("كل مزودي البريد متوقفون مؤقتاً بعد إخفاقات متتالية")
+                if wait > self.max_delay:
+                    raise RateLimitExceeded(wait)
+                time.sleep(wait)
+                continue
+
+            started = time.monotonic()
+            try:
+                result = provider.deliver(recipient, *args)
+            except Exception as e:
+                if not is_provider_failure(e):
+                    # المزود استجاب ورفض الرسالة نفسها، فهو سليم
+                    self._record(provider, time.monotonic() - started)
+                    raise
+                self._record(provider, failed=True)
+                logger.warning(f'تعذر الإرسال عبر {provider.name}: {e}')
+                tried.add(provider)
+                last_error = e
+                continue
+
+            self._record(provider, time.monotonic() - started)
+            return result
+
+    def _record(self, provider, latency=None, failed=False):
+        with self._lock:
+            provider.health.record(latency, failed)
+            if not failed:
+                provider.breaker.record_success()
+                return
+            was_open = provider.breaker.state == CircuitBreaker.OPEN
+            provider.breaker.record_failure(time.monotonic())
+            if not was_open and provider.breaker.state == CircuitBreaker.OPEN:
+                logger.warning(f'استبعاد {provider.name} مؤقتاً لمدة {provider.breaker.reset_timeout:.0f} ثانية')
@@ -0,0 +1,221 @@
+"""
+اختبار ضغط لقاعدة البيانات
+
+    reads       قراءات متوازية من عدة خيوط أثناء وجود كاتب مستمر
+    deductions  استقطاعات متزامنة من عدة خيوط على عدد قليل من الموظفين، مع التحقق من أن
+                الرصيد لم ينزل تحت الصفر وأن كل استقطاع مقبول ظهر في الرصيد والسجل
+
+الاستخدام:
+    python stress.py --employees 20000 --seconds 3 --threads 1,2,4,8
+    python stress.py --scenario deductions --hot 5 --balance 100000 --seconds 3 --threads 2,8,16
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from crypto import generate_key
+from employees import load_app
+
+
+def has_data(db_path):
+    """هل المسار قاعدة بيانات موجودة غير فارغة (أو لها سجل WAL غير فارغ)؟"""
+    return any(os.path.exists(path) and os.path.getsize(path) > 0 for path in (db_path, f"{db_path}-wal"))
+
+
+def seed_employees(db, count):
+    created_at = str(datetime.now())
+    db.executemany(
+        '''INSERT OR IGNORE INTO employees
+        (emp_id, name, position, salary, bank_account, current_balance, created_by, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        ((f"E{i:07d}", f"موظف {i}", 'staff', 5000.0, '-', 5000.0, 'stress', created_at) for i in range(count))
+    )
+
+
+def reads_under_writes(app, db_path, readers, seconds, employees):
+    """
+    تشغيل كاتب واحد وعدد من القراء لمدة محددة
+
+    :return: قاموس بعدد القراءات والكتابات في الثانية
+    """
+    db = app.DatabaseManager(db_path)
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0}
+    counts_lock = threading.Lock()
+
+    def writer():
+        writes = 0
+        while not stop.is_set():
+            emp_id = f"E{random.randrange(employees):07d}"
+            with db.transaction():
+                db.execute_query(
+                    "UPDATE employees SET current_balance = current_balance - 1, deductions = deductions + 1 WHERE emp_id = ?",
+                    (emp_id,)
+                )
+                db.execute_query(
+                    "INSERT INTO deductions (emp_id, amount, reason, created_by, created_at) VALUES (?, 1, 'stress', 'stress', ?)",
+                    (emp_id, str(datetime.now()))
+                )
+            writes += 1
+        with counts_lock:
+            counts['writes'] += writes
+
+    def reader():
+        reads = 0
+        while not stop.is_set():
+            emp_id = f"E{random.randrange(employees):07d}"
+            db.execute_query("SELECT name, current_balance FROM employees WHERE emp_id = ?", (emp_id,), fetchone=True)
+            next(app.iter_history(db, app.DEDUCTION_HISTORY_QUERY, emp_id), None)
+            reads += 1
+        with counts_lock:
+            counts['reads'] += reads
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    db.close()
+
+    return {
+        'readers': readers,
+        'reads_per_sec': round(counts['reads'] / seconds, 1),
+        'writes_per_sec': round(counts['writes'] / seconds, 1),
+    }
+
+
+def concurrent_deductions(app, db_path, workers, seconds, hot, balance=5000.0):
+    """
+    استقطاعات متزامنة من عدة خيوط على أول hot موظفين حتى ينفد رصيدهم أو ينتهي الوقت
+
+    كل خيط يفتح DatabaseManager خاصاً به (اتصال كتابة مستقل كما في عمليات منفصلة) ويستقطع
+    مبالغ عشوائية أكبر أحياناً من الرصيد المتبقي. في النهاية يُقارن رصيد كل موظف بمجموع
+    الاستقطاعات التي أكدها المنفذون وبمجموع سجل الاستقطاعات.
+
+    :return: قاموس بعدد الاستقطاعات المقبولة والمرفوضة في الثانية ونتيجة التحقق
+    """
+    from outbox import Outbox
+    from sessions import Session
+
+    emp_ids = [f"E{i:07d}" for i in range(hot)]
+    setup = app.DatabaseManager(db_path)
+    with setup.transaction():
+        setup.executemany(
+            "UPDATE employees SET current_balance = ?, deductions = 0 WHERE emp_id = ?",
+            [(balance, emp_id) for emp_id in emp_ids]
+        )
+        setup.executemany("DELETE FROM deductions WHERE emp_id = ?", [(emp_id,) for emp_id in emp_ids])
+
+    stop = threading.Event()
+    accepted = {emp_id: 0.0 for emp_id in emp_ids}
+    counts = {'accepted': 0, 'rejected': 0}
+    counts_lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        db = app.DatabaseManager(db_path)
+        auth = app.AuthenticationSystem(db, Outbox(db))
+        emp_manager = app.EmployeeManager(db, auth, auth.notifier)
+        # جلسة مباشرة بدل تسجيل الدخول حتى لا تدخل تجزئة كلمة المرور في القياس
+        now = time.time()
+        session = Session('stress', 'stress', 'finance_manager', now, now + 3600)
+        mine = {emp_id: 0.0 for emp_id in emp_ids}
+        ok = rejected = 0
+        while not stop.is_set():
+            emp_id = rng.choice(emp_ids)
+            amount = rng.randint(1, 50)
+            if emp_manager.deduct_from_salary(emp_id, amount, 'stress', session):
+                mine[emp_id] += amount
+                ok += 1
+            else:
+                rejected += 1
+        db.close()
+        with counts_lock:
+            for emp_id, amount in mine.items():
+                accepted[emp_id] += amount
+            counts['accepted'] += ok
+            counts['rejected'] += rejected
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(workers)]
+    # رسائل الاستقطاع المطبوعة لا تعني الاختبار
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, redirect_stdout(devnull):
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    violations = []
+    for emp_id, current_balance, deductions, logged in setup.execute_query(
+        f"""SELECT e.emp_id, e.current_balance, e.deductions,
+               (SELECT COALESCE(SUM(amount), 0) FROM deductions d WHERE d.emp_id = e.emp_id)
+        FROM employees e WHERE e.emp_id IN ({','.join('?' * hot)})""",
+        emp_ids, fetchall=True
+    ):
+        expected = balance - accepted[emp_id]
+        if current_balance < 0 or current_balance != expected or deductions != accepted[emp_id] or logged != accepted[emp_id]:
+            violations.append({
+                'emp_id': emp_id, 'balance': current_balance, 'expected': expected,
+                'deductions': deductions, 'logged': logged,
+            })
+    setup.close()
+
+    return {
+        'workers': workers,
+        'accepted_per_sec': round(counts['accepted'] / seconds, 1),
+        'rejected_per_sec': round(counts['rejected'] / seconds, 1),
+        'violations': violations,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='اختبار ضغط القراءة والكتابة المتوازية')
+    parser.add_argument('--scenario', choices=('reads', 'deductions'), default='reads')
+    parser.add_argument('--employees', type=int, default=20000)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--threads', default='1,2,4,8', help='أعداد الخيوط مفصولة بفواصل')
+    parser.add_argument('--hot', type=int, default=5, help='عدد الموظفين المستهدفين في سيناريو الاستقطاعات')
+    parser.add_argument('--balance', type=float, default=5000.0, help='الرصيد الابتدائي لكل موظف مستهدف')
+    parser.add_argument('--db', help='مسار قاعدة البيانات (افتراضياً ملف مؤقت)')
+    parser.add_argument('--force', action='store_true', help='السماح بالكتابة في قاعدة بيانات --db الموجودة')
+    args = parser.parse_args()
+
+    # الاختبار يضيف موظفين اصطناعيين ويحذف استقطاعات E0000000...، فلا يعمل على قاعدة حقيقية خطأً
+    if args.db and has_data(args.db) and not args.force:
+        sys.exit(f"قاعدة البيانات {args.db} موجودة وفيها بيانات سيعدلها الاختبار؛ أضف --force للمتابعة")
+
+    # مفتاح مؤقت للبيانات الاصطناعية إن لم يُحدد مفتاح (لا يُنشأ مفتاح تلقائياً)
+    if not os.getenv('BANK_ACCOUNT_KEY_FILE'):
+        os.environ.setdefault('BANK_ACCOUNT_KEY', generate_key())
+    app = load_app()
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or os.path.join(tmp, 'stress.db')
+        db = app.DatabaseManager(db_path)
+        seed_employees(db, max(args.employees, args.hot))
+        db.close()
+
+        for threads in (int(n) for n in args.threads.split(',')):
+            if args.scenario == 'reads':
+                result = reads_under_writes(app, db_path, threads, args.seconds, args.employees)
+            else:
+                result = concurrent_deductions(app, db_path, threads, args.seconds, args.hot, args.balance)
+                failed = failed or bool(result['violations'])
+            print(json.dumps(result, ensure_ascii=False))
+
+    if failed:
+        sys.exit("فشل التحقق: رصيد سالب أو استقطاعات مفقودة")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""الاستيراد بالجملة يرفض الرواتب غير المنتهية صفاً صفاً بدل إفشال الدفعة كلها"""
+import csv
+
+import pytest
+
+pytest.importorskip('cryptography')
+
+from crypto import generate_key
+from employees import load_app
+from importer import EmployeeImporter
+from outbox import Outbox
+
+
+@pytest.fixture
+def importer(tmp_path, monkeypatch):
+    monkeypatch.setenv('BANK_ACCOUNT_KEY', generate_key())
+    app = load_app()
+    db = app.DatabaseManager(str(tmp_path / 'payroll.db'))
+    notifier = Outbox(db)
+    auth = app.AuthenticationSystem(db, notifier)
+    emp_manager = app.EmployeeManager(db, auth, notifier)
+    session = auth.sessions.create('import_admin', 'admin')
+    yield EmployeeImporter(emp_manager), session, db
+    auth.audit.close()
+    db.close()
+
+
+def test_non_finite_salaries_go_to_the_rejects_file(tmp_path, importer):
+    employee_importer, session, db = importer
+    path = tmp_path / 'employees.csv'
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(('emp_id', 'name', 'position', 'salary', 'bank_account'))
+        writer.writerow(('E1', 'موظف 1', 'محاسب', '5000', 'SA0001'))
+        writer.writerow(('E2', 'موظف 2', 'محاسب', 'nan', 'SA0002'))
+        writer.writerow(('E3', 'موظف 3', 'محاسب', 'inf', 'SA0003'))
+        writer.writerow(('E4', 'موظف 4', 'محاسب', '-inf', 'SA0004'))
+        writer.writerow(('E5', 'موظف 5', 'محاسب', '4200.5', 'SA0005'))
+
+    summary = employee_importer.import_file(str(path), session=session)
+
+    assert summary['imported'] == 2
+    assert summary['rejected'] == 3
+    assert db.execute_query("SELECT emp_id, salary FROM employees ORDER BY emp_id", fetchall=True) == [
+        ('E1', 5000.0), ('E5', 4200.5)
+    ]
+    with open(summary['rejects_path'], newline='', encoding='utf-8') as f:
+        rejected = [(row['line'], row['error']) for row in csv.DictReader(f)]
+    assert rejected == [('3', 'راتب غير صحيح: nan'), ('4', 'راتب غير صحيح: inf'), ('5', 'راتب غير صحيح: -inf')]
@@ -0,0 +1,145 @@
+"""تفريغ صندوق الصادر عبر مرسل البريد الفعلي يلتزم بحدود معدل ملف تعريف المزود"""
+import time
+
+import pytest
+
+pytest.importorskip('dotenv')
+
+import smtp_providers
+import البريد
+from employees import load_app
+from outbox import Outbox, OutboxWorkerPool
+
+
+class FakeSMTP:
+    """جلسة SMTP وهمية تسجل المستلمين بدل الإرسال"""
+
+    def __init__(self, delivered):
+        self.delivered = delivered
+
+    def send_message(self, msg):
+        self.delivered.append(msg['To'])
+
+    def noop(self):
+        return 250, b'OK'
+
+    def rset(self):
+        return 250, b'OK'
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Clock:
+    """ساعة حدود المزود مع إمكانية تقديمها بدل انتظار انتهاء النافذة فعلاً"""
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def monotonic(self):
+        return time.monotonic() + self.offset
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+@pytest.fixture
+def mail(tmp_path, monkeypatch):
+    """
+    :return: دالة تكتب ملف تعريف بالحدود المعطاة وتعيد قائمة المستلمين الذين وصلتهم رسائل
+    """
+    delivered = []
+    monkeypatch.setattr(البريد.SMTPProvider, '_connect', lambda self: FakeSMTP(delivered))
+    # الرسالة التي تحتاج انتظاراً أطول من ثانية تُؤجل بدل حجز العامل
+    monkeypatch.setenv('SMTP_MAX_RATE_WAIT', '1')
+
+    def configure(**limits):
+        profile = tmp_path / 'Limited.ini'
+        profile.write_text(
+            'SMTP_SERVER=smtp.example.test\n'
+            'EMAIL_USERNAME=payroll@example.test\n'
+            'EMAIL_PASSWORD=secret\n'
+            + ''.join(f'{name}={value}\n' for name, value in limits.items()),
+            encoding='utf-8'
+        )
+        monkeypatch.setenv('SMTP_PROFILE', str(profile))
+        return delivered
+
+    return configure
+
+
+@pytest.fixture
+def app_db(tmp_path):
+    app = load_app()
+    db = app.DatabaseManager(str(tmp_path / 'payroll.db'))
+    yield app, db
+    db.close()
+
+
+def queue_messages(db, count):
+    Outbox(db).send_many([(f"employee{i}@example.test", "تم دفع راتبك", "تم الدفع") for i in range(count)])
+
+
+def statuses(db):
+    return db.execute_query(
+        "SELECT status, COUNT(*), MAX(attempts) FROM outbox GROUP BY status ORDER BY status", fetchall=True
+    )
+
+
+def test_drain_sends_only_up_to_the_per_minute_cap(app_db, mail):
+    app, db = app_db
+    delivered = mail(SMTP_RATE_PER_MINUTE=5)
+    queue_messages(db, 8)
+
+    sender = app.mail_sender()
+    try:
+        processed = OutboxWorkerPool(db, sender).drain()
+    finally:
+        sender.close()
+
+    assert processed == 8
+    assert len(delivered) == 5
+    # الرسائل التي تجاوزت الحد تعود لاحقاً ولا تُحتسب محاولة
+    assert statuses(db) == [('pending', 3, 0), ('sent', 5, 1)]
+    assert db.execute_query(
+        "SELECT COUNT(*) FROM outbox WHERE status = 'pending' AND available_at > strftime('%s', 'now')",
+        fetchone=True
+    )[0] == 3
+
+
+def test_daily_quota_defers_messages_until_the_window_resets(app_db, mail, monkeypatch):
+    app, db = app_db
+    delivered = mail(SMTP_RATE_PER_DAY=2)
+    clock = Clock()
+    monkeypatch.setattr(smtp_providers, 'time', clock)
+    queue_messages(db, 5)
+
+    sender = app.mail_sender()
+    try:
+        workers = OutboxWorkerPool(db, sender, max_attempts=3)
+        workers.drain()
+        assert len(delivered) == 2
+        # الرسائل المؤجلة تنتظر حتى تتسع النافذة اليومية تقريباً
+        assert db.execute_query(
+            "SELECT MIN(available_at) - strftime('%s', 'now') FROM outbox WHERE status = 'pending'", fetchone=True
+        )[0] > smtp_providers.DAY - 60
+
+        # مرات تفريغ أكثر من max_attempts والحد ما زال مستنفداً: لا تفشل الرسائل نهائياً
+        for _ in range(workers.max_attempts + 2):
+            db.execute_query("UPDATE outbox SET available_at = 0 WHERE status = 'pending'")
+            assert workers.drain() == 3
+        assert len(delivered) == 2
+        assert statuses(db) == [('pending', 3, 0), ('sent', 2, 1)]
+
+        # بعد انتهاء النافذة تُرسل الرسائل المؤجلة
+        clock.offset = smtp_providers.DAY + 1
+        db.execute_query("UPDATE outbox SET available_at = 0 WHERE status = 'pending'")
+        workers.drain()
+    finally:
+        sender.close()
+
+    assert len(delivered) == 4
+    assert statuses(db) == [('pending', 1, 0), ('sent', 4, 1)]
@@ -3,28 +3,242 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import ssl
 import os
+import queue
+import string
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import logging
 
+from smtp_providers import (NoProviderAvailable, Provider, ProviderRegistry, RateLimitExceeded,
+                            SendScheduler, load_profile, profile_name)
+
 # تحميل المتغيرات البيئية من ملف .env
 load_dotenv()
 
-class NotificationSystem:
-    def __init__(self):
-        # إعدادات خادم البريد (يتم قراءتها من ملف .env أو المتغيرات البيئية)
-        self.smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-        self.smtp_port = int(os.getenv('SMTP_PORT', 587))
-        self.sender_email = os.getenv('EMAIL_USERNAME', 'your.email@example.com')
-        self.sender_password = os.getenv('EMAIL_PASSWORD', 'your-email-password')
-        self.use_ssl = os.getenv('USE_SSL', 'False').lower() == 'true'
-        self.use_tls = os.getenv('USE_TLS', 'True').lower() == 'true'
+
+class _PooledSession:
+    def __init__(self, server):
+        self.server = server
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool:
+    """
+    مجموعة من جلسات SMTP المفتوحة والمصادق عليها يعاد استخدامها بين الرسائل
+
+    :param connect: دالة تنشئ جلسة جديدة جاهزة للإرسال (بعد TLS وتسجيل الدخول)
+    :param max_size: أقصى عدد من الجلسات المستخدمة في الوقت نفسه
+    :param max_messages: عدد الرسائل التي تُرسل عبر الجلسة قبل إغلاقها وفتح غيرها
+    :param health_check_after: ثواني الخمول التي بعدها تُفحص الجلسة بأمر NOOP قبل استخدامها
+    """
+
+    def __init__(self, connect, max_size=4, max_messages=100, health_check_after=30.0):
+        self._connect = connect
+        self.max_messages = max_messages
+        self.health_check_after = health_check_after
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    @contextmanager
+    def session(self):
+        """
+        استعارة جلسة من المجموعة طوال كتلة with
+
+        الجلسة التي تنقطع أو تتجاوز الحد الأقصى للرسائل تُغلق ولا تعود للمجموعة.
+        """
+        with self._slots:
+            entry = self._checkout()
+            try:
+                yield entry.server
+            except smtplib.SMTPException as e:
+                # أخطاء الرسالة نفسها (مثل رفض المستلم) لا تعني أن الجلسة تالفة
+                if isinstance(e, smtplib.SMTPServerDisconnected) or not self._reset(entry.server):
+                    self._discard(entry)
+                else:
+                    self._checkin(entry)
+                raise
+            except BaseException:
+                self._discard(entry)
+                raise
+            else:
+                entry.messages_sent += 1
+                self._checkin(entry)
+
+    def close(self):
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(entry)
+
+    def _checkout(self):
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                return _PooledSession(self._connect())
+
+            idle_for = time.monotonic() - entry.last_used
+            if idle_for < self.health_check_after or self._is_alive(entry.server):
+                return entry
+            self._discard(entry)
+
+    def _checkin(self, entry):
+        if entry.messages_sent >= self.max_messages:
+            self._discard(entry)
+            return
+        entry.last_used = time.monotonic()
+        self._idle.put(entry)
+
+    def _is_alive(self, server):
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _reset(self, server):
+        try:
+            return server.rset()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _discard(self, entry):
+        try:
+            entry.server.quit()
+        except (smtplib.SMTPException, OSError):
+            entry.server.close()
+
+
+class _Template:
+    def __init__(self, text, html, mtimes):
+        self.text = text
+        self.html = html
+        self.mtimes = mtimes
+        self.checked_at = time.monotonic()
+        # تحليل القالب مرة واحدة عند التحميل: أخطاء الصياغة تظهر هنا لا عند كل رسالة،
+        # وتُحفظ أسماء المتغيرات (بدون .attr أو [index]) للتحقق منها قبل الدمج
+        self.fields = {
+            field.partition('.')[0].partition('[')[0]
+            for source in (text, html) if source
+            for _, field, _, _ in string.Formatter().parse(source) if field
+        }
+
+    def render(self, template_vars):
+        missing = self.fields.difference(template_vars)
+        if missing:
+            raise ValueError(f"متغيرات القالب ناقصة: {', '.join(sorted(missing))}")
+        text_body = self.text.format_map(template_vars)
+        html_body = self.html.format_map(template_vars) if self.html else None
+        return text_body, html_body
+
+
+class TemplateRegistry:
+    """
+    ذاكرة مؤقتة لقوالب البريد بحد أقصى (الأقدم استخداماً يُحذف أولاً)
+
+    :param directory: مجلد القوالب (ملف name.txt إلزامي و name.html اختياري)
+    :param max_size: أقصى عدد من القوالب المحفوظة في الذاكرة
+    :param check_interval: الثواني بين كل فحص لتاريخ تعديل الملفات لإعادة تحميلها
+    """
+
+    def __init__(self, directory='templates', max_size=64, check_interval=2.0):
+        self.directory = directory
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, template_name):
+        with self._lock:
+            template = self._cache.get(template_name)
+            if template is not None:
+                self._cache.move_to_end(template_name)
         
-        # إعداد نظام التسجيل (logging)
-        logging.basicConfig(level=logging.INFO)
-        self.logger = logging.getLogger(__name__)
+        now = time.monotonic()
+        if template is not None and now - template.checked_at < self.check_interval:
+            return template
+        
+        mtimes = self._mtimes(template_name)
+        if template is not None and template.mtimes == mtimes:
+            template.checked_at = now
+            return template
+        
+        template = self._load(template_name, mtimes)
+        with self._lock:
+            self._cache[template_name] = template
+            self._cache.move_to_end(template_name)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return template
+
+    def invalidate(self, template_name=None):
+        with self._lock:
+            if template_name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(template_name, None)
+
+    def _path(self, template_name, extension):
+        return os.path.join(self.directory, f'{template_name}.{extension}')
+
+    def _mtimes(self, template_name):
+        text_mtime = os.stat(self._path(template_name, 'txt')).st_mtime_ns
+        try:
+            html_mtime = os.stat(self._path(template_name, 'html')).st_mtime_ns
+        except FileNotFoundError:
+            html_mtime = None
+        return text_mtime, html_mtime
+
+    def _load(self, template_name, mtimes):
+        with open(self._path(template_name, 'txt'), 'r', encoding='utf-8') as f:
+            text = f.read()
+        
+        html = None
+        if mtimes[1] is not None:
+            with open(self._path(template_name, 'html'), 'r', encoding='utf-8') as f:
+                html = f.read()
+        return _Template(text, html, mtimes)
+
+
+class SMTPProvider:
+    """
+    خادم بريد واحد بإعداداته وجلساته
+
+    :param name: اسم المزود في السجلات وحالة التوجيه
+    :param settings: قيم ملف تعريف المزود؛ ما لا يحدده يُقرأ من ملف .env أو المتغيرات البيئية
+    """
+    
+    def __init__(self, name, settings=None):
+        self.name = name
+        self.settings = settings or {}
+        setting = self._setting
         
-        # التحقق من صحة الإعدادات
+        self.smtp_server = setting('SMTP_SERVER', 'smtp.gmail.com')
+        self.smtp_port = int(setting('SMTP_PORT', 587))
+        self.sender_email = setting('EMAIL_USERNAME', 'your.email@example.com')
+        self.sender_password = setting('EMAIL_PASSWORD', 'your-email-password')
+        self.use_ssl = setting('USE_SSL', 'False').lower() == 'true'
+        self.use_tls = setting('USE_TLS', 'True').lower() == 'true'
+        self.timeout = float(setting('SMTP_TIMEOUT', 30))
         self._validate_settings()
+        
+        # سياق TLS يُنشأ مرة واحدة وتشترك فيه كل الجلسات
+        self._ssl_context = ssl.create_default_context()
+        self.pool_size = int(setting('SMTP_POOL_SIZE', 4))
+        self.pool = SMTPConnectionPool(
+            self._connect,
+            max_size=self.pool_size,
+            max_messages=int(setting('SMTP_MAX_MESSAGES_PER_SESSION', 100)),
+            health_check_after=float(setting('SMTP_HEALTH_CHECK_AFTER', 30))
+        )
+    
+    def _setting(self, name, default=None):
+        return self.settings.get(name, os.getenv(name, default))
     
     def _validate_settings(self):
         """التحقق من صحة إعدادات البريد الإلكتروني"""
@@ -36,9 +250,110 @@ class NotificationSystem:
         
         for name, value in required_settings.items():
             if not value:
-                self.logger.error(f'إعدادات البريد الإلكتروني غير مكتملة: {name} غير معرّف')
+                logging.getLogger(__name__).error(f'إعدادات البريد الإلكتروني غير مكتملة ({self.name}): {name} غير معرّف')
                 raise ValueError(f'الرجاء تعيين {name} في ملف .env أو المتغيرات البيئية')
     
+    def routing(self):
+        """مزود التوجيه بحدود هذا الخادم وقاطعه"""
+        setting = self._setting
+        return Provider(
+            self.name, self.deliver,
+            per_minute=int(setting('SMTP_RATE_PER_MINUTE', 0)) or None,
+            per_day=int(setting('SMTP_RATE_PER_DAY', 0)) or None,
+            failure_threshold=int(setting('SMTP_BREAKER_FAILURES', 3)),
+            reset_timeout=float(setting('SMTP_BREAKER_RESET', 60)),
+            failure_cost=self.timeout
+        )
+    
+    def _connect(self):
+        """فتح جلسة جديدة مع خادم البريد وتسجيل الدخول"""
+        if self.use_ssl:
+            # استخدام اتصال SSL (على المنفذ 465 عادة)
+            server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, context=self._ssl_context, timeout=self.timeout)
+        else:
+            # استخدام اتصال عادي مع STARTTLS (على المنفذ 587 عادة)
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+            if self.use_tls:
+                server.starttls(context=self._ssl_context)
+        
+        try:
+            server.login(self.sender_email, self.sender_password)
+        except BaseException:
+            server.close()
+            raise
+        return server
+    
+    def deliver(self, recipient, msg):
+        """إرسال رسالة عبر جلسة من المجموعة، مع إعادة الاتصال مرة واحدة إن كانت الجلسة قد انقطعت"""
+        # المرسل هو حساب هذا المزود، فالرسالة التي تنتقل بين المزودين يتغير مرسلها
+        del msg['From']
+        msg['From'] = self.sender_email
+        try:
+            with self.pool.session() as server:
+                server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            with self.pool.session() as server:
+                server.send_message(msg)
+    
+    def close(self):
+        self.pool.close()
+
+
+class NotificationSystem:
+    """
+    :param profile: ملف تعريف مزود (مثل Gmail.ini) أو قائمة ملفات بترتيب الأفضلية، افتراضياً من
+                    SMTP_PROFILE (عدة ملفات يفصلها os.pathsep). قيم كل ملف تتقدم على المتغيرات
+                    البيئية، وما لا يحدده (كاسم المستخدم وكلمة المرور) يُقرأ من البيئة. بدون
+                    ملف تعريف يُستخدم خادم واحد من المتغيرات البيئية
+    """
+    
+    def __init__(self, profile=None):
+        if profile is None:
+            profile = [path for path in os.getenv('SMTP_PROFILE', '').split(os.pathsep) if path]
+        elif isinstance(profile, str):
+            profile = [profile]
+        
+        # إعداد نظام التسجيل (logging)
+        logging.basicConfig(level=logging.INFO)
+        self.logger = logging.getLogger(__name__)
+        
+        # خادم لكل ملف تعريف (يتم قراءة ما لا يحدده من ملف .env أو المتغيرات البيئية)
+        if profile:
+            self.providers = [SMTPProvider(profile_name(path), load_profile(path)) for path in profile]
+        else:
+            self.providers = [SMTPProvider('default')]
+        
+        # كل رسالة تذهب إلى المزود الأسرع والأقل إخفاقاً مما تسمح حدوده وقاطعه بالإرسال عبره الآن،
+        # وإن تعطل أثناء الإرسال تنتقل الرسالة إلى التالي
+        self.registry = ProviderRegistry(
+            [provider.routing() for provider in self.providers],
+            max_delay=float(os.getenv('SMTP_MAX_RATE_WAIT', 60)),
+            probe_interval=float(os.getenv('SMTP_PROBE_INTERVAL', 30))
+        )
+        
+        # طابور الإرسال يتناوب بين المستلمين ويرسل بعدد جلسات المزودين مجتمعة
+        self.scheduler = SendScheduler(
+            self.registry.send,
+            workers=sum(provider.pool_size for provider in self.providers),
+            max_queue=int(os.getenv('SMTP_QUEUE_SIZE', 1000))
+        )
+        
+        # قوالب البريد تُقرأ من القرص مرة واحدة وتُعاد قراءتها فقط عند تعديلها
+        self.templates = TemplateRegistry(
+            os.getenv('TEMPLATE_DIR', 'templates'),
+            max_size=int(os.getenv('TEMPLATE_CACHE_SIZE', 64))
+        )
+    
+    def close(self):
+        """إرسال ما بقي في الطابور ثم إغلاق جلسات البريد المفتوحة"""
+        self.scheduler.close()
+        for provider in self.providers:
+            provider.close()
+    
+    def status(self):
+        """حالة كل مزود: القاطع وزمن الإرسال الأخير ونسبة الإخفاق"""
+        return self.registry.status()
+    
     def send_email(self, recipient, subject, body, html_body=None):
         """
         إرسال بريد إلكتروني
@@ -49,39 +364,55 @@ class NotificationSystem:
         :param html_body: نص البريد (نسخة HTML) - اختياري
         :return: True إذا تم الإرسال بنجاح، False إذا فشل
         """
-        try:
-            # إنشاء رسالة البريد
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = self.sender_email
-            msg['To'] = recipient
-            
-            # إضافة محتوى البريد (نصي وHTML إذا متوفر)
-            part1 = MIMEText(body, 'plain')
-            msg.attach(part1)
-            
-            if html_body:
-                part2 = MIMEText(html_body, 'html')
-                msg.attach(part2)
-            
-            # إنشاء اتصال آمن مع خادم البريد
-            context = ssl.create_default_context()
-            
-            if self.use_ssl:
-                # استخدام اتصال SSL (على المنفذ 465 عادة)
-                with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, context=context) as server:
-                    server.login(self.sender_email, self.sender_password)
-                    server.send_message(msg)
+        return self._wait_sent(recipient, self._submit(recipient, subject, body, html_body))
+
+    def send_many(self, messages):
+        """
+        إرسال مجموعة رسائل معاً (واجهة مرسل صندوق الصادر)
+
+        الرسائل كلها تُضاف إلى طابور الإرسال ثم تُنتظر نتائجها، فتمر بحدود كل مزود وتوجيهه
+        كما تمر رسائل send_email.
+
+        :param messages: قائمة (recipient, subject, body)
+        :return: قائمة بنتيجة كل رسالة بترتيبها: True إن أُرسلت، أو ثواني الانتظار حتى تسمح
+                 حدود المزود بإرسالها، أو False إن فشلت
+        """
+        futures = [(recipient, self._submit(recipient, subject, body)) for recipient, subject, body in messages]
+        results = []
+        for recipient, future in futures:
+            error = future.exception()
+            if isinstance(error, RateLimitExceeded):
+                self.logger.warning(str(error))
+                results.append(error.wait)
             else:
-                # استخدام اتصال عادي مع STARTTLS (على المنفذ 587 عادة)
-                with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                    if self.use_tls:
-                        server.starttls(context=context)
-                    server.login(self.sender_email, self.sender_password)
-                    server.send_message(msg)
-            
+                results.append(self._wait_sent(recipient, future))
+        return results
+
+    def _submit(self, recipient, subject, body, html_body=None):
+        """إنشاء رسالة البريد وإضافتها إلى طابور الإرسال (ينتظر إن كان الطابور ممتلئاً)"""
+        # المرسل يُحدد عند الإرسال بحسب المزود الذي يحمل الرسالة
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = subject
+        msg['To'] = recipient
+        
+        # إضافة محتوى البريد (نصي وHTML إذا متوفر)
+        part1 = MIMEText(body, 'plain')
+        msg.attach(part1)
+        
+        if html_body:
+            part2 = MIMEText(html_body, 'html')
+            msg.attach(part2)
+        
+        return self.scheduler.submit(recipient, msg)
+    
+    def _wait_sent(self, recipient, future):
+        """انتظار نتيجة رسالة في الطابور: True إن أُرسلت، False مع تسجيل السبب إن فشلت"""
+        try:
+            future.result()
             self.logger.info(f'تم إرسال البريد إلى {recipient} بنجاح')
             return True
+        except (RateLimitExceeded, NoProviderAvailable) as e:
+            self.logger.error(str(e))
         except smtplib.SMTPAuthenticationError:
             self.logger.error('فشل المصادقة مع خادم البريد. الرجاء التحقق من اسم المستخدم وكلمة المرور.')
         except smtplib.SMTPException as e:
@@ -90,8 +421,8 @@ class NotificationSystem:
             self.logger.error(f'حدث خطأ غير متوقع: {str(e)}')
         
         return False
-
-    def send_template_email(self, recipient, subject, template_name, template_vars={}):
+    
+    def send_template_email(self, recipient, subject, template_name, template_vars=None):
         """
         إرسال بريد إلكتروني باستخدام قالب
         
@@ -102,21 +433,8 @@ class NotificationSystem:
         :return: True إذا تم الإرسال بنجاح، False إذا فشل
         """
         try:
-            # قراءة القالب النصي
-            with open(f'templates/{template_name}.txt', 'r', encoding='utf-8') as f:
-                text_template = f.read()
-            
-            # قراءة القالب HTML إذا كان موجوداً
-            html_template = None
-            try:
-                with open(f'templates/{template_name}.html', 'r', encoding='utf-8') as f:
-                    html_template = f.read()
-            except FileNotFoundError:
-                pass
-            
-            # استبدال المتغيرات في القوالب
-            text_body = text_template.format(**template_vars)
-            html_body = html_template.format(**template_vars) if html_template else None
+            # استبدال المتغيرات في القالب المحفوظ
+            text_body, html_body = self.templates.get(template_name).render(template_vars or {})
             
             return self.send_email(recipient, subject, text_body, html_body)
         except FileNotFoundError:
@@ -124,4 +442,45 @@ class NotificationSystem:
             return False
         except Exception as e:
             self.logger.error(f'حدث خطأ في معالجة القالب: {str(e)}')
-            return False
\ No newline at end of file
+            return False
+
+    def send_template_bulk(self, template_name, rows, subject=None):
+        """
+        دمج قالب مع قائمة مستلمين وإرسال رسالة لكل منهم عبر جلسات البريد المشتركة
+        
+        :param template_name: اسم ملف القالب (بدون امتداد)
+        :param rows: قواميس متغيرات القالب، كل منها يحتوي recipient وقد يحتوي subject
+        :param subject: الموضوع الافتراضي للصفوف التي لا تحدد موضوعاً
+        :return: (عدد الرسائل المرسلة، عدد الرسائل الفاشلة)
+        """
+        try:
+            template = self.templates.get(template_name)
+        except FileNotFoundError:
+            self.logger.error(f'ملف القالب {template_name} غير موجود')
+            return 0, 0
+        
+        # الرسائل تُضاف إلى الطابور دون انتظار كل منها، فتُرسل بأقصى معدل يسمح به المزود؛
+        # وإن امتلأ الطابور يتوقف الدمج حتى يتسع، فلا تتراكم القائمة كلها في الذاكرة
+        sent = failed = 0
+        in_flight = deque()
+        for row in rows:
+            try:
+                text_body, html_body = template.render(row)
+            except Exception as e:
+                self.logger.error(f'حدث خطأ في معالجة القالب للمستلم {row.get("recipient")}: {str(e)}')
+                failed += 1
+                continue
+            
+            in_flight.append((row['recipient'], self._submit(row['recipient'], row.get('subject', subject), text_body, html_body)))
+            while len(in_flight) > self.scheduler.max_queue or (in_flight and in_flight[0][1].done()):
+                if self._wait_sent(*in_flight.popleft()):
+                    sent += 1
+                else:
+                    failed += 1
+        
+        for recipient, future in in_flight:
+            if self._wait_sent(recipient, future):
+                sent += 1
+            else:
+                failed += 1
+        return sent, failed
\ No newline at end of file